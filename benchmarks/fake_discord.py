@@ -0,0 +1,415 @@
+"""
+Локальная имитация REST API Discord и webhook-ов взаимодействий для бенчмарков.
+Хранит сообщения в памяти, отдает заголовки rate limit и отвечает 429 по
+упрощенной модели лимитов Discord. Служебные маршруты /_bench/* отдают и
+сбрасывают статистику запросов.
+
+Токен взаимодействия кодирует контекст: "bench-<channel_id>-<message_id>-<n>",
+чтобы ответ на взаимодействие знал канал и сообщение компонента.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+BOT_USER_ID = 100000000000000001
+APPLICATION_ID = 100000000000000002
+OWNER_ID = 100000000000000003
+DISCORD_EPOCH_MS = 1420070400000
+
+# (метод, регулярное выражение пути) -> (лимит, окно в секундах)
+ROUTE_LIMITS = [
+    (("PATCH", r"/channels/\d+/messages/\d+"), (5, 5.0)),
+    (("POST", r"/channels/\d+/messages"), (5, 5.0)),
+    (("DELETE", r"/channels/\d+/messages/\d+"), (5, 1.0)),
+    (("POST", r"/channels/\d+/messages/bulk-delete"), (1, 1.0)),
+    (("GET", r"/channels/\d+/messages"), (5, 5.0)),
+    (("POST", r"/users/@me/channels"), (10, 1.0)),
+    (("GET", r"/users/\d+"), (30, 1.0)),
+]
+GLOBAL_LIMIT = (50, 1.0)
+
+SNOWFLAKE = re.compile(r"\d{15,21}")
+TOKEN = re.compile(r"/(interactions|webhooks)/\{id\}/[^/]+")
+MAJOR = re.compile(r"^/(channels|guilds|webhooks)/(\d+)")
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def json_response(data, status=200, headers=None):
+    """JSON-ответ без charset: discord.py сравнивает Content-Type строго с application/json"""
+    return web.Response(
+        body=json.dumps(data).encode(), status=status,
+        headers={**(headers or {}), "Content-Type": "application/json"}
+    )
+
+
+def user_payload(user_id, bot=False):
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id % 100000}",
+        "global_name": None,
+        "discriminator": "0",
+        "avatar": None,
+        "bot": bot,
+        "public_flags": 0,
+    }
+
+
+class FakeDiscord:
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.ids = itertools.count()
+        self.messages = {}  # message_id -> payload
+        self.channel_messages = defaultdict(list)  # channel_id -> [message_id]
+        self.dm_channels = {}  # user_id -> channel_id
+        self.buckets = {}  # ключ bucket -> [начало окна, запросов]
+        self.originals = {}  # токен взаимодействия -> ID исходного ответа
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.requests = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+        self.acks = {}  # interaction_id -> время ответа на взаимодействие
+
+    def snowflake(self):
+        millis = int(time.time() * 1000) - DISCORD_EPOCH_MS
+        return (millis << 22) | (next(self.ids) & 0x3FFFFF)
+
+    def route_key(self, method, path):
+        path = SNOWFLAKE.sub("{id}", path)
+        return f"{method} " + TOKEN.sub(r"/\1/{id}/{token}", path)
+
+    # ===== RATE LIMIT =====
+
+    def check_limit(self, method, path):
+        """(None или секунд до сброса, глобальный ли лимит, заголовки rate limit)"""
+        now = time.monotonic()
+        limit = None
+        for (route_method, pattern), value in ROUTE_LIMITS:
+            if route_method == method and re.fullmatch(pattern, path):
+                limit = value
+                break
+        headers = {}
+        limits = [("global", GLOBAL_LIMIT)]
+        if limit is not None:
+            limits.append((self.bucket_key(method, path), limit))
+        for key, (count, window) in limits:
+            state = self.buckets.setdefault(key, [now, 0])
+            if now - state[0] >= window:
+                state[0], state[1] = now, 0
+            reset_after = window - (now - state[0])
+            if state[1] >= count:
+                return reset_after, key == "global", headers
+            state[1] += 1
+            if key != "global":
+                headers = {
+                    "X-RateLimit-Limit": str(count),
+                    "X-RateLimit-Remaining": str(count - state[1]),
+                    "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+                    "X-RateLimit-Bucket": key,
+                }
+        return None, False, headers
+
+    def bucket_key(self, method, path):
+        major = MAJOR.match(path)
+        return f"{self.route_key(method, path)} {major.group(2) if major else ''}"
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        path = request.path
+        if path.startswith("/_bench"):
+            return await handler(request)
+        path = re.sub(r"^/api/v\d+", "", path)
+        route = self.route_key(request.method, path)
+        self.requests[route] += 1
+
+        # Ответы на взаимодействия не ограничиваются лимитами бота
+        if "/interactions/" not in path and "/webhooks/" not in path:
+            retry_after, is_global, headers = self.check_limit(request.method, path)
+            if retry_after is not None:
+                self.rate_limited[route] += 1
+                # Без Via discord.py считает 429 баном Cloudflare и не повторяет запрос
+                headers = {"Retry-After": f"{retry_after:.3f}", "X-RateLimit-Remaining": "0",
+                           "X-RateLimit-Reset-After": f"{retry_after:.3f}", "Via": "1.1 google"}
+                if is_global:
+                    headers["X-RateLimit-Global"] = "true"
+                return json_response(
+                    {"message": "You are being rate limited.", "retry_after": retry_after,
+                     "global": is_global},
+                    status=429, headers=headers
+                )
+        else:
+            headers = {}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    # ===== СООБЩЕНИЯ =====
+
+    def create_message(self, channel_id, body, author_id=BOT_USER_ID, flags=0):
+        message_id = self.snowflake()
+        message = {
+            "id": str(message_id),
+            "channel_id": str(channel_id),
+            "author": user_payload(author_id, bot=author_id == BOT_USER_ID),
+            "content": body.get("content") or "",
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "attachments": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "timestamp": iso_now(),
+            "edited_timestamp": None,
+            "type": 0,
+            "flags": flags,
+        }
+        self.messages[message_id] = message
+        self.channel_messages[channel_id].append(message_id)
+        return message
+
+    def edit_message(self, message_id, body):
+        message = self.messages.get(message_id)
+        if message is None:
+            return None
+        for key in ("content", "embeds", "components"):
+            if key in body:
+                message[key] = body[key] if body[key] is not None else ([] if key != "content" else "")
+        message["edited_timestamp"] = iso_now()
+        return message
+
+    def delete_message(self, message_id):
+        message = self.messages.pop(message_id, None)
+        if message is None:
+            return False
+        self.channel_messages[int(message["channel_id"])].remove(message_id)
+        return True
+
+    async def read_body(self, request):
+        if request.content_type == "multipart/form-data":
+            form = await request.post()
+            return json.loads(form.get("payload_json", "{}"))
+        if request.can_read_body:
+            return await request.json()
+        return {}
+
+    # ===== МАРШРУТЫ =====
+
+    def routes(self):
+        api = "/api/v{version}"
+        return [
+            web.get(api + "/users/@me", self.get_me),
+            web.get(api + "/oauth2/applications/@me", self.get_application),
+            web.get(api + "/users/{user_id}", self.get_user),
+            web.post(api + "/users/@me/channels", self.create_dm),
+            web.get(api + "/channels/{channel_id}", self.get_channel),
+            web.post(api + "/channels/{channel_id}/messages", self.post_message),
+            web.get(api + "/channels/{channel_id}/messages", self.get_messages),
+            web.post(api + "/channels/{channel_id}/messages/bulk-delete", self.bulk_delete),
+            web.get(api + "/channels/{channel_id}/messages/{message_id}", self.get_message),
+            web.patch(api + "/channels/{channel_id}/messages/{message_id}", self.patch_message),
+            web.delete(api + "/channels/{channel_id}/messages/{message_id}", self.delete_message_route),
+            web.post(api + "/interactions/{interaction_id}/{token}/callback", self.interaction_callback),
+            web.post(api + "/webhooks/{app_id}/{token}", self.followup),
+            web.get(api + "/webhooks/{app_id}/{token}/messages/{message_id}", self.get_original),
+            web.patch(api + "/webhooks/{app_id}/{token}/messages/{message_id}", self.edit_original),
+            web.delete(api + "/webhooks/{app_id}/{token}/messages/{message_id}", self.delete_original),
+            web.get("/_bench/stats", self.bench_stats),
+            web.post("/_bench/reset", self.bench_reset),
+            web.post("/_bench/seed_dm", self.bench_seed_dm),
+            web.get("/_bench/original", self.bench_original),
+        ]
+
+    async def get_me(self, request):
+        return json_response(user_payload(BOT_USER_ID, bot=True))
+
+    async def get_application(self, request):
+        return json_response({
+            "id": str(APPLICATION_ID),
+            "name": "bench",
+            "description": "",
+            "icon": None,
+            "bot_public": True,
+            "bot_require_code_grant": False,
+            "owner": user_payload(OWNER_ID),
+            "verify_key": "0" * 64,
+            "flags": 0,
+        })
+
+    async def get_user(self, request):
+        return json_response(user_payload(int(request.match_info["user_id"])))
+
+    async def create_dm(self, request):
+        body = await request.json()
+        user_id = int(body["recipient_id"])
+        channel_id = self.dm_channels.setdefault(user_id, self.snowflake())
+        return json_response({
+            "id": str(channel_id),
+            "type": 1,
+            "recipients": [user_payload(user_id)],
+            "last_message_id": None,
+        })
+
+    async def get_channel(self, request):
+        channel_id = request.match_info["channel_id"]
+        return json_response({
+            "id": channel_id, "type": 0, "name": "bench", "position": 0,
+            "permission_overwrites": [], "nsfw": False, "parent_id": None,
+        })
+
+    async def post_message(self, request):
+        body = await self.read_body(request)
+        message = self.create_message(int(request.match_info["channel_id"]), body)
+        return json_response(message)
+
+    async def get_messages(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        limit = int(request.query.get("limit", 50))
+        before = int(request.query.get("before", 1 << 63))
+        ids = [mid for mid in reversed(self.channel_messages[channel_id]) if mid < before]
+        return json_response([self.messages[mid] for mid in ids[:limit]])
+
+    async def get_message(self, request):
+        message = self.messages.get(int(request.match_info["message_id"]))
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+    async def patch_message(self, request):
+        body = await self.read_body(request)
+        message = self.edit_message(int(request.match_info["message_id"]), body)
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+    async def delete_message_route(self, request):
+        if not self.delete_message(int(request.match_info["message_id"])):
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return web.Response(status=204)
+
+    async def bulk_delete(self, request):
+        body = await request.json()
+        for message_id in body.get("messages", []):
+            self.delete_message(int(message_id))
+        return web.Response(status=204)
+
+    async def interaction_callback(self, request):
+        interaction_id = request.match_info["interaction_id"]
+        self.acks[interaction_id] = time.time()
+        body = await self.read_body(request)
+        data = body.get("data") or {}
+        response_type = body.get("type")
+        _, channel_id, component_message_id, _ = request.match_info["token"].split("-")
+        channel_id, component_message_id = int(channel_id), int(component_message_id)
+        message = None
+        if response_type == 4:  # CHANNEL_MESSAGE_WITH_SOURCE
+            flags = data.get("flags", 0)
+            message = self.create_message(channel_id, data, flags=flags)
+            self.originals[request.match_info["token"]] = int(message["id"])
+        elif response_type == 7:  # UPDATE_MESSAGE
+            if component_message_id:
+                message = self.edit_message(component_message_id, data)
+        payload = {
+            "interaction": {
+                "id": interaction_id,
+                "type": 3,
+                "response_message_id": message["id"] if message else None,
+                "response_message_loading": response_type == 5,
+                "response_message_ephemeral": bool(data.get("flags", 0) & 64),
+            }
+        }
+        if message is not None:
+            payload["resource"] = {"type": response_type, "message": message}
+        return json_response(payload)
+
+    async def followup(self, request):
+        body = await self.read_body(request)
+        message = self.create_message(0, body, flags=body.get("flags", 0))
+        return json_response(message)
+
+    def original_id(self, request):
+        message_id = request.match_info["message_id"]
+        if message_id == "@original":
+            return self.originals.get(request.match_info["token"])
+        return int(message_id)
+
+    async def get_original(self, request):
+        message = self.messages.get(self.original_id(request))
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+    async def edit_original(self, request):
+        body = await self.read_body(request)
+        message = self.edit_message(self.original_id(request), body)
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+    async def delete_original(self, request):
+        self.delete_message(self.original_id(request))
+        return web.Response(status=204)
+
+    # ===== СЛУЖЕБНЫЕ МАРШРУТЫ БЕНЧМАРКА =====
+
+    async def bench_stats(self, request):
+        return json_response({
+            "requests": dict(self.requests),
+            "rate_limited": dict(self.rate_limited),
+            "acks": self.acks,
+        })
+
+    async def bench_reset(self, request):
+        self.reset_stats()
+        return json_response({})
+
+    async def bench_seed_dm(self, request):
+        """Создает в ЛС пользователя count сообщений бота; возвращает их ID"""
+        body = await request.json()
+        user_id = int(body["user_id"])
+        channel_id = self.dm_channels.setdefault(user_id, self.snowflake())
+        ids = [self.create_message(channel_id, {"content": "seed"})["id"] for _ in range(body["count"])]
+        return json_response({"channel_id": str(channel_id), "message_ids": ids})
+
+    async def bench_original(self, request):
+        """Исходный ответ на взаимодействие по его токену — без учета в статистике запросов"""
+        message = self.messages.get(self.originals.get(request.query.get("token")))
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+
+def make_app(latency=0.02):
+    fake = FakeDiscord(latency=latency)
+    app = web.Application(middlewares=[fake.middleware])
+    app.add_routes(fake.routes())
+    app["fake"] = fake
+    return app
+
+
+def serve(port, latency=0.02):
+    """Запуск сервера (в отдельном процессе бенчмарка)"""
+    web.run_app(make_app(latency), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Имитация REST API Discord для бенчмарков")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    serve(args.port, args.latency)
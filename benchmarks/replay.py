@@ -0,0 +1,259 @@
+"""
+Воспроизведение записи трафика (recorder.py, RECORD_TRAFFIC) против локальной
+имитации REST API Discord: настоящая логика discord_bot.py получает те же
+команды и клики в том же темпе, что и в бою, — в реальном времени или
+ускоренно.
+
+Анонимные ID записи получают свежие snowflake имитации. Клик по кнопке
+находит сообщение через исходное взаимодействие записи (ответ на /старт,
+/история...) и берет custom_id по позиции кнопки. Клики по сообщениям, не
+созданным ответом на взаимодействие (например, контракт из команды !с), пропускаются.
+
+Запуск из корня репозитория:
+    python -m benchmarks.replay traffic.jsonl
+    python -m benchmarks.replay traffic.jsonl --speed 10 --max-gap 5
+    python -m benchmarks.replay traffic.jsonl --json new.json --baseline old.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+import tracemalloc
+from collections import Counter
+
+from benchmarks import fake_discord
+from benchmarks.run_benchmarks import BenchHarness, LoopLagMonitor, finish, import_bot, start_fake_discord
+
+# Типы взаимодействий Discord
+APPLICATION_COMMAND = 2
+MESSAGE_COMPONENT = 3
+USER_OPTION = 6
+
+# Клик может прийти раньше, чем бот ответил на исходную команду (ускоренный прогон)
+ORIGINAL_WAIT_TRIES = 40
+ORIGINAL_WAIT_STEP = 0.05
+
+
+def read_recording(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    entries = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # Оборванная строка после аварийной остановки бота
+    # Несколько файлов шардов можно склеить: порядок задает время
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def offsets(entries, speed, max_gap):
+    """Смещения подачи от начала прогона; паузы длиннее max_gap сжимаются"""
+    result = []
+    offset = 0.0
+    previous = None
+    for entry in entries:
+        if previous is not None:
+            gap = max(0.0, entry["t"] - previous)
+            if max_gap:
+                gap = min(gap, max_gap)
+            offset += gap / speed
+        previous = entry["t"]
+        result.append(offset)
+    return result
+
+
+class Replayer:
+    def __init__(self, harness, base_url):
+        self.harness = harness
+        self.base_url = base_url
+        self.ids = {}  # анонимный ID записи -> snowflake имитации
+        self.tokens = {}  # анонимный ID взаимодействия -> токен его повтора
+        self.originals = {}  # токен -> исходный ответ (сообщение с кнопками)
+        self.commands = Counter()
+        self.events = 0
+        self.skipped = Counter()
+        self.clicks = set()
+
+    def live(self, anonymous_id):
+        if anonymous_id is None:
+            return None
+        live_id = self.ids.get(anonymous_id)
+        if live_id is None:
+            live_id = self.ids[anonymous_id] = self.harness.snowflake()
+        return live_id
+
+    def feed(self, entry):
+        kind = entry.get("k")
+        if kind == "e":
+            # Через тот же обработчик, что и в бою: /health и счетчики событий шлюза
+            self.harness.bot.dispatch("socket_event_type", entry["e"])
+            self.events += 1
+        elif kind == "i":
+            if entry.get("it") == APPLICATION_COMMAND and entry.get("d"):
+                self.command(entry)
+            elif entry.get("it") == MESSAGE_COMPONENT and entry.get("d"):
+                # Поиск сообщения ждет ответа имитации — темп подачи от него не зависит
+                task = asyncio.create_task(self.click(entry))
+                self.clicks.add(task)
+                task.add_done_callback(self.clicks.discard)
+            else:
+                self.skipped["unsupported"] += 1
+
+    async def drain(self):
+        while self.clicks:
+            await asyncio.gather(*list(self.clicks))
+
+    # ===== КОМАНДЫ =====
+
+    def command(self, entry):
+        data = entry["d"]
+        guild_id = self.live(entry.get("g"))
+        resolved = {"users": {}, "members": {}}
+        payload_data = {"id": str(self.harness.snowflake()), "name": data["n"], "type": 1}
+        options = self.options(data.get("o") or (), resolved, dm=guild_id is None)
+        if options:
+            payload_data["options"] = options
+        if resolved["users"]:
+            payload_data["resolved"] = {key: value for key, value in resolved.items() if value}
+        interaction_id, payload = self.harness.interaction(
+            APPLICATION_COMMAND, payload_data, self.live(entry["u"]), self.live(entry["c"]),
+            dm=guild_id is None, guild_id=guild_id
+        )
+        self.tokens[entry["id"]] = payload["token"]
+        self.harness.dispatch(interaction_id, payload)
+        self.commands[data["n"]] += 1
+
+    def options(self, options, resolved, dm):
+        result = []
+        for option in options:
+            item = {"name": option["n"], "type": option["ty"]}
+            if "o" in option:
+                item["options"] = self.options(option["o"], resolved, dm)
+            elif "len" in option:
+                item["value"] = "x" * option["len"]
+            elif option["ty"] == USER_OPTION:
+                user_id = self.live(option.get("v"))
+                resolved["users"][str(user_id)] = fake_discord.user_payload(user_id)
+                if not dm:
+                    resolved["members"][str(user_id)] = {
+                        "roles": [], "joined_at": fake_discord.iso_now(), "deaf": False, "mute": False,
+                        "permissions": "0", "flags": 0,
+                    }
+                item["value"] = str(user_id)
+            else:
+                item["value"] = option.get("v")
+            result.append(item)
+        return result
+
+    # ===== КНОПКИ =====
+
+    async def click(self, entry):
+        data = entry["d"]
+        token = self.tokens.get(data.get("o"))
+        if token is None or data.get("p") is None:
+            self.skipped["no_origin"] += 1
+            return
+        message = await self.original(token)
+        row, index = data["p"]
+        try:
+            custom_id = message["components"][row]["components"][index]["custom_id"]
+        except (TypeError, KeyError, IndexError):
+            self.skipped["unresolved"] += 1
+            return
+        guild_id = self.live(entry.get("g"))
+        payload_data = {"custom_id": custom_id, "component_type": data.get("ct") or 2}
+        self.harness.dispatch(*self.harness.interaction(
+            MESSAGE_COMPONENT, payload_data, self.live(entry["u"]), self.live(entry["c"]),
+            int(message["id"]), dm=guild_id is None, guild_id=guild_id
+        ))
+
+    async def original(self, token):
+        message = self.originals.get(token)
+        if message is not None:
+            return message
+        for _ in range(ORIGINAL_WAIT_TRIES):
+            async with self.harness.session.get(
+                f"{self.base_url}/_bench/original", params={"token": token}
+            ) as response:
+                if response.status == 200:
+                    message = self.originals[token] = await response.json()
+                    return message
+            await asyncio.sleep(ORIGINAL_WAIT_STEP)
+        return None
+
+
+async def run_replay(args, base_url):
+    entries = read_recording(args.recording)
+    if not entries:
+        raise SystemExit(f"В записи {args.recording} нет событий")
+    harness = BenchHarness(import_bot(), base_url)
+    await harness.setup()
+    try:
+        replayer = Replayer(harness, base_url)
+        await harness.reset()
+        tracemalloc.start()
+        monitor = LoopLagMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        for entry, offset in zip(entries, offsets(entries, args.speed, args.max_gap)):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            replayer.feed(entry)
+        await replayer.drain()
+        fed_seconds = time.perf_counter() - started
+        await harness.settle()
+
+        result = await harness.summarize(replayer.commands.get("старт", 0))
+        result["speed"] = args.speed
+        result["recording_seconds"] = round(entries[-1]["t"] - entries[0]["t"], 2)
+        result["replay_seconds"] = round(fed_seconds, 2)
+        result["throughput_per_sec"] = round(result["acked"] / max(fed_seconds, 0.001), 2)
+        result["gateway_events"] = replayer.events
+        result["commands"] = dict(replayer.commands.most_common())
+        result["skipped"] = dict(replayer.skipped)
+        result["wall_seconds"] = round(time.perf_counter() - started, 2)
+        result.update(monitor.stop())
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    finally:
+        await harness.close()
+    return {"replay": result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записи трафика Discord Contract Bot")
+    parser.add_argument("recording", help="файл записи (RECORD_TRAFFIC), можно .gz")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи (10 = в 10 раз быстрее)")
+    parser.add_argument("--max-gap", type=float, default=10.0,
+                        help="паузы записи длиннее этого (сек) сжимаются; 0 — без сжатия")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка имитации API, сек")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--baseline", help="сравнить с результатами прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed должен быть больше нуля")
+    # Бот работает во временном каталоге, пути фиксируем заранее
+    args.recording = os.path.abspath(args.recording)
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    server, base_url = start_fake_discord(args.latency)
+    try:
+        results = asyncio.run(run_replay(args, base_url))
+    finally:
+        server.terminate()
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
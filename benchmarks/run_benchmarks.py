@@ -0,0 +1,428 @@
+"""
+Офлайн-бенчмарки бота: настоящая логика discord_bot.py против локальной
+имитации REST API Discord (benchmarks/fake_discord.py). Шлюз не нужен:
+взаимодействия подаются прямо в парсер состояния discord.py.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scenario join_storm --joins-per-sec 60
+    python -m benchmarks.run_benchmarks --json new.json --baseline old.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import aiohttp
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import connection  # noqa: E402
+from benchmarks import fake_discord  # noqa: E402
+
+SCENARIOS = ("contracts", "join_storm", "mass_timeout", "dm_cleanup")
+
+# Метрики, которые сравниваются с базовым прогоном (больше — хуже)
+REGRESSION_METRICS = ("ack_p50_ms", "ack_p99_ms", "rest_per_contract", "loop_lag_max_ms")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже срабатывает sleep(interval)"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    def start(self):
+        self.samples = []
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(loop.time() - started - self.interval)
+
+    def stop(self):
+        self.task.cancel()
+        return {
+            "loop_lag_p99_ms": round(percentile(self.samples, 99) * 1000, 2),
+            "loop_lag_max_ms": round(max(self.samples, default=0) * 1000, 2),
+        }
+
+
+class BenchHarness:
+    def __init__(self, bot_module, base_url):
+        self.mod = bot_module
+        self.bot = bot_module.bot
+        self.base_url = base_url
+        self.session = None
+        self.snowflakes = itertools.count(1)
+        self.dispatched = {}  # interaction_id -> время подачи
+        self.guild_id = self.snowflake()
+
+    def snowflake(self):
+        millis = int(time.time() * 1000) - fake_discord.DISCORD_EPOCH_MS
+        return (millis << 22) | (next(self.snowflakes) & 0x3FFFFF)
+
+    async def setup(self):
+        import discord
+        discord.http.Route.BASE = f"{self.base_url}/api/v10"
+        self.session = aiohttp.ClientSession()
+        # Тот же пул соединений, что ставит супервизор подключения в бою
+        self.bot.http.connector = connection.make_connector()
+        # login без шлюза: получает пользователя бота и вызывает setup_hook
+        await self.bot.login("bench-token")
+
+    async def close(self):
+        await self.mod.store.close()
+        await self.bot.close()
+        await self.session.close()
+
+    # ===== СТАТИСТИКА ИМИТАЦИИ =====
+
+    async def reset(self):
+        self.dispatched = {}
+        async with self.session.post(f"{self.base_url}/_bench/reset"):
+            pass
+
+    async def server_stats(self):
+        async with self.session.get(f"{self.base_url}/_bench/stats") as response:
+            return await response.json()
+
+    def rest_requests(self):
+        return sum(self.mod.rest_queue.requests.values())
+
+    async def settle(self, quiet=0.5, timeout=120):
+        """Ждет, пока бот перестанет отправлять запросы и разберет очередь"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_count, stable_since = -1, loop.time()
+        while loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            queue = self.mod.rest_queue
+            # Отложенные правки состава тоже считаются незавершенной работой
+            rendering = any(kind == "render" for (_, kind), _ in self.mod.scheduler.pending())
+            count = self.rest_requests()
+            if count != last_count or queue.pending() or queue.active or rendering:
+                last_count, stable_since = count, loop.time()
+            elif loop.time() - stable_since >= quiet:
+                return
+        raise TimeoutError("бот не успокоился за отведенное время")
+
+    async def summarize(self, contracts=1):
+        stats = await self.server_stats()
+        latencies = [
+            (stats["acks"][str(interaction_id)] - dispatched) * 1000
+            for interaction_id, dispatched in self.dispatched.items()
+            if str(interaction_id) in stats["acks"]
+        ]
+        total = sum(stats["requests"].values())
+        return {
+            "interactions": len(self.dispatched),
+            "acked": len(latencies),
+            "ack_p50_ms": round(percentile(latencies, 50), 2),
+            "ack_p99_ms": round(percentile(latencies, 99), 2),
+            "rest_calls": total,
+            "rest_per_contract": round(total / max(1, contracts), 2),
+            "rate_limited": sum(stats["rate_limited"].values()),
+            "requests_by_route": dict(sorted(stats["requests"].items(), key=lambda item: -item[1])),
+        }
+
+    # ===== ПОСТРОЕНИЕ СОБЫТИЙ =====
+
+    def user(self, user_id):
+        return fake_discord.user_payload(user_id)
+
+    def channel(self, channel_id, dm=False, guild_id=None):
+        if dm:
+            return {"id": str(channel_id), "type": 1, "recipients": []}
+        return {
+            "id": str(channel_id), "type": 0, "guild_id": str(guild_id or self.guild_id), "name": "bench",
+            "position": 0, "permission_overwrites": [], "nsfw": False, "parent_id": None,
+        }
+
+    def message(self, message_id, channel_id):
+        return {
+            "id": str(message_id), "channel_id": str(channel_id),
+            "author": fake_discord.user_payload(fake_discord.BOT_USER_ID, bot=True),
+            "content": "", "embeds": [], "components": [], "attachments": [], "mentions": [],
+            "mention_roles": [], "mention_everyone": False, "pinned": False, "tts": False,
+            "timestamp": datetime.now(timezone.utc).isoformat(), "edited_timestamp": None,
+            "type": 0, "flags": 0,
+        }
+
+    def interaction(self, kind, data, user_id, channel_id, message_id=None, dm=False, guild_id=None):
+        interaction_id = self.snowflake()
+        guild_id = guild_id or self.guild_id
+        payload = {
+            "id": str(interaction_id),
+            "application_id": str(fake_discord.APPLICATION_ID),
+            "type": kind,
+            "token": f"bench-{channel_id}-{message_id or 0}-{interaction_id}",
+            "version": 1,
+            "channel_id": str(channel_id),
+            "channel": self.channel(channel_id, dm=dm, guild_id=guild_id),
+            "data": data,
+            "locale": "ru",
+            "app_permissions": "0",
+            "entitlements": [],
+            "attachment_size_limit": 10 * 2 ** 20,
+            "authorizing_integration_owners": {},
+            "context": 1 if dm else 0,
+        }
+        if dm:
+            payload["user"] = self.user(user_id)
+        else:
+            payload["guild_id"] = str(guild_id)
+            payload["guild_locale"] = "ru"
+            payload["member"] = {
+                "user": self.user(user_id), "roles": [], "joined_at": datetime.now(timezone.utc).isoformat(),
+                "deaf": False, "mute": False, "permissions": "0", "flags": 0,
+            }
+        if message_id is not None:
+            payload["message"] = self.message(message_id, channel_id)
+        return interaction_id, payload
+
+    def dispatch(self, interaction_id, payload):
+        self.dispatched[interaction_id] = time.time()
+        self.bot._connection.parse_interaction_create(payload)
+
+    def slash_start(self, user_id, channel_id):
+        data = {"id": str(self.snowflake()), "name": "старт", "type": 1}
+        self.dispatch(*self.interaction(2, data, user_id, channel_id))
+
+    def click(self, custom_id, user_id, channel_id, message_id, dm=False):
+        data = {"custom_id": custom_id, "component_type": 2}
+        self.dispatch(*self.interaction(3, data, user_id, channel_id, message_id, dm=dm))
+
+    async def open_contracts(self, count, channels):
+        """Создает count контрактов от разных пользователей в channels каналах"""
+        existing = set(self.mod.active_contracts)
+        channel_ids = [self.snowflake() for _ in range(channels)]
+        for index in range(count):
+            self.slash_start(self.snowflake(), channel_ids[index % channels])
+        await self.settle()
+        return [
+            record for contract_id, record in self.mod.active_contracts.items()
+            if contract_id not in existing and record.message_id is not None
+        ]
+
+    # ===== СЦЕНАРИИ =====
+
+    async def scenario_contracts(self, args):
+        await self.reset()
+        await self.open_contracts(args.contracts, args.channels)
+        return await self.summarize(args.contracts)
+
+    async def scenario_join_storm(self, args):
+        (record,) = await self.open_contracts(1, 1)
+        await self.reset()
+        clicks = int(args.joins_per_sec * args.duration)
+        interval = 1 / args.joins_per_sec
+        started = time.perf_counter()
+        for index in range(clicks):
+            self.click("join_button", self.snowflake(), record.channel_id, record.message_id)
+            # Держим заданный темп кликов независимо от задержек бота
+            delay = started + (index + 1) * interval - time.perf_counter()
+            await asyncio.sleep(max(0, delay))
+        await self.settle()
+        result = await self.summarize(1)
+        result["participants"] = len(record)
+        result["roster_edits"] = self.mod.render_stats["edits"]
+        result["coalesced_edits"] = self.mod.render_stats["coalesced"]
+        return result
+
+    async def scenario_mass_timeout(self, args):
+        records = await self.open_contracts(args.contracts, args.channels)
+        await self.reset()
+        started = time.perf_counter()
+        for record in records:
+            self.mod.scheduler.reschedule((record.contract_id, "deadline"), 0)
+        await self.settle()
+        result = await self.summarize(len(records))
+        result["finalize_seconds"] = round(time.perf_counter() - started, 2)
+        result["still_active"] = sum(
+            record.contract_id in self.mod.active_contracts for record in records
+        )
+        return result
+
+    async def scenario_dm_cleanup(self, args):
+        import discord
+        user_id = self.snowflake()
+        async with self.session.post(
+            f"{self.base_url}/_bench/seed_dm", json={"user_id": user_id, "count": args.dm_messages}
+        ) as response:
+            seeded = await response.json()
+        channel_id = int(seeded["channel_id"])
+        for message_id in seeded["message_ids"]:
+            self.mod.store.record_dm(user_id, channel_id, int(message_id))
+        self.mod.store.mark_dm_legacy_scanned(user_id)
+
+        # Кнопка очистки висит на последнем сообщении, как после уведомления создателю;
+        # нажатие ловит постоянная CleanupView, зарегистрированная в setup_hook
+        button_message_id = int(seeded["message_ids"][-1])
+        await self.reset()
+        started = time.perf_counter()
+        self.click(self.mod.CLEANUP_BUTTON_ID, user_id, channel_id, button_message_id, dm=True)
+        await self.settle()
+        result = await self.summarize(1)
+        result["cleanup_seconds"] = round(time.perf_counter() - started, 2)
+        stats = await self.server_stats()
+        result["deleted"] = sum(
+            count - stats["rate_limited"].get(route, 0)
+            for route, count in stats["requests"].items()
+            if route.startswith("DELETE /channels/")
+        )
+        return result
+
+
+def import_bot():
+    """Импортирует discord_bot с чистой базой во временном каталоге, без веб-сервера и синхронизации команд"""
+    workdir = tempfile.mkdtemp(prefix="kontraktbot-bench-")
+    os.environ["CONTRACT_DB_PATH"] = os.path.join(workdir, "contracts.db")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STATUS_SERVER"] = "false"
+    os.environ["COMMAND_SYNC"] = "false"
+    os.environ.pop("RECORD_TRAFFIC", None)  # Прогон не должен дописывать запись трафика
+    os.chdir(workdir)  # bot.log и прочие файлы бота — во временном каталоге
+    import discord_bot
+    return discord_bot
+
+
+def start_fake_discord(latency):
+    """Имитация API в отдельном процессе; возвращает (процесс, base_url), когда порт уже слушает"""
+    port = free_port()
+    server = multiprocessing.Process(target=fake_discord.serve, args=(port, latency), daemon=True)
+    server.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def run_scenarios(args, base_url):
+    # Все клики синтетические и идут в один канал — ограничитель отбросил бы нагрузку
+    os.environ["THROTTLE"] = "false"
+    harness = BenchHarness(import_bot(), base_url)
+    await harness.setup()
+    results = {}
+    try:
+        for name in args.scenario:
+            tracemalloc.start()
+            monitor = LoopLagMonitor()
+            monitor.start()
+            started = time.perf_counter()
+            result = await getattr(harness, f"scenario_{name}")(args)
+            result["wall_seconds"] = round(time.perf_counter() - started, 2)
+            result.update(monitor.stop())
+            result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+            results[name] = result
+    finally:
+        await harness.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базового прогона"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in REGRESSION_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old} -> {new}")
+    return regressions
+
+
+def print_report(results):
+    for name, result in results.items():
+        print(f"\n=== {name} ===")
+        for key, value in result.items():
+            if key == "requests_by_route":
+                print("  запросы по маршрутам:")
+                for route, count in list(value.items())[:8]:
+                    print(f"    {count:6d}  {route}")
+            else:
+                print(f"  {key}: {value}")
+
+
+def finish(results, args):
+    """Печатает отчет, сохраняет --json и проверяет --baseline (код выхода 1 при регрессии)"""
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Регрессии производительности:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ Регрессий относительно базового прогона нет")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки Discord Contract Bot")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--contracts", type=int, default=50, help="контрактов в сценариях contracts/mass_timeout")
+    parser.add_argument("--channels", type=int, default=10, help="каналов, по которым распределяются контракты")
+    parser.add_argument("--joins-per-sec", type=float, default=30, help="темп кликов в join_storm")
+    parser.add_argument("--duration", type=float, default=5, help="длительность join_storm, сек")
+    parser.add_argument("--dm-messages", type=int, default=100, help="сообщений в ЛС для dm_cleanup")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка имитации API, сек")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--baseline", help="сравнить с результатами прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+    # Бот работает во временном каталоге, пути к отчетам фиксируем заранее
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    server, base_url = start_fake_discord(args.latency)
+    try:
+        results = asyncio.run(run_scenarios(args, base_url))
+    finally:
+        server.terminate()
+
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
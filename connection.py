@@ -0,0 +1,167 @@
+"""
+Супервизор подключения к Discord.
+
+Обрывы шлюза discord.py переживает сам: переподключается с RESUME и
+собственной задержкой, не трогая пул HTTP-соединений. Сюда попадают только
+случаи, когда bot.start() все-таки завершился (сеть недоступна при входе,
+неожиданный код закрытия шлюза и т.п.). Тогда бот закрывается, его
+внутреннее состояние сбрасывается через bot.clear(), и запуск повторяется
+с задержкой «full jitter» без ограничения числа попыток.
+
+Время восстановления считается по событиям: disconnect -> resumed (RESUME)
+и disconnect -> ready (новый IDENTIFY).
+"""
+
+import asyncio
+import logging
+import random
+import signal
+import time
+from collections import deque
+
+import aiohttp
+import discord
+
+logger = logging.getLogger('discord.contract_bot.connection')
+
+# Ошибки конфигурации: повтор без вмешательства человека не поможет
+FATAL_ERRORS = (discord.LoginFailure, discord.PrivilegedIntentsRequired)
+
+
+def make_connector():
+    """Пул HTTP-соединений клиента discord.py (REST и шлюз); создавать внутри event loop"""
+    return aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=30,  # Почти все запросы идут на discord.com
+        ttl_dns_cache=300,
+        keepalive_timeout=60,  # Соединения держатся между всплесками запросов
+    )
+
+
+class ConnectionStats:
+    def __init__(self, history=20):
+        self.starts = 0
+        self.restarts = 0
+        self.disconnects = 0
+        self.resumes = 0
+        self.identifies = 0
+        self.disconnected_at = None
+        self.last_error = None
+        self.resume_seconds = deque(maxlen=history)  # Обрыв -> RESUMED
+        self.reconnect_seconds = deque(maxlen=history)  # Обрыв -> READY после нового IDENTIFY
+
+    def on_disconnect(self):
+        self.disconnects += 1
+        # Повторные disconnect во время переподключения не сдвигают начало простоя
+        if self.disconnected_at is None:
+            self.disconnected_at = time.monotonic()
+
+    def on_resumed(self):
+        self.resumes += 1
+        if self.disconnected_at is not None:
+            self.resume_seconds.append(time.monotonic() - self.disconnected_at)
+            self.disconnected_at = None
+
+    def on_ready(self):
+        self.identifies += 1
+        if self.disconnected_at is not None:
+            self.reconnect_seconds.append(time.monotonic() - self.disconnected_at)
+            self.disconnected_at = None
+
+    def snapshot(self):
+        def summary(values):
+            if not values:
+                return None
+            return {"last": round(values[-1], 2), "max": round(max(values), 2),
+                    "avg": round(sum(values) / len(values), 2)}
+
+        return {
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "disconnects": self.disconnects,
+            "resumes": self.resumes,
+            "identifies": self.identifies,
+            "disconnected_for": round(time.monotonic() - self.disconnected_at, 1)
+            if self.disconnected_at is not None else None,
+            "resume_seconds": summary(self.resume_seconds),
+            "reconnect_seconds": summary(self.reconnect_seconds),
+            "last_error": self.last_error,
+        }
+
+
+class ConnectionSupervisor:
+    def __init__(self, bot, token, base_delay=1.0, max_delay=300.0, stable_after=600.0,
+                 stats=None, on_restart=None):
+        self.bot = bot
+        self.token = token
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Проработавший столько запуск сбрасывает рост задержки
+        self.stable_after = stable_after
+        # Вызывается после bot.clear(): вернуть постоянные View и т.п.
+        self.on_restart = on_restart
+        self.stats = stats if stats is not None else ConnectionStats()
+        self.stopping = False
+
+    def backoff(self, attempt):
+        """Full jitter: случайная задержка от 0 до экспоненциального потолка"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stop(self):
+        self.stopping = True
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINT закрывают бота штатно: хранилище успевает сбросить очередь"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: остановка через KeyboardInterrupt
+
+    def request_shutdown(self):
+        logger.info("Получен сигнал завершения работы")
+        self.stop()
+        asyncio.ensure_future(self.bot.close())
+
+    async def run(self):
+        attempt = 0
+        while not self.stopping:
+            # Один пул на весь запуск: REST и шлюз, включая все RESUME внутри discord.py
+            self.bot.http.connector = make_connector()
+            self.stats.starts += 1
+            started = time.monotonic()
+            try:
+                await self.bot.start(self.token)
+                if self.stopping:
+                    return
+                error = "bot.start() завершился без ошибки"
+            except FATAL_ERRORS:
+                raise
+            except Exception as e:
+                if self.stopping:
+                    return
+                error = f"{type(e).__name__}: {e}"
+                # Сетевые сбои ожидаемы — стек нужен только для неожиданных ошибок
+                network = isinstance(e, (OSError, aiohttp.ClientError, asyncio.TimeoutError))
+                logger.error(f"Подключение к Discord потеряно: {error}", exc_info=not network)
+
+            self.stats.last_error = error
+            if time.monotonic() - started >= self.stable_after:
+                attempt = 0
+            delay = self.backoff(attempt)
+            attempt += 1
+            self.stats.restarts += 1
+            if self.stats.disconnected_at is None:
+                self.stats.disconnected_at = time.monotonic()
+            logger.warning(f"Перезапуск подключения #{self.stats.restarts} через {delay:.1f} сек")
+
+            if not self.bot.is_closed():
+                await self.bot.close()
+            await asyncio.sleep(delay)
+            if self.stopping:
+                return
+            # Закрытый Client нельзя запустить повторно без сброса состояния
+            self.bot.clear()
+            if self.on_restart is not None:
+                self.on_restart()
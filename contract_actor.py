@@ -0,0 +1,84 @@
+"""
+Актор контракта: все изменения состояния одного контракта (запись, закрытие,
+отмена, дедлайн) выполняются строго по очереди через его почтовый ящик,
+а разные контракты обрабатываются параллельно без общих блокировок.
+
+Отдельной задачи на контракт нет: сообщение исполняет сам вызывающий, а
+остальные ждут своей очереди в ящике (FIFO). Обработчики должны быть
+короткими — долгие запросы к Discord выполняются уже после смены состояния,
+вне ящика.
+"""
+
+import asyncio
+import inspect
+from collections import Counter, deque
+
+OPEN = "open"            # Идет запись
+CLOSING = "closing"      # Запись закрыта, идет финальная правка и уведомления
+CLOSED = "closed"        # Завершен
+CANCELLED = "cancelled"  # Отменен автором
+
+# Общие счетчики всех акторов для метрик
+queued = 0  # Сообщений, ждущих в ящиках прямо сейчас
+processed = Counter()  # Обработано сообщений по обработчикам
+
+
+class ContractActor:
+    __slots__ = ("contract_id", "state", "busy", "mailbox")
+
+    def __init__(self, contract_id):
+        self.contract_id = contract_id
+        self.state = OPEN
+        self.busy = False
+        self.mailbox = deque()  # Ожидающие очереди: future, которые будятся по порядку
+
+    @property
+    def is_open(self):
+        return self.state == OPEN
+
+    def transition(self, expected, new):
+        """Меняет состояние, только если оно сейчас expected"""
+        if self.state != expected:
+            return False
+        self.state = new
+        return True
+
+    async def call(self, handler, *args):
+        """Выполняет handler(*args) в очереди этого контракта и возвращает результат"""
+        global queued
+        if self.busy:
+            waiter = asyncio.get_running_loop().create_future()
+            self.mailbox.append(waiter)
+            queued += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()  # Очередь уже передана нам — передаем дальше
+                else:
+                    self.mailbox.remove(waiter)
+                raise
+            finally:
+                queued -= 1
+        else:
+            self.busy = True
+        try:
+            result = handler(*args)
+            if inspect.isawaitable(result):
+                result = await result
+            processed[getattr(handler, "__name__", "handler")] += 1
+            return result
+        finally:
+            self.release()
+
+    def release(self):
+        # Очередь передается следующему сразу, чтобы новые сообщения не обгоняли ждущих
+        while self.mailbox:
+            waiter = self.mailbox.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.busy = False
+
+    def __len__(self):
+        return len(self.mailbox)
@@ -0,0 +1,68 @@
+"""
+Компактная запись активного контракта: только идентификаторы и состав.
+Сообщение контракта не хранится, а создается по требованию как PartialMessage.
+"""
+
+import time
+
+
+class ContractRecord:
+    __slots__ = (
+        "contract_id", "creator", "channel_id", "guild_id",
+        "message_id", "participants", "start_time"
+    )
+
+    def __init__(self, contract_id, creator, channel_id, guild_id=None,
+                 message_id=None, participants=None, start_time=None):
+        self.contract_id = contract_id
+        self.creator = creator
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.message_id = message_id
+        # dict как упорядоченное множество: порядок записи + проверка за O(1)
+        self.participants = dict.fromkeys(participants if participants is not None else (creator,))
+        self.start_time = start_time or time.time()
+
+    def add_participant(self, user_id):
+        """Добавляет участника; возвращает False, если он уже записан"""
+        if user_id in self.participants:
+            return False
+        self.participants[user_id] = None
+        return True
+
+    def has_participant(self, user_id):
+        return user_id in self.participants
+
+    def participant_ids(self):
+        return list(self.participants)
+
+    def __len__(self):
+        return len(self.participants)
+
+    def time_left(self, duration=600):
+        return max(0, duration - (time.time() - self.start_time))
+
+    def partial_message(self, bot):
+        """Сообщение контракта без запроса к API (None, если еще не опубликовано)"""
+        if self.message_id is None:
+            return None
+        channel = bot.get_partial_messageable(self.channel_id, guild_id=self.guild_id)
+        return channel.get_partial_message(self.message_id)
+
+    def to_row(self):
+        return {
+            "contract_id": self.contract_id,
+            "creator": self.creator,
+            "channel_id": self.channel_id,
+            "guild_id": self.guild_id,
+            "message_id": self.message_id,
+            "participants": list(self.participants),
+            "start_time": self.start_time
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["contract_id"], row["creator"], row["channel_id"], row["guild_id"],
+            row["message_id"], row["participants"], row["start_time"]
+        )
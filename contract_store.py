@@ -0,0 +1,530 @@
+"""
+Хранилище контрактов на SQLite (режим WAL) с отложенной пакетной записью.
+Горячий путь (запись на контракт) только отмечает изменения в памяти,
+на диск они уходят пачкой из фонового потока.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('discord.contract_bot.store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS active_contracts (
+    contract_id TEXT PRIMARY KEY,
+    creator INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    message_id INTEGER,
+    participants TEXT NOT NULL,
+    start_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_contracts (
+    user_id INTEGER PRIMARY KEY,
+    contract_id TEXT NOT NULL,
+    shard_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_contracts_shard ON user_contracts (shard_id);
+CREATE TABLE IF NOT EXISTS dm_ledger (
+    message_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dm_ledger_user ON dm_ledger (user_id);
+CREATE TABLE IF NOT EXISTS dm_closed (
+    user_id INTEGER PRIMARY KEY,
+    noted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dm_legacy_scanned (
+    user_id INTEGER PRIMARY KEY,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contract_history (
+    contract_id TEXT PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    creator INTEGER NOT NULL,
+    participants TEXT NOT NULL,
+    participant_count INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    closed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contract_history_guild ON contract_history (guild_id, closed_at, contract_id);
+CREATE TABLE IF NOT EXISTS contract_participation (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    closed_at REAL NOT NULL,
+    contract_id TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id, closed_at, contract_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_stats (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0,
+    joined INTEGER NOT NULL DEFAULT 0,
+    recruited INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_stats_created ON user_stats (guild_id, created);
+CREATE INDEX IF NOT EXISTS user_stats_joined ON user_stats (guild_id, joined);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    guild_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    contracts INTEGER NOT NULL DEFAULT 0,
+    started INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    joins INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS guild_stats (
+    guild_id INTEGER PRIMARY KEY,
+    contracts INTEGER NOT NULL DEFAULT 0,
+    started INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    joins INTEGER NOT NULL DEFAULT 0,
+    first_at REAL,
+    last_at REAL
+);
+CREATE TABLE IF NOT EXISTS message_expiry (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    shard_id INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS message_expiry_due ON message_expiry (shard_id, expires_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Первичные ключи таблиц для удаления строк
+TABLE_KEYS = {
+    "active_contracts": "contract_id",
+    "dm_ledger": "message_id",
+    "dm_legacy_scanned": "user_id",
+    "dm_closed": "user_id",
+    "user_contracts": "user_id",
+    "message_expiry": "message_id",
+    "meta": "key",
+}
+
+# Исходы контракта в истории
+OUTCOME_STARTED = "started"  # Запись закрылась с участниками
+OUTCOME_EMPTY = "empty"  # Закрылась без участников
+OUTCOME_CANCELLED = "cancelled"  # Автор отменил запись
+
+# Агрегаты обновляются в той же транзакции, что и строка истории,
+# и только если она действительно вставлена — повторное закрытие не считается дважды
+AGGREGATE_UPDATES = (
+    (
+        "INSERT INTO guild_stats (guild_id, contracts, started, cancelled, joins, first_at, last_at) "
+        "VALUES (:guild_id, 1, :started, :cancelled, :joins, :closed_at, :closed_at) "
+        "ON CONFLICT (guild_id) DO UPDATE SET contracts = contracts + 1, "
+        "started = started + excluded.started, cancelled = cancelled + excluded.cancelled, "
+        "joins = joins + excluded.joins, last_at = MAX(last_at, excluded.last_at)"
+    ),
+    (
+        "INSERT INTO daily_stats (guild_id, day, contracts, started, cancelled, joins) "
+        "VALUES (:guild_id, :day, 1, :started, :cancelled, :joins) "
+        "ON CONFLICT (guild_id, day) DO UPDATE SET contracts = contracts + 1, "
+        "started = started + excluded.started, cancelled = cancelled + excluded.cancelled, "
+        "joins = joins + excluded.joins"
+    ),
+    (
+        "INSERT INTO user_stats (guild_id, user_id, created, recruited) "
+        "VALUES (:guild_id, :creator, 1, :joins) "
+        "ON CONFLICT (guild_id, user_id) DO UPDATE SET created = created + 1, "
+        "recruited = recruited + excluded.recruited"
+    ),
+)
+# Таблицы, которые пишет write_history из history_pending
+HISTORY_TABLES = frozenset(("contract_history", "contract_participation", "guild_stats", "daily_stats", "user_stats"))
+
+JOIN_UPDATE = (
+    "INSERT INTO user_stats (guild_id, user_id, joined) VALUES (?, ?, 1) "
+    "ON CONFLICT (guild_id, user_id) DO UPDATE SET joined = joined + 1"
+)
+
+
+class ContractStore:
+    def __init__(self, path, flush_interval=2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = None
+        self.lock = threading.Lock()
+        # (таблица, ключ) -> строка, функция построения строки или None (удаление)
+        self.pending = {}
+        self.flush_task = None
+        # Пачки пишутся строго по очереди, иначе более старая может затереть новую
+        self.flush_lock = asyncio.Lock()
+        # Закрытые контракты для истории и агрегатов (пишутся при сбросе)
+        self.history_pending = []
+        self.dm_ledger_started = None
+
+    def open(self):
+        """Открывает базу и создает таблицы; повторный вызов (перезапуск подключения) ничего не делает"""
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Момент появления журнала ЛС: более старые сообщения ищем сканированием истории
+        self.conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('dm_ledger_started', ?)",
+            (str(time.time()),)
+        )
+        self.conn.commit()
+        self.dm_ledger_started = float(self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'dm_ledger_started'"
+        ).fetchone()["value"])
+        logger.info(f"Хранилище контрактов открыто: {self.path}")
+
+    def start(self):
+        """Запускает фоновую запись; вызывать из работающего event loop"""
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_loop())
+
+    # ===== ЗАПИСЬ (НЕ БЛОКИРУЕТ) =====
+
+    def put(self, table, key, row):
+        """
+        Ставит строку в очередь на запись. row может быть функцией без
+        аргументов: она вызовется в момент сброса, так что серия изменений
+        одного контракта превращается в одну запись с последним состоянием.
+        Если функция вернет None, строка будет удалена.
+        """
+        self.pending[(table, key)] = row
+
+    def delete(self, table, key):
+        self.pending[(table, key)] = None
+
+    # ===== ЧТЕНИЕ (ПРИ СТАРТЕ) =====
+
+    def load(self, table):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f"SELECT * FROM {table}")]
+
+    def load_active(self):
+        rows = self.load("active_contracts")
+        for row in rows:
+            row["participants"] = json.loads(row["participants"])
+        return rows
+
+    def get_meta(self, key):
+        pending = self.pending.get(("meta", key))
+        if pending is not None:
+            return pending["value"]
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        self.put("meta", key, {"key": key, "value": value})
+
+    async def query(self, sql, params=(), tables=()):
+        """
+        Чтение во время работы в потоке. Перед ним сбрасываются отложенные строки
+        только перечисленных таблиц; остальное чтение может отставать от put()
+        на интервал сброса.
+        """
+        if tables:
+            await self.flush(tables)
+
+        def run():
+            with self.lock:
+                return [dict(row) for row in self.conn.execute(sql, params)]
+
+        return await asyncio.to_thread(run)
+
+    # ===== КОНТРАКТЫ ПОЛЬЗОВАТЕЛЕЙ (ОБЩИЕ ДЛЯ ШАРДОВ) =====
+
+    async def claim_user_contract(self, user_id, contract_id, shard_id):
+        """
+        Атомарно закрепляет контракт за пользователем во всех шардах.
+        False — у пользователя уже есть активный контракт (возможно, в другом шарде).
+        """
+        # Отложенное освобождение прошлого контракта этого пользователя пишем вместе
+        # с захватом; остальная очередь ждет обычного сброса
+        key = ("user_contracts", user_id)
+        release = key in self.pending and self.pending[key] is None
+        if release:
+            del self.pending[key]
+
+        def run():
+            with self.lock, self.conn:
+                if release:
+                    self.conn.execute("DELETE FROM user_contracts WHERE user_id = ?", (user_id,))
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO user_contracts (user_id, contract_id, shard_id) "
+                    "VALUES (?, ?, ?)",
+                    (user_id, contract_id, shard_id)
+                )
+                return cursor.rowcount == 1
+
+        try:
+            return await asyncio.to_thread(run)
+        except Exception:
+            if release:
+                self.pending.setdefault(key, None)
+            raise
+
+    def release_user_contract(self, user_id):
+        self.delete("user_contracts", user_id)
+
+    def prune_user_contracts(self, shard_id, keep):
+        """При старте шарда снимает закрепления контрактов, которых больше нет"""
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT user_id, contract_id FROM user_contracts WHERE shard_id = ?", (shard_id,)
+            ).fetchall()
+            stale = [(row["user_id"],) for row in rows if row["contract_id"] not in keep]
+            self.conn.executemany("DELETE FROM user_contracts WHERE user_id = ?", stale)
+        return len(stale)
+
+    # ===== ЖУРНАЛ ЛС =====
+
+    def record_dm(self, user_id, channel_id, message_id):
+        self.put("dm_ledger", message_id, {
+            "message_id": message_id,
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "created_at": time.time()
+        })
+
+    def forget_dm(self, message_id):
+        self.delete("dm_ledger", message_id)
+
+    async def dm_messages(self, user_id):
+        """Сообщения бота в ЛС пользователя по журналу, новые первыми"""
+        return await self.query(
+            "SELECT message_id, channel_id FROM dm_ledger WHERE user_id = ? "
+            "ORDER BY message_id DESC",
+            (user_id,), tables=("dm_ledger",)
+        )
+
+    async def dm_legacy_scan_needed(self, user_id):
+        """True, если ЛС пользователя еще не сканировались на сообщения до журнала"""
+        rows = await self.query(
+            "SELECT 1 FROM dm_legacy_scanned WHERE user_id = ?", (user_id,), tables=("dm_legacy_scanned",)
+        )
+        return not rows
+
+    def mark_dm_legacy_scanned(self, user_id):
+        self.put("dm_legacy_scanned", user_id, {"user_id": user_id, "scanned_at": time.time()})
+
+    # ===== СРОКИ ЖИЗНИ СООБЩЕНИЙ =====
+
+    async def due_messages(self, shard_id, now, limit):
+        """
+        Сообщения шарда с наступившим сроком удаления, самые старые первыми.
+        Без сброса: срок, поставленный меньше интервала сброса назад, дождется следующего прохода.
+        """
+        return await self.query(
+            "SELECT * FROM message_expiry WHERE shard_id = ? AND expires_at <= ? "
+            "ORDER BY expires_at LIMIT ?",
+            (shard_id, now, limit)
+        )
+
+    # ===== ИСТОРИЯ И СТАТИСТИКА =====
+
+    def record_history(self, contract, outcome, closed_at=None):
+        """Ставит закрытый контракт в историю; агрегаты обновятся при сбросе"""
+        if contract.guild_id is None:
+            return
+        closed_at = closed_at or time.time()
+        participants = contract.participant_ids()
+        joins = sum(1 for user_id in participants if user_id != contract.creator)
+        self.history_pending.append({
+            "contract_id": contract.contract_id,
+            "guild_id": contract.guild_id,
+            "channel_id": contract.channel_id,
+            "creator": contract.creator,
+            "participants": participants,
+            "participant_count": len(participants),
+            "outcome": outcome,
+            "start_time": contract.start_time,
+            "closed_at": closed_at,
+            "day": time.strftime("%Y-%m-%d", time.gmtime(closed_at)),
+            "started": int(outcome == OUTCOME_STARTED),
+            "cancelled": int(outcome == OUTCOME_CANCELLED),
+            "joins": joins,
+        })
+
+    def write_history(self, entries):
+        """Вызывается внутри транзакции write_batch"""
+        for entry in entries:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO contract_history (contract_id, guild_id, channel_id, creator, "
+                "participants, participant_count, outcome, start_time, closed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry["contract_id"], entry["guild_id"], entry["channel_id"], entry["creator"],
+                 json.dumps(entry["participants"]), entry["participant_count"], entry["outcome"],
+                 entry["start_time"], entry["closed_at"])
+            )
+            if cursor.rowcount != 1:
+                continue
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO contract_participation (guild_id, user_id, closed_at, contract_id) "
+                "VALUES (?, ?, ?, ?)",
+                [(entry["guild_id"], user_id, entry["closed_at"], entry["contract_id"])
+                 for user_id in {entry["creator"], *entry["participants"]}]
+            )
+            for sql in AGGREGATE_UPDATES:
+                self.conn.execute(sql, entry)
+            self.conn.executemany(JOIN_UPDATE, [
+                (entry["guild_id"], user_id)
+                for user_id in entry["participants"] if user_id != entry["creator"]
+            ])
+
+    async def guild_summary(self, guild_id, days=7, top=5):
+        """Итоги гильдии из готовых агрегатов: общие, по дням и лучшие авторы/участники"""
+        since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+        # Один сброс истории на всю сводку
+        await self.flush(HISTORY_TABLES)
+        totals = await self.query("SELECT * FROM guild_stats WHERE guild_id = ?", (guild_id,))
+        daily = await self.query(
+            "SELECT * FROM daily_stats WHERE guild_id = ? AND day >= ? ORDER BY day DESC",
+            (guild_id, since)
+        )
+        # Обратный обход индексов (guild_id, created) / (guild_id, joined): первые top строк
+        creators = await self.query(
+            "SELECT user_id, created FROM user_stats WHERE guild_id = ? AND created > 0 "
+            "ORDER BY created DESC LIMIT ?", (guild_id, top)
+        )
+        joiners = await self.query(
+            "SELECT user_id, joined FROM user_stats WHERE guild_id = ? AND joined > 0 "
+            "ORDER BY joined DESC LIMIT ?", (guild_id, top)
+        )
+        return {
+            "totals": totals[0] if totals else None,
+            "daily": daily,
+            "top_creators": creators,
+            "top_joiners": joiners,
+        }
+
+    async def user_summary(self, guild_id, user_id):
+        rows = await self.query(
+            "SELECT created, joined, recruited FROM user_stats WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id), tables=HISTORY_TABLES
+        )
+        return rows[0] if rows else None
+
+    async def history_page(self, guild_id, user_id=None, before=None, limit=10):
+        """
+        Страница истории, новые первыми. before — курсор (closed_at, contract_id)
+        последней строки предыдущей страницы: чтение идет по индексу с места
+        курсора, а не через OFFSET.
+        """
+        cursor_sql = ""
+        params = [guild_id]
+        if user_id is not None:
+            params.append(user_id)
+        if before is not None:
+            cursor_sql = "AND (p.closed_at, p.contract_id) < (?, ?) " if user_id is not None \
+                else "AND (closed_at, contract_id) < (?, ?) "
+            params.extend(before)
+        params.append(limit)
+        if user_id is not None:
+            sql = (
+                "SELECT h.* FROM contract_participation p "
+                "JOIN contract_history h ON h.contract_id = p.contract_id "
+                "WHERE p.guild_id = ? AND p.user_id = ? " + cursor_sql +
+                "ORDER BY p.closed_at DESC, p.contract_id DESC LIMIT ?"
+            )
+        else:
+            sql = (
+                "SELECT * FROM contract_history WHERE guild_id = ? " + cursor_sql +
+                "ORDER BY closed_at DESC, contract_id DESC LIMIT ?"
+            )
+        rows = await self.query(sql, params, tables=HISTORY_TABLES)
+        for row in rows:
+            row["participants"] = json.loads(row["participants"])
+        return rows
+
+    # ===== СБРОС НА ДИСК =====
+
+    async def flush_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Ошибка записи в хранилище: {e}", exc_info=True)
+
+    async def flush(self, tables=None):
+        """Пишет очередь на диск; tables — только строки этих таблиц (перед чтением)"""
+        async with self.flush_lock:
+            if self.conn is None:
+                return
+            if tables is None:
+                batch, self.pending = self.pending, {}
+                history, self.history_pending = self.history_pending, []
+            else:
+                batch = {key: row for key, row in self.pending.items() if key[0] in tables}
+                for key in batch:
+                    del self.pending[key]
+                history = []
+                if not HISTORY_TABLES.isdisjoint(tables):
+                    history, self.history_pending = self.history_pending, []
+            if not (batch or history):
+                return
+            # Отложенные строки собираем в потоке event loop, пока состояние согласовано
+            resolved = {}
+            for (table, key), row in batch.items():
+                if callable(row):
+                    row = row()
+                resolved[(table, key)] = row
+            try:
+                await asyncio.to_thread(self.write_batch, resolved, history)
+            except BaseException:
+                # Пачка не записана (SQLITE_BUSY, нет места): возвращаем ее в очередь,
+                # не затирая строки, поставленные после начала сброса
+                # (отложенные строки — снова функциями, чтобы записать свежее состояние).
+                # Транзакция откатилась целиком; история защищена INSERT OR IGNORE
+                for key, row in batch.items():
+                    self.pending.setdefault(key, row)
+                self.history_pending[:0] = history
+                raise
+
+    def write_batch(self, batch, history=()):
+        with self.lock, self.conn:
+            self.write_history(history)
+            for (table, key), row in batch.items():
+                if row is None:
+                    self.conn.execute(
+                        f"DELETE FROM {table} WHERE {TABLE_KEYS[table]} = ?", (key,)
+                    )
+                    continue
+                columns = ", ".join(row)
+                placeholders = ", ".join("?" for _ in row)
+                values = [
+                    json.dumps(value) if isinstance(value, (list, dict)) else value
+                    for value in row.values()
+                ]
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+                    values
+                )
+
+    async def close(self):
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+        await self.flush()
+        if self.conn is not None:
+            with self.lock:
+                self.conn.close()
+            self.conn = None
+            logger.info("Хранилище контрактов закрыто")
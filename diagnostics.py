@@ -0,0 +1,225 @@
+"""
+Диагностика цикла событий: задержка цикла, поиск зависаний со снимком стека,
+список живых задач asyncio и (по желанию) снимки tracemalloc.
+Все части рассчитаны на постоянную работу в продакшене: замер задержки —
+один sleep раз в interval, сторожевой поток просыпается с тем же шагом,
+а тяжелые отчеты строятся только по запросу.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+logger = logging.getLogger('discord.contract_bot.diagnostics')
+
+# Файлы проекта для фильтра tracemalloc
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_bytes():
+    """Текущая резидентная память процесса (на Linux), иначе пиковая"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class GatewayStats:
+    """Сколько событий шлюза (и байт, если включены отладочные события) получает бот"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events = Counter()
+        self.bytes = 0
+        self.messages = 0
+
+    def on_event(self, event_type):
+        self.events[event_type] += 1
+
+    def on_raw(self, payload):
+        # Размер уже распакованного JSON — именно его разбирает бот
+        self.bytes += len(payload)
+        self.messages += 1
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total = sum(self.events.values())
+        return {
+            "events": total,
+            "events_per_min": round(total * 60 / elapsed, 1),
+            "bytes": self.bytes,
+            "kb_per_min": round(self.bytes * 60 / elapsed / 1024, 1),
+            "top_events": dict(self.events.most_common(8)),
+            "rss_mb": round(rss_bytes() / 1024 / 1024, 1),
+        }
+
+
+def coroutine_name(task):
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+class Diagnostics:
+    def __init__(self, interval=0.5, stall_threshold=1.0, history=120, trace_memory=False):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags = deque(maxlen=history)  # Последние замеры задержки, сек
+        self.max_lag = 0.0
+        self.stalls = deque(maxlen=10)  # Последние зависания: (время, длительность, стек)
+        self.stall_count = 0
+        self.trace_memory = trace_memory
+        self.last_tick = None
+        self.loop_thread_id = None
+        self.task = None
+        self.watchdog = None
+        self.stopping = threading.Event()
+        self.gateway = GatewayStats()
+
+    def start(self):
+        if self.task is not None and not self.task.done():
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self.sample_lag())
+        if self.watchdog is None or not self.watchdog.is_alive():
+            self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+        if self.trace_memory:
+            import tracemalloc  # Заметно удлиняет старт, поэтому только по требованию
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+
+    def stop(self):
+        self.stopping.set()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    # ===== ЗАДЕРЖКА ЦИКЛА =====
+
+    async def sample_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self.lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.last_tick = now
+
+    def lag_percentile(self, fraction):
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    # ===== ЗАВИСАНИЯ =====
+
+    def watch(self):
+        """Сторожевой поток: если цикл не отмечался дольше порога, снимает его стек"""
+        reported_tick = None
+        while not self.stopping.wait(self.interval):
+            tick = self.last_tick
+            if tick is None or tick == reported_tick:
+                continue
+            stalled = time.monotonic() - tick - self.interval
+            if stalled < self.stall_threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.stalls.append((time.time(), stalled, stack))
+            self.stall_count += 1
+            reported_tick = tick  # Одно зависание — один снимок
+            logger.warning(f"Цикл событий не отвечает {stalled:.2f} сек, стек:\n{stack}")
+
+    # ===== ЗАДАЧИ =====
+
+    def task_inventory(self):
+        """Живые задачи, сгруппированные по корутине: {имя: количество}"""
+        counts = Counter(coroutine_name(task) for task in asyncio.all_tasks() if not task.done())
+        return dict(counts.most_common())
+
+    # ===== ПАМЯТЬ =====
+
+    def memory_top(self, limit=10):
+        """Строки проекта с наибольшим объемом живых выделений (None без tracemalloc)"""
+        if not self.trace_memory:
+            return None
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(True, os.path.join(PROJECT_DIR, "*")),)
+        )
+        top = []
+        for stat in snapshot.statistics("lineno")[:limit]:
+            frame = stat.traceback[0]
+            top.append({
+                "location": f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+            })
+        return top
+
+    # ===== ОТЧЕТЫ =====
+
+    def snapshot(self, memory=True):
+        return {
+            "loop_lag_ms": {
+                "last": round(self.lags[-1] * 1000, 2) if self.lags else 0.0,
+                "p50": round(self.lag_percentile(0.5) * 1000, 2),
+                "p99": round(self.lag_percentile(0.99) * 1000, 2),
+                "max": round(self.max_lag * 1000, 2),
+            },
+            "stalls": self.stall_count,
+            "last_stall": {
+                "at": self.stalls[-1][0],
+                "seconds": round(self.stalls[-1][1], 3),
+                "stack": self.stalls[-1][2],
+            } if self.stalls else None,
+            "tasks": self.task_inventory(),
+            "gateway": self.gateway.snapshot(),
+            "memory": self.memory_top() if memory else None,
+        }
+
+    def format_report(self, limit=1900):
+        """Краткий текстовый отчет для команды владельца"""
+        data = self.snapshot()
+        lag = data["loop_lag_ms"]
+        lines = [
+            f"Задержка цикла: сейчас {lag['last']} мс, p50 {lag['p50']} мс, "
+            f"p99 {lag['p99']} мс, максимум {lag['max']} мс",
+            f"Зависаний дольше {self.stall_threshold} сек: {data['stalls']}",
+        ]
+        if data["last_stall"]:
+            stack_tail = data["last_stall"]["stack"].strip().splitlines()[-4:]
+            lines.append(f"Последнее: {data['last_stall']['seconds']} сек")
+            lines.extend(stack_tail)
+        gateway = data["gateway"]
+        lines.append(
+            f"Шлюз: {gateway['events_per_min']} событий/мин"
+            + (f", {gateway['kb_per_min']} КБ/мин" if gateway["bytes"] else "")
+            + f", память процесса {gateway['rss_mb']} МБ"
+        )
+        lines.extend(f"  {count:>6}  {name}" for name, count in gateway["top_events"].items())
+        lines.append(f"Задачи asyncio ({sum(data['tasks'].values())}):")
+        lines.extend(f"  {count:>4}  {name}" for name, count in data["tasks"].items())
+        if data["memory"] is not None:
+            lines.append("Память (tracemalloc):")
+            lines.extend(
+                f"  {item['size_kb']:>8} КБ  {item['count']:>6}  {item['location']}"
+                for item in data["memory"]
+            )
+        text = "\n".join(lines)
+        if len(text) > limit:
+            text = text[:limit - 1] + "…"
+        return text
@@ -1,77 +1,425 @@
+import time
+# Засечка до импорта тяжелых модулей — от нее считается разбивка времени запуска
+PROCESS_STARTED = time.perf_counter()
+
 import discord
 import asyncio
 from discord.ext import commands, tasks
-import time
 import logging
-import aiohttp
 import sys
-import random
-import string
 import os
+import json
+import hashlib
+import inspect
 from discord import app_commands
-from datetime import timedelta
+from datetime import timedelta, datetime, timezone
 from dotenv import load_dotenv
+from contract_store import ContractStore, OUTCOME_STARTED, OUTCOME_EMPTY, OUTCOME_CANCELLED
+from contract_record import ContractRecord
+from scheduler import Scheduler
+from user_cache import UserResolver
+from roster import RosterRenderer, CONTENT_LIMIT
+import metrics
+from keep_alive import StatusServer
+from diagnostics import Diagnostics, rss_bytes
+from log_setup import setup_logging, log_context
+from throttle import Throttle, parse_limit
+from reminders import ReminderAggregator
+from expiry import MessageExpiry
+from notifier import DMNotifier
+from connection import ConnectionSupervisor, ConnectionStats
+from recorder import TrafficRecorder
+import contract_actor
+from contract_actor import ContractActor, OPEN, CLOSING, CLOSED, CANCELLED
+from rest_queue import (
+    RestQueue, message_route, send_route, followup_route, CREATE_DM_ROUTE,
+    PRIORITY_INTERACTION, PRIORITY_ROSTER, PRIORITY_NOTIFY, PRIORITY_HOUSEKEEPING
+)
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
 # Получаем настройки из переменных окружения
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
-MAX_RETRIES = int(os.getenv('MAX_RETRIES', '5'))
+# Перезапуск подключения после падения bot.start(): задержка со случайным разбросом, без лимита попыток
+RECONNECT_BASE_DELAY = float(os.getenv('RECONNECT_BASE_DELAY', '1'))
+RECONNECT_MAX_DELAY = float(os.getenv('RECONNECT_MAX_DELAY', '300'))
 HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', '60.0'))
 GUILD_READY_TIMEOUT = float(os.getenv('GUILD_READY_TIMEOUT', '5.0'))
+EDIT_COALESCE_WINDOW = float(os.getenv('EDIT_COALESCE_WINDOW', '1.5'))
+CONTRACT_DB_PATH = os.getenv('CONTRACT_DB_PATH', 'contracts.db')
+STORE_FLUSH_INTERVAL = float(os.getenv('STORE_FLUSH_INTERVAL', '2.0'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '600'))
+USER_FETCH_CONCURRENCY = int(os.getenv('USER_FETCH_CONCURRENCY', '5'))
+REST_CONCURRENCY = int(os.getenv('REST_CONCURRENCY', '4'))
+# Напоминания одного канала в пределах окна (сек) объединяются в одно сообщение
+REMINDER_WINDOW = float(os.getenv('REMINDER_WINDOW', '5'))
+# Как часто сборщик удаляет сообщения с истекшим сроком (сек)
+EXPIRY_SWEEP_INTERVAL = float(os.getenv('EXPIRY_SWEEP_INTERVAL', '5'))
+# Личные уведомления при старте контракта: всем участникам, а не только автору
+DM_PARTICIPANTS = os.getenv('DM_PARTICIPANTS', 'true').lower() == 'true'
+DM_WORKERS = int(os.getenv('DM_WORKERS', '4'))
+DM_MAX_ATTEMPTS = int(os.getenv('DM_MAX_ATTEMPTS', '3'))
+JOIN_CONFIRM_FOLLOWUP = os.getenv('JOIN_CONFIRM_FOLLOWUP', 'false').lower() == 'true'
+STATUS_SERVER_ENABLED = os.getenv('STATUS_SERVER', 'true').lower() == 'true'
+STATUS_PORT = int(os.getenv('PORT', '8080'))
+HEALTH_EVENT_TIMEOUT = float(os.getenv('HEALTH_EVENT_TIMEOUT', '120'))
+DIAGNOSTICS_ENABLED = os.getenv('DIAGNOSTICS', 'true').lower() == 'true'
+# Общий секрет для /diagnostics; пусто — маршрут не публикуется
+DIAGNOSTICS_TOKEN = os.getenv('DIAGNOSTICS_TOKEN', '')
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '1.0'))
+DIAG_TRACEMALLOC = os.getenv('DIAG_TRACEMALLOC', 'false').lower() == 'true'
+COMMAND_SYNC = os.getenv('COMMAND_SYNC', 'true').lower() == 'true'
+# Облегченный режим: только slash-команды и кнопки, без событий сообщений и лишних кэшей
+LEAN_MODE = os.getenv('LEAN_MODE', 'false').lower() == 'true'
+# Подсчет байт шлюза требует отладочных событий discord.py (чуть дороже)
+GATEWAY_BYTE_STATS = os.getenv('GATEWAY_BYTE_STATS', 'false').lower() == 'true'
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', 'false').lower() == 'true'
+# Запись трафика для benchmarks/replay.py: путь к файлу (пусто — выключено) и соль анонимизации ID
+RECORD_TRAFFIC = os.getenv('RECORD_TRAFFIC', '')
+RECORD_SALT = os.getenv('RECORD_SALT', '')
+# Шардинг: процессы запускает shard_supervisor.py, без SHARD_COUNT бот работает одним процессом
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_ID = int(os.getenv('SHARD_ID', '0')) if SHARD_COUNT else None
+# У каждого шарда свой файл: ротация одного файла из нескольких процессов ломается
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log' if SHARD_COUNT is None else f'bot-shard{SHARD_ID}.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', '5'))
+LOG_ROTATE_HOURS = float(os.getenv('LOG_ROTATE_HOURS', '24'))
+LOG_JSON = os.getenv('LOG_JSON', 'false').lower() == 'true'
+# Ограничение частоты действий: "N/S" — не больше N действий за S секунд
+THROTTLE_ENABLED = os.getenv('THROTTLE', 'true').lower() == 'true'
+THROTTLE_USER = parse_limit(os.getenv('THROTTLE_USER', '5/10'))
+THROTTLE_CHANNEL = parse_limit(os.getenv('THROTTLE_CHANNEL', '40/10'))
+THROTTLE_GUILD = parse_limit(os.getenv('THROTTLE_GUILD', '120/10'))
 
-# Настройка логирования с более подробной информацией
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
+# Логирование через очередь: диск, ротация и сжатие — в фоновом потоке
+log_pipeline = setup_logging(
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUPS,
+    rotate_interval=LOG_ROTATE_HOURS * 3600, json_lines=LOG_JSON
 )
 logger = logging.getLogger('discord.contract_bot')
 
-intents = discord.Intents.default()
-intents.message_content = True
+# Очередь исходящих запросов: приоритеты, темп по заголовкам rate limit, честность между гильдиями
+rest_queue = RestQueue(concurrency=REST_CONCURRENCY)
+
+# Корзины токенов перед всеми командами и кнопками
+throttle = Throttle({
+    "user": THROTTLE_USER,
+    "channel": THROTTLE_CHANNEL,
+    "guild": THROTTLE_GUILD,
+}) if THROTTLE_ENABLED else None
+
+async def admit_interaction(interaction):
+    """
+    False — действие сверх лимита: до обработчика оно не доходит, но без ответа
+    Discord показал бы "взаимодействие не удалось". Поэтому отвечаем одним
+    запросом: раз в окно — эфемерным предупреждением, иначе пустым defer() кнопки.
+    """
+    if throttle is None:
+        return True
+    scope = throttle.admit_interaction(interaction)
+    if scope is None:
+        return True
+    logger.debug("Действие отброшено ограничителем (%s)", scope,
+                 extra=log_context(guild=interaction.guild_id, user=interaction.user.id))
+    try:
+        # У slash-команды defer() оставил бы вечное "думает...", ей всегда отвечаем текстом
+        if interaction.type is not discord.InteractionType.component or throttle.notice_due(interaction.user.id):
+            await interaction.response.send_message(
+                "⏳ Слишком часто, попробуйте через несколько секунд", ephemeral=True
+            )
+        else:
+            await interaction.response.defer()
+    except discord.HTTPException as e:
+        logger.debug("Не удалось ответить на отброшенное действие: %s", e)
+    return False
+
+class ThrottledTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await admit_interaction(interaction)
+
+class ThrottledView(discord.ui.View):
+    """Базовый View: нажатия сверх лимита не доходят до обработчиков кнопок"""
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await admit_interaction(interaction)
+
+class CommandThrottled(commands.CheckFailure):
+    pass
+
+if LEAN_MODE:
+    # Взаимодействиям нужен только кэш гильдий и каналов; сообщения и участники не приходят
+    intents = discord.Intents.none()
+    intents.guilds = True
+    lean_options = {
+        "max_messages": None,  # Без кэша сообщений
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    lean_options = {}
 
 # Настройка бота с параметрами для лучшей стабильности
 bot = commands.Bot(
     command_prefix='!', 
     intents=intents,
     heartbeat_timeout=HEARTBEAT_TIMEOUT,  # Конфигурируемый таймаут heartbeat
-    guild_ready_timeout=GUILD_READY_TIMEOUT   # Конфигурируемый таймаут готовности гильдии
+    guild_ready_timeout=GUILD_READY_TIMEOUT,  # Конфигурируемый таймаут готовности гильдии
+    http_trace=rest_queue.trace_config(),  # Заголовки rate limit для очереди запросов
+    shard_id=SHARD_ID,
+    shard_count=SHARD_COUNT,
+    enable_debug_events=GATEWAY_BYTE_STATS,
+    tree_cls=ThrottledTree,
+    **lean_options
 )
 
+def owns_guild(guild_id):
+    """Принадлежит ли гильдия этому шарду (ЛС и записи без гильдии — шарду 0)"""
+    if not SHARD_COUNT:
+        return True
+    if guild_id is None:
+        return SHARD_ID == 0
+    return (guild_id >> 22) % SHARD_COUNT == SHARD_ID
+
 # Хранилище активных контрактов
-active_contracts = {}
-user_contracts = {}  # Для связи пользователя с его контрактом
-completed_contracts = {}  # Для хранения завершенных контрактов
+active_contracts = {}  # contract_id -> ContractRecord
+contract_views = {}  # contract_id -> ContractView
+user_contracts = {}  # Для связи пользователя с его контрактом (в хранилище — общая для шардов)
+
+# Постоянное хранилище: словари выше — рабочая копия, на диск пишем пакетами
+store = ContractStore(CONTRACT_DB_PATH, flush_interval=STORE_FLUSH_INTERVAL)
+contracts_restored = False
 
-def generate_custom_id():
-    """Генерирует уникальный custom_id для кнопок"""
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=16))
+# Все таймеры бота (напоминания, дедлайны, отложенные удаления) в одном планировщике
+scheduler = Scheduler()
 
-class CleanupView(discord.ui.View):
+# Сроки жизни временных сообщений хранятся в базе и переживают перезапуск
+expiry = MessageExpiry(bot, store, rest_queue, shard_id=SHARD_ID or 0, interval=EXPIRY_SWEEP_INTERVAL)
+
+# Время жизни опубликованного завершенного контракта и уведомления о закрытии
+COMPLETED_CONTRACT_TTL = 7200
+CLOSE_NOTICE_TTL = 300
+
+# Сводные напоминания по каналам поверх планировщика и очереди запросов
+reminders = ReminderAggregator(bot, scheduler, rest_queue, window=REMINDER_WINDOW, expiry=expiry)
+
+# Пользователи: кэш шлюза -> LRU с TTL -> параллельные запросы к API
+users = UserResolver(bot, USER_CACHE_SIZE, USER_CACHE_TTL, USER_FETCH_CONCURRENCY)
+
+# Виды таймеров, принадлежащих открытому контракту
+CONTRACT_TIMERS = ("reminder_5m", "reminder_2m", "deadline", "render")
+
+# Счетчики правок embed: сколько реально отправлено и сколько объединено
+render_stats = {"edits": 0, "coalesced": 0}
+
+# Этапы запуска до первого on_ready: (этап, perf_counter); None — отчет уже выведен
+startup_marks = []
+
+def mark_startup(stage):
+    if startup_marks is not None:
+        startup_marks.append((stage, time.perf_counter()))
+
+def report_startup():
+    global startup_marks
+    if startup_marks is None:
+        return
+    lines = []
+    previous = PROCESS_STARTED
+    for stage, moment in startup_marks:
+        lines.append(f"  {stage}: {moment - previous:.3f} сек")
+        previous = moment
+    logger.info(f"Запуск занял {previous - PROCESS_STARTED:.3f} сек:\n" + "\n".join(lines))
+    startup_marks = None
+
+# Задержка цикла, зависания со стеком, задачи asyncio и память
+diagnostics = Diagnostics(LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD, trace_memory=DIAG_TRACEMALLOC)
+
+# Анонимизированная запись входящего трафика — только по явному RECORD_TRAFFIC
+recorder = TrafficRecorder(RECORD_TRAFFIC, salt=RECORD_SALT or None, shard_id=SHARD_ID) if RECORD_TRAFFIC else None
+
+# Обрывы, RESUME, новые IDENTIFY и время восстановления подключения
+connection_stats = ConnectionStats()
+
+# Веб-сервер статуса работает в цикле событий бота
+status_server = StatusServer(
+    bot, port=STATUS_PORT, event_timeout=HEALTH_EVENT_TIMEOUT,
+    diagnostics=diagnostics if DIAGNOSTICS_ENABLED else None, connection=connection_stats,
+    diagnostics_token=DIAGNOSTICS_TOKEN
+)
+
+# Метрики состояния считаются только при запросе /metrics
+metrics.registry.gauge("active_contracts", "Открытые контракты", lambda: len(active_contracts))
+metrics.registry.gauge("pending_timers", "Таймеры в планировщике", lambda: len(scheduler))
+metrics.registry.gauge("rest_queue_pending", "Запросы REST в очереди", rest_queue.pending)
+metrics.registry.gauge("gateway_latency_seconds", "Задержка шлюза Discord", status_server.latency)
+metrics.registry.gauge(
+    "gateway_connection_events_total", "Подключение: disconnect, resume, identify, restart",
+    lambda: {
+        "disconnect": connection_stats.disconnects, "resume": connection_stats.resumes,
+        "identify": connection_stats.identifies, "restart": connection_stats.restarts,
+    }, "event"
+)
+metrics.registry.gauge(
+    "gateway_resume_seconds", "Последнее восстановление через RESUME",
+    lambda: connection_stats.resume_seconds[-1] if connection_stats.resume_seconds else None
+)
+metrics.registry.gauge(
+    "gateway_reconnect_seconds", "Последнее восстановление через новый IDENTIFY",
+    lambda: connection_stats.reconnect_seconds[-1] if connection_stats.reconnect_seconds else None
+)
+metrics.registry.collected_counter(
+    "rest_requests_total", "Ответы Discord REST по маршрутам",
+    lambda: dict(rest_queue.requests), "route"
+)
+metrics.registry.collected_counter(
+    "rest_ratelimited_total", "Ответы 429 по маршрутам",
+    lambda: dict(rest_queue.limited), "route"
+)
+metrics.registry.collected_counter(
+    "roster_edits_total", "Правки embed контрактов: sent — отправлено, coalesced — объединено окном",
+    lambda: {"sent": render_stats["edits"], "coalesced": render_stats["coalesced"]}, "result"
+)
+metrics.registry.gauge(
+    "loop_lag_seconds", "Последний замер задержки цикла событий",
+    lambda: diagnostics.lags[-1] if diagnostics.lags else None
+)
+metrics.registry.collected_counter(
+    "loop_stalls_total", "Зависания цикла событий дольше порога", lambda: diagnostics.stall_count
+)
+metrics.registry.gauge("asyncio_tasks", "Живые задачи asyncio", lambda: len(asyncio.all_tasks()))
+metrics.registry.collected_counter(
+    "gateway_events_total", "События шлюза по типам", lambda: dict(diagnostics.gateway.events), "type"
+)
+metrics.registry.collected_counter(
+    "gateway_bytes_total", "Распакованные байты шлюза (GATEWAY_BYTE_STATS)",
+    lambda: diagnostics.gateway.bytes if GATEWAY_BYTE_STATS else None
+)
+metrics.registry.gauge(
+    "contract_mailbox_depth", "Сообщения, ждущие в почтовых ящиках контрактов", lambda: contract_actor.queued
+)
+metrics.registry.collected_counter(
+    "contract_actor_messages_total", "Обработанные сообщения акторов контрактов",
+    lambda: dict(contract_actor.processed), "handler"
+)
+
+def contracts_by_state():
+    counts = dict.fromkeys((OPEN, CLOSING), 0)
+    for view in list(contract_views.values()):
+        counts[view.actor.state] = counts.get(view.actor.state, 0) + 1
+    return counts
+
+metrics.registry.gauge("contracts_by_state", "Контракты в рабочих словарях по состоянию актора", contracts_by_state, "state")
+metrics.registry.gauge("process_resident_memory_bytes", "Резидентная память процесса", rss_bytes)
+
+def contract_row(contract_id):
+    """Строка активного контракта для хранилища (None — контракт уже удален)"""
+    contract = active_contracts.get(contract_id)
+    return contract.to_row() if contract else None
+
+def persist_contract(contract_id):
+    """Отмечает контракт измененным; запись на диск произойдет при следующем сбросе"""
+    store.put("active_contracts", contract_id, lambda: contract_row(contract_id))
+
+def register_contract(record, view):
+    active_contracts[record.contract_id] = record
+    contract_views[record.contract_id] = view
+    user_contracts[record.creator] = record.contract_id
+
+async def claim_contract(user_id, contract_id):
+    """Один активный контракт на пользователя; без шардинга достаточно словаря в памяти"""
+    if SHARD_COUNT is None:
+        # Закрепление нужно только для восстановления — пишется вместе с остальной очередью
+        store.put("user_contracts", user_id, {
+            "user_id": user_id, "contract_id": contract_id, "shard_id": 0
+        })
+        return True
+    # Другие шарды видят только базу: захват атомарный, одной строкой
+    return await store.claim_user_contract(user_id, contract_id, SHARD_ID)
+
+def forget_contract(contract_id):
+    """Убирает контракт из рабочих словарей и хранилища активных"""
+    record = active_contracts.pop(contract_id, None)
+    contract_views.pop(contract_id, None)
+    if record and user_contracts.get(record.creator) == contract_id:
+        del user_contracts[record.creator]
+        store.release_user_contract(record.creator)
+    store.delete("active_contracts", contract_id)
+    return record
+
+async def send_dm(user, content=None, *, guild_id=None, **kwargs):
+    """Отправляет ЛС через очередь запросов и записывает ID сообщения в журнал ЛС"""
+    # Канал ЛС нужен заранее: темп отправки задают заголовки его собственного маршрута
+    channel = user.dm_channel
+    if channel is None:
+        channel = await rest_queue.submit(
+            user.create_dm, route=CREATE_DM_ROUTE, priority=PRIORITY_NOTIFY, guild_id=guild_id
+        )
+    message = await rest_queue.submit(
+        lambda: channel.send(content, **kwargs),
+        route=send_route(channel.id), priority=PRIORITY_NOTIFY, guild_id=guild_id
+    )
+    store.record_dm(user.id, message.channel.id, message.id)
+    return message
+
+# Рассылка ЛС ограниченным пулом; кнопка очистки — разметка постоянной CleanupView
+notifier = DMNotifier(
+    users, send_dm, store, scheduler, view_factory=lambda: cleanup_markup(),
+    workers=DM_WORKERS, max_attempts=DM_MAX_ATTEMPTS
+)
+metrics.registry.gauge("dm_queue_pending", "Личные уведомления в очереди рассылки", notifier.pending)
+
+async def send_transient(ctx, content, ttl=10, **kwargs):
+    """Ответ, который удалится через ttl секунд (срок хранится в базе, а не в задаче)"""
+    message = await ctx.send(content, **kwargs)
+    expiry.expire_message(message, ttl)
+    return message
+
+def cleanup_markup():
+    """Кнопка очистки для отправки: нажатие ловит постоянная CleanupView, сама копия не хранится"""
+    view = CleanupView()
+    view.stop()
+    return view
+
+# Постоянный custom_id: ЛС приходят на шард 0, а отправить сообщение с кнопкой мог любой шард
+CLEANUP_BUTTON_ID = "contract_bot:dm_cleanup"
+
+class CleanupView(ThrottledView):
+    """Одна постоянная View на процесс (setup_hook); в сообщения уходит cleanup_markup()"""
+    
     def __init__(self):
         super().__init__(timeout=None)  # Убираем таймаут полностью
         self.cleanup_button = discord.ui.Button(
             label="🧹 Очистить ЛС", 
             style=discord.ButtonStyle.danger,
-            custom_id=f"cleanup_btn_{generate_custom_id()}"
+            custom_id=CLEANUP_BUTTON_ID
         )
         self.cleanup_button.callback = self.execute_cleanup
         self.add_item(self.cleanup_button)
     
+    @staticmethod
+    def status(label, style):
+        """Кнопка-индикатор для правки сообщения; общую View не меняем — ее нажимают все"""
+        view = CleanupView()
+        view.cleanup_button.disabled = True
+        view.cleanup_button.label = label
+        view.cleanup_button.style = style
+        view.stop()  # Остановленная View не попадает в хранилище discord.py
+        return view
+    
+    @metrics.instrumented("cleanup_button")
     async def execute_cleanup(self, interaction):
         try:
             # Немедленно отключаем кнопку после нажатия
-            self.cleanup_button.disabled = True
-            self.cleanup_button.label = "🧹 Очистка..."
-            self.cleanup_button.style = discord.ButtonStyle.secondary
-            await interaction.response.edit_message(view=self)
+            await interaction.response.edit_message(
+                view=self.status("🧹 Очистка...", discord.ButtonStyle.secondary)
+            )
             
-            logger.info(f"Начало очистки ЛС для пользователя {interaction.user.id}")
+            logger.info("Начало очистки ЛС", extra=log_context(user=interaction.user.id))
             
             # Создаем DM-канал
             try:
@@ -89,38 +437,50 @@ class CleanupView(discord.ui.View):
                     pass
                 return
                 
-            # Получаем ID бота
-            bot_user_id = interaction.client.user.id
-            messages_to_delete = []
             deletion_errors = 0
             
-            # Собираем только свежие сообщения (до 14 дней)
-            async for message in dm_channel.history(limit=200):
-                if message.author.id == bot_user_id:
-                    messages_to_delete.append(message)
+            # Сообщения бота берем из журнала ЛС — без обхода истории
+            ledger = await store.dm_messages(user.id)
+            messages_to_delete = [dm_channel.get_partial_message(row["message_id"]) for row in ledger]
+            
+            # Сообщения, отправленные до появления журнала, ищем в истории один раз
+            if await store.dm_legacy_scan_needed(user.id):
+                bot_user_id = interaction.client.user.id
+                known_ids = {message.id for message in messages_to_delete}
+                ledger_started = datetime.fromtimestamp(store.dm_ledger_started, tz=timezone.utc)
+                before = discord.Object(id=discord.utils.time_snowflake(ledger_started))
+                async for message in dm_channel.history(limit=200, before=before):
+                    if message.author.id == bot_user_id and message.id not in known_ids:
+                        messages_to_delete.append(message)
+                store.mark_dm_legacy_scanned(user.id)
+            
+            # В DM-каналах удаляем сообщения ТОЛЬКО по одному; темп задает очередь запросов
+            route = message_route("DELETE", dm_channel.id)
+            results = await asyncio.gather(*(
+                rest_queue.submit(
+                    message.delete, route=route,
+                    priority=PRIORITY_HOUSEKEEPING, guild_id=f"dm-{user.id}"
+                )
+                for message in messages_to_delete
+            ), return_exceptions=True)
             
-            # В DM-каналах удаляем сообщения ТОЛЬКО по одному
             deleted_count = 0
-            for message in messages_to_delete:
-                try:
-                    await message.delete()
+            for message, result in zip(messages_to_delete, results):
+                if not isinstance(result, Exception):
                     deleted_count += 1
-                    # Задержка между удалениями для избежания rate limit
-                    await asyncio.sleep(0.5)
-                except discord.NotFound:
+                    store.forget_dm(message.id)
+                elif isinstance(result, discord.NotFound):
                     # Сообщение уже удалено
-                    pass
-                except discord.Forbidden:
+                    store.forget_dm(message.id)
+                elif isinstance(result, discord.Forbidden):
                     deletion_errors += 1
-                    logger.warning(f"Нет прав для удаления сообщения {message.id}")
-                except discord.HTTPException as e:
+                    logger.warning("Нет прав для удаления сообщения %s", message.id, extra=log_context(user=user.id))
+                elif isinstance(result, discord.HTTPException):
                     deletion_errors += 1
-                    logger.warning(f"Ошибка HTTP при удалении сообщения {message.id}: {e}")
-                    # Увеличиваем задержку при ошибках
-                    await asyncio.sleep(1.0)
-                except Exception as e:
+                    logger.warning("Ошибка HTTP при удалении сообщения %s: %s", message.id, result, extra=log_context(user=user.id))
+                else:
                     deletion_errors += 1
-                    logger.error(f"Неожиданная ошибка при удалении сообщения {message.id}: {e}")
+                    logger.error("Неожиданная ошибка при удалении сообщения %s: %s", message.id, result, extra=log_context(user=user.id))
             
             # Формируем результат
             result_msg = f"✅ Удалено сообщений: {deleted_count}"
@@ -130,21 +490,22 @@ class CleanupView(discord.ui.View):
             # Отправляем результат
             try:
                 # Обновляем оригинальное сообщение
-                self.cleanup_button.label = "✅ Готово"
-                self.cleanup_button.style = discord.ButtonStyle.success
-                await interaction.edit_original_response(view=self)
+                await interaction.edit_original_response(
+                    view=self.status("✅ Готово", discord.ButtonStyle.success)
+                )
                 
                 # Отправляем дополнительное уведомление
-                await interaction.followup.send(
-                    result_msg,
-                    ephemeral=True
+                await rest_queue.submit(
+                    lambda: interaction.followup.send(result_msg, ephemeral=True),
+                    route=followup_route(interaction), priority=PRIORITY_INTERACTION,
+                    guild_id=f"dm-{user.id}"
                 )
             except discord.NotFound:
                 # Если сообщение уже недоступно, отправляем в ЛС
                 try:
-                    await dm_channel.send(result_msg)
+                    await send_dm(user, result_msg, guild_id=f"dm-{user.id}")
                 except discord.Forbidden:
-                    logger.warning(f"Не удалось отправить результат пользователю {user.id}")
+                    logger.warning("Не удалось отправить результат очистки", extra=log_context(user=user.id))
         
         except Exception as e:
             logger.error(f"КРИТИЧЕСКАЯ ошибка очистки: {e}", exc_info=True)
@@ -156,100 +517,144 @@ class CleanupView(discord.ui.View):
             except:
                 pass
 
-class ContractView(discord.ui.View):
-    def __init__(self, bot, contract_id, channel, message):
-        super().__init__(timeout=600)  # 10 минут вместо 15
+class ContractView(ThrottledView):
+    def __init__(self, bot, contract_id, channel, start_time=None):
+        # При восстановлении после рестарта таймер продолжается с исходного старта
+        self.start_time = start_time or time.time()
+        elapsed = time.time() - self.start_time
+        # Таймаут 10 минут ведет планировщик, сам View без таймера
+        super().__init__(timeout=None)
         self.bot = bot
         self.contract_id = contract_id
         self.channel = channel
-        self.message = message
-        self.start_time = time.time()
-        self.reminder_5m = None
-        self.reminder_2m = None
+        # PartialMessageable знает только guild_id, обычный канал — объект гильдии
+        guild = getattr(channel, "guild", None)
+        self.guild_id = guild.id if guild else getattr(channel, "guild_id", None)
+        
+        # Все изменения состояния контракта идут по очереди через его актор
+        self.actor = ContractActor(contract_id)
+        
+        # Отложенная отрисовка: клики копятся, правка уходит раз в окно
+        self.render_requests = 0
+        self.rendering = False
+        # Сброшен, пока правка embed в полете: финальная правка ждет ее, чтобы не быть затертой
+        self.render_idle = asyncio.Event()
+        self.render_idle.set()
+        self.edits_sent = 0
+        self.coalesced_edits = 0
+        # Состав копится по чанкам, готовый embed кэшируется до изменений
+        self.roster = RosterRenderer()
         
         # Измененные таймеры для напоминаний
-        self.reminder_task_5m = asyncio.create_task(self.send_reminder(300, 5))  # Через 5 мин
-        self.reminder_task_2m = asyncio.create_task(self.send_reminder(480, 2))  # Через 8 мин (5+3)
+        if elapsed < 300:
+            scheduler.schedule((contract_id, "reminder_5m"), 300 - elapsed,
+                               lambda: self.send_reminder(5))  # Через 5 мин
+        if elapsed < 480:
+            scheduler.schedule((contract_id, "reminder_2m"), 480 - elapsed,
+                               lambda: self.send_reminder(2))  # Через 8 мин (5+3)
+        scheduler.schedule((contract_id, "deadline"), 600 - elapsed, self.close)
         
-    async def send_reminder(self, delay, minutes_left):
-        try:
-            await asyncio.sleep(delay)
-            if self.contract_id not in active_contracts:
-                return
-                
-            reminder_texts = {
-                5: "🚨 **СРОЧНО! Запись закрывается через 5 минут!**\n👉 @в организации\n🔥 **Не упусти контракт!**",
-                2: "🔥 **ПОСЛЕДНИЕ 2 МИНУТЫ ЗАПИСИ!**\n👉 @в организации\n🚨 **УСПЕЙ ПРИСОЕДИНИТЬСЯ ПРЯМО СЕЙЧАС!**"
-            }
-            
-            msg = await self.channel.send(reminder_texts[minutes_left])
-            if minutes_left == 5:
-                self.reminder_5m = msg
-            else:
-                self.reminder_2m = msg
-                
-        except asyncio.CancelledError:
+    async def send_reminder(self, minutes_left):
+        contract = active_contracts.get(self.contract_id)
+        if contract is None:
             return
-        except Exception as e:
-            logger.error(f"Ошибка отправки напоминания: {e}")
+        # Само сообщение отправит сводка канала вместе с соседними контрактами
+        reminders.add(
+            self.channel.id, self.guild_id, self.contract_id,
+            contract.creator, self.start_time + 600, minutes_left
+        )
 
-    async def delete_reminders(self):
-        try:
-            if self.reminder_5m:
-                await self.reminder_5m.delete()
-            if self.reminder_2m:
-                await self.reminder_2m.delete()
-        except discord.NotFound:
-            pass
-        except Exception as e:
-            logger.error(f"Ошибка удаления напоминаний: {e}")
+    def delete_reminders(self):
+        # Сводка перерисуется без контракта или удалится, если он был последним
+        reminders.remove(self.contract_id)
 
     def cancel_tasks(self):
-        if hasattr(self, 'reminder_task_5m') and not self.reminder_task_5m.done():
-            self.reminder_task_5m.cancel()
-        if hasattr(self, 'reminder_task_2m') and not self.reminder_task_2m.done():
-            self.reminder_task_2m.cancel()
+        scheduler.cancel_many(self.contract_id, CONTRACT_TIMERS)
+
+    def request_render(self):
+        """Помечает состав устаревшим; правка embed уйдет не чаще раза в EDIT_COALESCE_WINDOW"""
+        self.render_requests += 1
+        key = (self.contract_id, "render")
+        if not self.rendering and not scheduler.is_scheduled(key):
+            scheduler.schedule(key, EDIT_COALESCE_WINDOW, self.render)
+
+    async def render(self):
+        # Все клики за окно уходят одной правкой с актуальным составом
+        coalesced = self.render_requests - 1
+        self.render_requests = 0
+        self.coalesced_edits += coalesced
+        render_stats["coalesced"] += coalesced
+        self.rendering = True
+        self.render_idle.clear()
+        try:
+            await self.update_message()
+            self.edits_sent += 1
+            render_stats["edits"] += 1
+        finally:
+            self.rendering = False
+            self.render_idle.set()
+        # Клики, пришедшие во время правки, уйдут следующим окном
+        if self.render_requests and self.actor.is_open:
+            scheduler.schedule((self.contract_id, "render"), EDIT_COALESCE_WINDOW, self.render)
 
     @discord.ui.button(label="✅ Записаться", style=discord.ButtonStyle.green, custom_id="join_button")
+    @metrics.instrumented("join_button")
     async def join_button(self, interaction, button):
-        contract = active_contracts.get(self.contract_id)
-        if not contract:
+        user_id = interaction.user.id
+        # Закрытый контракт отвечаем сразу, не вставая в очередь актора
+        joined = await self.actor.call(self.apply_join, user_id) if self.actor.is_open else None
+        if joined is None:
             await interaction.response.send_message("❌ Запись на контракт уже завершена", ephemeral=True)
             return
-            
-        user_id = interaction.user.id
-        if user_id not in contract["participants"]:
-            contract["participants"].append(user_id)
-            await self.update_message(interaction)
-            await interaction.response.send_message("✅ Вы записаны на контракт!", ephemeral=True)
-        else:
+        if not joined:
             await interaction.response.send_message("⚠️ Вы уже записаны на этот контракт", ephemeral=True)
-    
-    async def update_message(self, interaction):
+            return
         contract = active_contracts[self.contract_id]
-        participants = contract["participants"]
-        message = contract["message"]
-        
-        embed = discord.Embed(
-            title="📢 Кто хочет подзаработать?",
-            description="📝 Идет запись на контракт!\n\n"
-                        f"Автор: <@{contract['creator']}>",
-            color=0x3498db
-        )
         
-        if participants:
-            participants_list = "\n".join([f"<@{uid}>" for uid in participants])
-            embed.add_field(
-                name=f"✅ Записалось ({len(participants)}):",
-                value=participants_list,
-                inline=False
-            )
+        message = interaction.message
+        if message is None or message.id != contract.message_id:
+            # Нажатие пришло не с сообщения контракта — подтверждаем, embed обновится пакетно
+            self.request_render()
+            await interaction.response.send_message("✅ Вы записаны на контракт!", ephemeral=True)
+            return
+        
+        # Один запрос и подтверждает нажатие, и обновляет состав на сообщении кнопки
+        if self.rendering:
+            # Правка в полете несет старый состав — после нее уйдет еще одна
+            self.request_render()
         else:
-            embed.add_field(
-                name="✅ Участники:",
-                value="Пока никто не записался",
-                inline=False
+            scheduler.cancel((self.contract_id, "render"))
+            self.render_requests = 0
+        try:
+            await interaction.response.edit_message(embed=self.build_embed(contract), view=self)
+        except discord.HTTPException as e:
+            logger.warning("Не удалось обновить контракт ответом на нажатие: %s", e,
+                           extra=log_context(self.contract_id, self.guild_id, user_id))
+            self.request_render()
+            return
+        
+        if JOIN_CONFIRM_FOLLOWUP:
+            rest_queue.submit_background(
+                lambda: interaction.followup.send("✅ Вы записаны на контракт!", ephemeral=True),
+                route=followup_route(interaction), priority=PRIORITY_INTERACTION,
+                guild_id=contract.guild_id
             )
+    
+    def apply_join(self, user_id):
+        """Сообщение актора: None — запись закрыта, False — уже записан, True — записан"""
+        contract = active_contracts.get(self.contract_id)
+        if not self.actor.is_open or contract is None:
+            return None
+        if not contract.add_participant(user_id):
+            return False
+        persist_contract(self.contract_id)
+        # Горячий путь: при выключенном DEBUG запись отбрасывается до форматирования
+        logger.debug("Запись на контракт, участников %d", len(contract),
+                     extra=log_context(self.contract_id, contract.guild_id, user_id))
+        return True
+    
+    def build_embed(self, contract):
+        self.roster.sync(contract.participants)
         
         # Обновленное время до закрытия (10 минут)
         elapsed_time = time.time() - self.start_time
@@ -261,38 +666,109 @@ class ContractView(discord.ui.View):
             time_display = f"{minutes_left} мин {seconds_left} сек"
         else:
             time_display = f"{seconds_left} сек"
-            
-        embed.set_footer(text=f"Запись закроется через {time_display}")
+        
+        def base_embed():
+            embed = discord.Embed(
+                title="📢 Кто хочет подзаработать?",
+                description="📝 Идет запись на контракт!\n\n"
+                            f"Автор: <@{contract.creator}>",
+                color=0x3498db
+            )
+            embed.set_footer(text=f"Запись закроется через {time_display}")
+            return embed
+        
+        return self.roster.embed(time_display, base_embed)
+    
+    async def update_message(self):
+        contract = active_contracts.get(self.contract_id)
+        message = contract.partial_message(self.bot) if contract else None
+        if message is None or not self.actor.is_open:
+            return
+        embed = self.build_embed(contract)
         
         try:
-            await message.edit(embed=embed, view=self)
+            await rest_queue.submit(
+                lambda: message.edit(embed=embed, view=self),
+                route=message_route("PATCH", contract.channel_id),
+                priority=PRIORITY_ROSTER, guild_id=contract.guild_id
+            )
         except discord.HTTPException as e:
-            logger.error(f"Ошибка обновления сообщения: {e}")
+            logger.error("Ошибка обновления сообщения: %s", e, extra=log_context(self.contract_id, self.guild_id))
     
-    async def on_timeout(self):
+    def begin_close(self):
+        """Сообщение актора: OPEN -> CLOSING; False, если контракт уже закрывается или отменен"""
+        contract = active_contracts.get(self.contract_id)
+        if contract is None or not self.actor.transition(OPEN, CLOSING):
+            return False
         self.cancel_tasks()
+        self.stop()
+        self.delete_reminders()
+        return True
+    
+    async def close(self):
+        """Закрывает запись (дедлайн или досрочно); повторный вызов ничего не делает"""
+        if not await self.actor.call(self.begin_close):
+            return False
+        try:
+            # Правка состава в полете не должна лечь поверх финального сообщения
+            await self.render_idle.wait()
+            await self.finish_close()
+        finally:
+            self.actor.state = CLOSED
+        return True
+    
+    def begin_cancel(self):
+        """Сообщение актора: OPEN -> CANCELLED, контракт сразу убирается из рабочих словарей"""
         contract = active_contracts.get(self.contract_id)
-        if not contract:
-            return
-            
-        message = contract["message"]
-        participants = contract["participants"]
-        creator_id = contract["creator"]
+        if contract is None or not self.actor.transition(OPEN, CANCELLED):
+            return None
+        self.cancel_tasks()
+        self.stop()
+        self.delete_reminders()
+        store.record_history(contract, OUTCOME_CANCELLED)
+        forget_contract(self.contract_id)
+        return contract
+    
+    async def cancel(self):
+        """Отмена автором: удаляет сообщение контракта; False, если запись уже закрывается"""
+        contract = await self.actor.call(self.begin_cancel)
+        if contract is None:
+            return False
+        await self.render_idle.wait()
+        message = contract.partial_message(self.bot)
+        if message:
+            try:
+                await rest_queue.submit(
+                    message.delete, route=message_route("DELETE", contract.channel_id),
+                    priority=PRIORITY_ROSTER, guild_id=contract.guild_id
+                )
+            except discord.HTTPException:
+                pass
+        return True
+    
+    async def finish_close(self):
+        contract = active_contracts[self.contract_id]
+        message = contract.partial_message(self.bot)
+        participants = contract.participant_ids()
+        creator_id = contract.creator
         
-        await self.delete_reminders()
+        if self.edits_sent or self.coalesced_edits:
+            logger.info(
+                "Контракт закрыт: правок embed %d, объединено %d",
+                self.edits_sent, self.coalesced_edits, extra=log_context(self.contract_id, self.guild_id)
+            )
         
-        # Формируем список участников для уведомлений
-        participants_list = "\n".join([f"<@{uid}>" for uid in participants]) if participants else "❌ Участников нет"
+        self.roster.sync(contract.participants)
         
         # Обновляем основное сообщение контракта
         try:
             if participants:
-                final_content = (
+                header = (
                     f"# 🚀 Контракт начал выполнение!\n"
                     f"**Автор:** <@{creator_id}>\n\n"
                     f"**Состав команды:**\n"
-                    f"{participants_list}"
                 )
+                final_content = header + self.roster.text(CONTENT_LIMIT - len(header))
                 
                 embed = discord.Embed(
                     title="✅ Контракт запущен!",
@@ -307,66 +783,67 @@ class ContractView(discord.ui.View):
                     color=0xff0000
                 )
             
-            await message.edit(content=final_content, embed=embed, view=None)
+            if message:
+                await rest_queue.submit(
+                    lambda: message.edit(content=final_content, embed=embed, view=None),
+                    route=message_route("PATCH", contract.channel_id),
+                    priority=PRIORITY_ROSTER, guild_id=contract.guild_id
+                )
         except discord.HTTPException as e:
-            logger.error(f"Ошибка обновления финального сообщения: {e}")
+            logger.error("Ошибка обновления финального сообщения: %s", e, extra=log_context(self.contract_id, self.guild_id))
         
         # ===== УВЕДОМЛЕНИЯ =====
-        try:
-            # Уведомление создателя в ЛС с кнопкой очистки
-            creator = await self.bot.fetch_user(creator_id)
-            cleanup_view = CleanupView()
-            
-            await creator.send(
-                "⏱️ **Запись на ваш контракт завершена!**\n"
-                f"**Состав команды:**\n{participants_list}\n"
-                f"Создайте контракт и добавьте людей для выполнения!",
-                view=cleanup_view
-            )
-            
-            # Задержка 30 секунд перед отправкой уведомления в канал
-            await asyncio.sleep(30)
-            
-            # Уведомление в канал для остальных
-            notification = await self.channel.send(
-                "⛔ **Запись на контракт закрыта!**\n"
-                "👉 @в организации\n"
-                "🔥 Кто не успел — тот опоздал! 😉"
+        # Уведомление в канал через 30 секунд — не зависит от доставки ЛС
+        scheduler.schedule((self.contract_id, "notice"), 30, self.send_close_notice)
+        
+        # ЛС только ставятся в очередь рассылки: завершение их не ждет
+        header = "⏱️ **Запись на ваш контракт завершена!**\n**Состав команды:**\n"
+        footer = "\nСоздайте контракт и добавьте людей для выполнения!"
+        if participants:
+            participants_list = self.roster.text(CONTENT_LIMIT - len(header) - len(footer))
+        else:
+            participants_list = "❌ Участников нет"
+        notifier.notify(creator_id, header + participants_list + footer, guild_id=contract.guild_id)
+        
+        if DM_PARTICIPANTS:
+            header = f"🚀 **Контракт от <@{creator_id}> начал выполнение!**\n**Состав команды:**\n"
+            notifier.notify_many(
+                (user_id for user_id in participants if user_id != creator_id),
+                header + self.roster.text(CONTENT_LIMIT - len(header)),
+                guild_id=contract.guild_id
             )
-            
-            # Автоматическое удаление через 5 минут
-            async def delete_notification():
-                await asyncio.sleep(300)
-                try:
-                    await notification.delete()
-                except Exception as e:
-                    logger.error(f"Ошибка удаления уведомления: {e}")
-                    
-            asyncio.create_task(delete_notification())
-            
-        except discord.Forbidden:
-            logger.warning(f"Не удалось отправить уведомление создателю {creator_id}")
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомлений: {e}")
         # ===== КОНЕЦ УВЕДОМЛЕНИЙ =====
         
-        # Перенос в завершенные контракты
-        completed_contracts[self.contract_id] = {
-            "message_id": message.id,
-            "channel_id": message.channel.id,
-            "start_time": time.time()
-        }
+        # Завершенный контракт висит в канале два часа, затем его удалит сборщик
+        if message:
+            expiry.expire(contract.channel_id, message.id, COMPLETED_CONTRACT_TTL, contract.guild_id)
+        
+        # История и статистика обновляются при следующем сбросе хранилища
+        store.record_history(contract, OUTCOME_STARTED if participants else OUTCOME_EMPTY)
         
         # Очистка активных данных
-        if self.contract_id in active_contracts:
-            if creator_id in user_contracts:
-                del user_contracts[creator_id]
-            del active_contracts[self.contract_id]
+        forget_contract(self.contract_id)
+
+    async def send_close_notice(self):
+        # Уведомление в канал для остальных
+        notification = await rest_queue.submit(
+            lambda: self.channel.send(
+                "⛔ **Запись на контракт закрыта!**\n"
+                "👉 @в организации\n"
+                "🔥 Кто не успел — тот опоздал! 😉"
+            ),
+            route=send_route(self.channel.id), priority=PRIORITY_NOTIFY,
+            guild_id=self.guild_id
+        )
+        
+        # Автоматическое удаление через 5 минут, в том числе после перезапуска
+        expiry.expire(self.channel.id, notification.id, CLOSE_NOTICE_TTL, self.guild_id)
 
 # ===== SLASH КОМАНДЫ (ПОЯВЯТСЯ В ИНТЕРФЕЙСЕ DISCORD) =====
 
 @bot.tree.command(name="старт", description="Создать запись на контракт")
 @app_commands.guild_only()  # Команда доступна только на серверах
+@metrics.instrumented("/старт")
 async def start_slash(interaction: discord.Interaction):
     """Slash команда для создания контракта"""
     # Блокировка команды в ЛС
@@ -384,16 +861,18 @@ async def start_slash(interaction: discord.Interaction):
         
     contract_id = f"{interaction.channel.id}-{interaction.id}"
     
-    # Создаем view
-    view = ContractView(bot, contract_id, interaction.channel, None)
+    # Один активный контракт на пользователя во всех шардах
+    if not await claim_contract(interaction.user.id, contract_id):
+        await interaction.response.send_message("❌ У вас уже есть активный контракт!", ephemeral=True)
+        return
     
-    active_contracts[contract_id] = {
-        "creator": interaction.user.id,
-        "participants": [interaction.user.id],
-        "message": None,
-        "view": view
-    }
-    user_contracts[interaction.user.id] = contract_id
+    # Создаем view
+    view = ContractView(bot, contract_id, interaction.channel)
+    record = ContractRecord(
+        contract_id, interaction.user.id, interaction.channel.id,
+        interaction.guild_id, start_time=view.start_time
+    )
+    register_contract(record, view)
     
     embed = discord.Embed(
         title="📢 Кто хочет подзаработать?",
@@ -411,29 +890,47 @@ async def start_slash(interaction: discord.Interaction):
     embed.set_footer(text="Запись закроется через 10 минут")
     
     try:
-        await interaction.response.send_message(embed=embed, view=view)
-        msg = await interaction.original_response()
+        callback = await interaction.response.send_message(embed=embed, view=view)
+        # discord.py 2.5+ возвращает ID сообщения сразу, без отдельного запроса
+        message_id = getattr(callback, "message_id", None)
+        if message_id is None:
+            message_id = (await interaction.original_response()).id
         
         # Обновляем ссылки
-        active_contracts[contract_id]["message"] = msg
-        view.message = msg
+        record.message_id = message_id
+        persist_contract(contract_id)
+        logger.info("Создан контракт", extra=log_context(contract_id, interaction.guild_id, interaction.user.id))
     except discord.HTTPException as e:
         logger.error(f"Ошибка создания контракта: {e}")
         await interaction.response.send_message("❌ Произошла ошибка при создании контракта", ephemeral=True)
 
 @bot.tree.command(name="очистить", description="Очистить ЛС от сообщений бота")
-@app_commands.guild_only()  # Команда доступна только на серверах
+@metrics.instrumented("/очистить")
 async def cleanup_slash(interaction: discord.Interaction):
-    """Только для использования на серверах"""
-    await interaction.response.send_message(
-        "❌ Используйте эту команду в личных сообщениях бота!",
-        ephemeral=True
+    """В ЛС показывает кнопку очистки (замена !очистить для облегченного режима)"""
+    if interaction.guild is not None:
+        await interaction.response.send_message(
+            "❌ Используйте эту команду в личных сообщениях бота!",
+            ephemeral=True
+        )
+        return
+    
+    callback = await interaction.response.send_message(
+        "🧹 **Очистка сообщений**\nНажмите кнопку ниже чтобы удалить все мои сообщения",
+        view=cleanup_markup()
     )
+    # discord.py до 2.5 не возвращает ответ — ID берем отдельным запросом
+    message_id = getattr(callback, "message_id", None)
+    if message_id is None:
+        message_id = (await interaction.original_response()).id
+    # Сообщение ответа живет в ЛС и должно удаляться вместе с остальными
+    store.record_dm(interaction.user.id, interaction.channel_id, message_id)
 
 # ===== ОБЫЧНЫЕ КОМАНДЫ (ОСТАВЛЯЕМ ДЛЯ СОВМЕСТИМОСТИ) =====
 
 # Создать контракт
 @bot.command(name='с', aliases=['c'])
+@metrics.instrumented("!с")
 async def start_contract(ctx):
     try:
         await ctx.message.delete()
@@ -441,21 +938,23 @@ async def start_contract(ctx):
         pass
     
     if ctx.author.id in user_contracts:
-        msg = await ctx.send("❌ У вас уже есть активный контракт!", delete_after=10)
+        await send_transient(ctx, "❌ У вас уже есть активный контракт!", ttl=10)
         return
         
     contract_id = f"{ctx.channel.id}-{ctx.message.id}"
     
-    # Создаем view
-    view = ContractView(bot, contract_id, ctx.channel, None)
+    # Один активный контракт на пользователя во всех шардах
+    if not await claim_contract(ctx.author.id, contract_id):
+        await send_transient(ctx, "❌ У вас уже есть активный контракт!", ttl=10)
+        return
     
-    active_contracts[contract_id] = {
-        "creator": ctx.author.id,
-        "participants": [ctx.author.id],
-        "message": None,
-        "view": view  # Сохраняем view в контракте
-    }
-    user_contracts[ctx.author.id] = contract_id
+    # Создаем view
+    view = ContractView(bot, contract_id, ctx.channel)
+    record = ContractRecord(
+        contract_id, ctx.author.id, ctx.channel.id,
+        ctx.guild.id if ctx.guild else None, start_time=view.start_time
+    )
+    register_contract(record, view)
     
     embed = discord.Embed(
         title="📢 Кто хочет подзаработать?",
@@ -474,111 +973,269 @@ async def start_contract(ctx):
         msg = await ctx.send(embed=embed, view=view)
         
         # Обновляем ссылки
-        active_contracts[contract_id]["message"] = msg
-        view.message = msg
+        record.message_id = msg.id
+        persist_contract(contract_id)
+        logger.info("Создан контракт", extra=log_context(contract_id, record.guild_id, ctx.author.id))
     except discord.HTTPException as e:
         logger.error(f"Ошибка создания контракта: {e}")
-        await ctx.send("❌ Произошла ошибка при создании контракта", delete_after=10)
+        await send_transient(ctx, "❌ Произошла ошибка при создании контракта", ttl=10)
 
 # Отменить контракт
 @bot.command(name='о', aliases=['o'])
+@metrics.instrumented("!о")
 async def cancel_contract(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
     
-    if ctx.author.id not in user_contracts:
-        await ctx.send("❌ У вас нет активных контрактов!", delete_after=10)
-        return
-        
-    contract_id = user_contracts[ctx.author.id]
-    contract = active_contracts.get(contract_id)
-    
-    if contract:
-        # Используем сохранённый view
-        if "view" in contract and contract["view"]:
-            view = contract["view"]
-            view.cancel_tasks()
-            await view.delete_reminders()
+    await send_transient(ctx, await cancel_user_contract(ctx.author.id), ttl=10)
+
+async def cancel_user_contract(user_id):
+    """Отменяет контракт пользователя и удаляет его сообщение; возвращает ответ пользователю"""
+    if user_id not in user_contracts:
+        return "❌ У вас нет активных контрактов!"
         
-        try:
-            if contract["message"]:
-                await contract["message"].delete()
-        except:
-            pass
-        del active_contracts[contract_id]
+    contract_id = user_contracts[user_id]
+    view = contract_views.get(contract_id)
+    if view is None:
+        forget_contract(contract_id)
+        user_contracts.pop(user_id, None)
+        return "✅ Запись на контракт отменена!"
     
-    del user_contracts[ctx.author.id]
-    await ctx.send("✅ Запись на контракт отменена!", delete_after=10)
+    if not await view.cancel():
+        return "⏳ Запись на этот контракт уже закрывается"
+    return "✅ Запись на контракт отменена!"
 
 # Завершить запись
 @bot.command(name='з', aliases=['z'])
+@metrics.instrumented("!з")
 async def close_contract(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
     
-    if ctx.author.id not in user_contracts:
-        await ctx.send("❌ У вас нет активных контрактов!", delete_after=10)
-        return
+    await send_transient(ctx, await close_user_contract(ctx.author.id), ttl=10)
+
+async def close_user_contract(user_id):
+    """Досрочно закрывает запись на контракт пользователя; возвращает ответ пользователю"""
+    if user_id not in user_contracts:
+        return "❌ У вас нет активных контрактов!"
         
-    contract_id = user_contracts[ctx.author.id]
+    contract_id = user_contracts[user_id]
     contract = active_contracts.get(contract_id)
     
     if not contract:
-        await ctx.send("❌ Контракт не найден!", delete_after=10)
-        return
+        return "❌ Контракт не найден!"
     
     # Используем сохранённый view
-    if "view" in contract and contract["view"]:
-        view = contract["view"]
-        view.timeout = 0
-        await view.on_timeout()
+    view = contract_views.get(contract_id)
+    if view and not await view.close():
+        return "⏳ Запись на этот контракт уже закрывается"
     
-    del user_contracts[ctx.author.id]
-    await ctx.send("✅ Запись на контракт завершена досрочно!", delete_after=10)
+    user_contracts.pop(user_id, None)
+    return "✅ Запись на контракт завершена досрочно!"
 
 # Список контрактов
 @bot.command(name='л', aliases=['l'])
+@metrics.instrumented("!л")
 async def list_contracts(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
     
-    if not active_contracts:
-        await ctx.send("ℹ️ Активных записей на контракты нет", delete_after=15)
+    embed = await active_contracts_embed()
+    if embed is None:
+        await send_transient(ctx, "ℹ️ Активных записей на контракты нет", ttl=15)
         return
+    await ctx.send(embed=embed)
+
+async def active_contracts_embed():
+    """Embed со списком открытых контрактов (None, если их нет)"""
+    if not active_contracts:
+        return None
         
     embed = discord.Embed(
         title="📋 Активные записи на контракты",
         color=0x3498db
     )
     
-    for contract_id, contract in active_contracts.items():
+    # Авторов получаем одним параллельным запросом вместо цепочки fetch_user
+    contracts = list(active_contracts.items())
+    creators = await users.resolve_many(contract.creator for _, contract in contracts)
+    
+    for contract_id, contract in contracts:
         try:
-            creator = await bot.fetch_user(contract["creator"])
-            participants = contract["participants"]
-            time_left = "Неизвестно"
-            if "view" in contract and contract["view"]:
-                elapsed = time.time() - contract["view"].start_time
-                remaining = max(0, 600 - elapsed)  # 10 минут
-                time_left = f"{int(remaining // 60)} мин"
+            creator = creators.get(contract.creator)
+            creator_name = creator.display_name if creator else f"<@{contract.creator}>"
+            time_left = f"{int(contract.time_left() // 60)} мин"  # 10 минут
             
             embed.add_field(
-                name=f"Контракт от {creator.display_name}",
-                value=f"Участников: {len(participants)}\nОсталось: {time_left}",
+                name=f"Контракт от {creator_name}",
+                value=f"Участников: {len(contract)}\nОсталось: {time_left}",
                 inline=False
             )
         except Exception as e:
             logger.error(f"Ошибка получения информации о контракте {contract_id}: {e}")
     
-    await ctx.send(embed=embed)
+    return embed
+
+# ===== SLASH-ВЕРСИИ КОМАНД (ОБЛЕГЧЕННЫЙ РЕЖИМ РАБОТАЕТ ТОЛЬКО С НИМИ) =====
+
+@bot.tree.command(name="отмена", description="Отменить свою запись на контракт")
+@app_commands.guild_only()
+@metrics.instrumented("/отмена")
+async def cancel_slash(interaction: discord.Interaction):
+    # Удаление сообщений может ждать очередь запросов — сначала подтверждаем нажатие
+    await interaction.response.defer(ephemeral=True)
+    await interaction.followup.send(await cancel_user_contract(interaction.user.id), ephemeral=True)
+
+@bot.tree.command(name="завершить", description="Досрочно завершить запись на свой контракт")
+@app_commands.guild_only()
+@metrics.instrumented("/завершить")
+async def close_slash(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await interaction.followup.send(await close_user_contract(interaction.user.id), ephemeral=True)
+
+@bot.tree.command(name="список", description="Активные записи на контракты")
+@app_commands.guild_only()
+@metrics.instrumented("/список")
+async def list_slash(interaction: discord.Interaction):
+    await interaction.response.defer()
+    embed = await active_contracts_embed()
+    if embed is None:
+        await interaction.followup.send("ℹ️ Активных записей на контракты нет")
+    else:
+        await interaction.followup.send(embed=embed)
+
+# ===== СТАТИСТИКА И ИСТОРИЯ =====
+
+HISTORY_PAGE_SIZE = 10
+OUTCOME_LABELS = {
+    OUTCOME_STARTED: "🚀 запущен",
+    OUTCOME_EMPTY: "❌ без участников",
+    OUTCOME_CANCELLED: "🚫 отменен",
+}
+
+def stats_embed(guild, summary, days):
+    embed = discord.Embed(title=f"📊 Статистика контрактов — {guild.name}", color=0x3498db)
+    totals = summary["totals"]
+    if totals is None:
+        embed.description = "Завершенных контрактов пока нет"
+        return embed
+    embed.description = (
+        f"Всего контрактов: **{totals['contracts']}** "
+        f"(запущено {totals['started']}, отменено {totals['cancelled']})\n"
+        f"Записей участников: **{totals['joins']}**\n"
+        f"Первый: <t:{int(totals['first_at'])}:d>, последний: <t:{int(totals['last_at'])}:R>"
+    )
+    daily = "\n".join(
+        f"`{row['day']}` контрактов {row['contracts']}, записей {row['joins']}"
+        for row in summary["daily"]
+    )
+    embed.add_field(name=f"По дням (последние {days})", value=daily or "—", inline=False)
+    embed.add_field(
+        name="Чаще всех создают",
+        value="\n".join(f"<@{row['user_id']}> — {row['created']}" for row in summary["top_creators"]) or "—",
+        inline=True
+    )
+    embed.add_field(
+        name="Чаще всех записываются",
+        value="\n".join(f"<@{row['user_id']}> — {row['joined']}" for row in summary["top_joiners"]) or "—",
+        inline=True
+    )
+    return embed
+
+def history_embed(rows, member=None, page=1):
+    title = "📜 История контрактов" + (f" — {member.display_name}" if member else "")
+    embed = discord.Embed(title=title, color=0x3498db)
+    if not rows:
+        embed.description = "Записей больше нет" if page > 1 else "История пуста"
+        return embed
+    embed.description = "\n".join(
+        f"<t:{int(row['closed_at'])}:f> — <@{row['creator']}>, "
+        f"участников {row['participant_count']}, {OUTCOME_LABELS.get(row['outcome'], row['outcome'])}"
+        for row in rows
+    )
+    embed.set_footer(text=f"Страница {page}")
+    return embed
+
+class HistoryView(ThrottledView):
+    """Листает историю по курсору последней показанной строки"""
+    
+    def __init__(self, owner_id, guild_id, member=None):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.guild_id = guild_id
+        self.member = member
+        self.before = None
+        self.page = 0
+    
+    async def load_next(self):
+        rows = await store.history_page(
+            self.guild_id, self.member.id if self.member else None,
+            before=self.before, limit=HISTORY_PAGE_SIZE
+        )
+        self.page += 1
+        if rows:
+            self.before = (rows[-1]["closed_at"], rows[-1]["contract_id"])
+        # Неполная страница — последняя
+        self.next_button.disabled = len(rows) < HISTORY_PAGE_SIZE
+        return history_embed(rows, self.member, self.page)
+    
+    @discord.ui.button(label="Дальше ▶", style=discord.ButtonStyle.secondary)
+    @metrics.instrumented("history_next")
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Это не ваш запрос истории", ephemeral=True)
+            return
+        embed = await self.load_next()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+@bot.tree.command(name="статистика", description="Статистика контрактов сервера или участника")
+@app_commands.rename(member="участник", days="дней")
+@app_commands.describe(member="Показать статистику одного участника", days="Сколько последних дней показать")
+@app_commands.guild_only()
+@metrics.instrumented("/статистика")
+async def stats_slash(
+    interaction: discord.Interaction,
+    member: discord.Member = None,
+    days: app_commands.Range[int, 1, 30] = 7
+):
+    await interaction.response.defer(ephemeral=True)
+    if member is None:
+        summary = await store.guild_summary(interaction.guild_id, days=days)
+        await interaction.followup.send(embed=stats_embed(interaction.guild, summary, days), ephemeral=True)
+        return
+    
+    row = await store.user_summary(interaction.guild_id, member.id)
+    embed = discord.Embed(title=f"📊 Статистика — {member.display_name}", color=0x3498db)
+    if row is None:
+        embed.description = "Участник еще не создавал контракты и не записывался"
+    else:
+        embed.description = (
+            f"Создано контрактов: **{row['created']}**\n"
+            f"Записался в чужие: **{row['joined']}**\n"
+            f"Привел участников в свои: **{row['recruited']}**"
+        )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="история", description="История завершенных контрактов")
+@app_commands.rename(member="участник")
+@app_commands.describe(member="Только контракты, где участвовал этот пользователь")
+@app_commands.guild_only()
+@metrics.instrumented("/история")
+async def history_slash(interaction: discord.Interaction, member: discord.Member = None):
+    await interaction.response.defer(ephemeral=True)
+    view = HistoryView(interaction.user.id, interaction.guild_id, member)
+    embed = await view.load_next()
+    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
 # Команда для очистки ЛС (можно вызвать командой)
 @bot.command(name='очистить', aliases=['clear', 'clean'])
+@metrics.instrumented("!очистить")
 async def cleanup_dm(ctx):
     # Проверяем, что команда вызвана в ЛС
     if not isinstance(ctx.channel, discord.DMChannel):
@@ -586,180 +1243,283 @@ async def cleanup_dm(ctx):
             await ctx.message.delete()
         except:
             pass
-        await ctx.send("❌ Эта команда работает только в личных сообщениях!", delete_after=10)
+        await send_transient(ctx, "❌ Эта команда работает только в личных сообщениях!", ttl=10)
         return
     
     # Отправляем упрощенный интерфейс (только одну кнопку)
-    view = CleanupView()
+    view = cleanup_markup()
     try:
         msg = await ctx.send(
             "🧹 **Очистка сообщений**\nНажмите кнопку ниже чтобы удалить все мои сообщения",
             view=view
         )
+        store.record_dm(ctx.author.id, ctx.channel.id, msg.id)
         logger.info(f"Отправлено сообщение очистки для {ctx.author.id}: {msg.id}")
     except discord.Forbidden:
         logger.warning(f"Не удалось отправить сообщение очистки для {ctx.author.id}")
 
+# Ожидающие таймеры планировщика (только для владельца бота)
+@bot.command(name='таймеры', aliases=['timers'])
+@commands.is_owner()
+@metrics.instrumented("!таймеры")
+async def list_timers(ctx):
+    pending = scheduler.pending()
+    lines = [f"`{owner}` {kind}: {int(remaining)} сек" for (owner, kind), remaining in pending[:20]]
+    if len(pending) > 20:
+        lines.append(f"... и еще {len(pending) - 20}")
+    await send_transient(
+        ctx, f"⏱️ Ожидающих таймеров: {len(pending)}\n" + "\n".join(lines),
+        ttl=60
+    )
+
+# Диагностика цикла событий (только для владельца бота)
+@bot.command(name='диагностика', aliases=['diag'])
+@commands.is_owner()
+@metrics.instrumented("!диагностика")
+async def show_diagnostics(ctx):
+    await send_transient(ctx, f"```\n{diagnostics.format_report()}\n```", ttl=120)
+
 @tasks.loop(minutes=10)
-async def clean_old_contracts():
-    current_time = time.time()
-    to_remove = []
-    
-    contracts_to_check = list(completed_contracts.items())
+async def log_cache_stats():
+    logger.info(f"Статистика: {users.report()}")
+
+async def restore_contracts():
+    """Восстанавливает контракты из хранилища после перезапуска"""
+    restored = finalized = 0
+    for row in store.load_active():
+        if not owns_guild(row["guild_id"]):
+            continue  # Контракт другого шарда
+        record = ContractRecord.from_row(row)
+        if record.message_id is None:
+            # Бот упал до публикации сообщения — восстанавливать нечего
+            store.delete("active_contracts", record.contract_id)
+            continue
+        
+        # Канал без запроса к API: для отправки напоминаний достаточно ID
+        channel = bot.get_channel(record.channel_id) or bot.get_partial_messageable(
+            record.channel_id, guild_id=record.guild_id
+        )
+        view = ContractView(bot, record.contract_id, channel, start_time=record.start_time)
+        register_contract(record, view)
+        store.put("user_contracts", record.creator, {
+            "user_id": record.creator, "contract_id": record.contract_id, "shard_id": SHARD_ID or 0
+        })
+        
+        if time.time() - record.start_time >= 600:
+            # Срок записи истек, пока бот был выключен — дедлайн в планировщике сработает сразу
+            finalized += 1
+            continue
+        
+        # Переподключаем кнопку к существующему сообщению без запроса к API
+        bot.add_view(view, message_id=record.message_id)
+        restored += 1
     
-    for contract_id, contract in contracts_to_check:
-        if current_time - contract["start_time"] > 7200:
-            try:
-                channel = bot.get_channel(contract["channel_id"])
-                if channel is None:
-                    channel = await bot.fetch_channel(contract["channel_id"])
-                message = await channel.fetch_message(contract["message_id"])
-                await message.delete()
-                logger.info(f"Удалено сообщение контракта {contract_id}")
-            except discord.NotFound:
-                logger.info(f"Сообщение {contract['message_id']} уже удалено")
-            except discord.Forbidden:
-                logger.warning(f"Нет прав для удаления сообщения в канале {contract['channel_id']}")
-            except Exception as e:
-                logger.error(f"Ошибка при удалении контракта {contract_id}: {e}")
-            finally:
-                to_remove.append(contract_id)
+    pruned = store.prune_user_contracts(SHARD_ID or 0, set(active_contracts))
+    logger.info(
+        f"Восстановлено контрактов: {restored}, завершено после простоя: {finalized}, "
+        f"снято закреплений: {pruned}"
+    )
+
+@bot.event
+async def setup_hook():
+    mark_startup("вход в Discord (login)")
+    store.open()
+    store.start()
+    scheduler.start()
+    rest_queue.start()
+    expiry.start()
+    notifier.load()
+    notifier.start()
+    # Кнопка очистки ЛС работает на любом шарде и после перезапуска
+    bot.add_view(CleanupView())
+    if DIAGNOSTICS_ENABLED:
+        diagnostics.start()
+    if recorder is not None:
+        recorder.start()
+    if STATUS_SERVER_ENABLED:
+        await status_server.start()
+    mark_startup("хранилище, фоновые задачи, веб-сервер")
     
-    for contract_id in to_remove:
+    # Команды глобальные: синхронизирует один шард, а не каждое переподключение
+    if COMMAND_SYNC and owns_guild(None):
         try:
-            del completed_contracts[contract_id]
-            logger.info(f"Удалён контракт {contract_id} из хранилища")
-        except KeyError:
-            pass
+            await sync_commands()
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации slash команд: {e}")
+        mark_startup("синхронизация slash команд")
+
+def command_payload(command):
+    # discord.py 2.4+ передает в to_dict() дерево команд, 2.3 вызывает его без аргументов
+    if "tree" in inspect.signature(command.to_dict).parameters:
+        return command.to_dict(bot.tree)
+    return command.to_dict()
+
+async def sync_commands():
+    """Синхронизирует slash команды, только если дерево команд изменилось с прошлой синхронизации"""
+    payload = [command_payload(command) for command in bot.tree.get_commands()]
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+    key = f"command_tree_hash:{bot.application_id}"
+    if not FORCE_COMMAND_SYNC and store.get_meta(key) == digest:
+        logger.info("Slash команды не менялись, синхронизация пропущена")
+        return
+    synced = await bot.tree.sync()
+    store.set_meta(key, digest)
+    logger.info(f"Синхронизировано {len(synced)} slash команд")
+
+@bot.event
+async def on_connect():
+    mark_startup("подключение к шлюзу")
+
+@bot.event
+async def on_socket_event_type(event_type):
+    # Время последнего события шлюза для /health и счет событий по типам
+    status_server.mark_event()
+    diagnostics.gateway.on_event(event_type)
+    if recorder is not None:
+        recorder.record_event(event_type)
+
+if recorder is not None:
+    @bot.event
+    async def on_interaction(interaction):
+        recorder.record_interaction(interaction)
+
+if GATEWAY_BYTE_STATS:
+    @bot.event
+    async def on_socket_raw_receive(payload):
+        diagnostics.gateway.on_raw(payload)
 
 # Улучшенная обработка событий
 @bot.event
 async def on_ready():
+    connection_stats.on_ready()
+    if connection_stats.reconnect_seconds and connection_stats.identifies > 1:
+        logger.info(f"Новая сессия шлюза через {connection_stats.reconnect_seconds[-1]:.1f} сек после обрыва")
     logger.info(f"Бот {bot.user.name} готов! (ID: {bot.user.id})")
     logger.info(f"Подключен к {len(bot.guilds)} серверам")
+    if LEAN_MODE:
+        logger.info("Облегченный режим: только slash-команды и кнопки, кэши сообщений и участников отключены")
     
-    # Синхронизируем slash команды
-    try:
-        synced = await bot.tree.sync()
-        logger.info(f"Синхронизировано {len(synced)} slash команд")
-    except Exception as e:
-        logger.error(f"Ошибка синхронизации slash команд: {e}")
+    # Восстанавливаем контракты один раз, а не при каждом переподключении
+    global contracts_restored
+    if not contracts_restored:
+        contracts_restored = True
+        try:
+            await restore_contracts()
+        except Exception as e:
+            logger.error(f"Ошибка восстановления контрактов: {e}", exc_info=True)
+    
+    # Периодическая сводка кэша пользователей в лог
+    if not log_cache_stats.is_running():
+        log_cache_stats.start()
     
-    # Запускаем задачу очистки старых контрактов
-    if not clean_old_contracts.is_running():
-        clean_old_contracts.start()
+    mark_startup("первый on_ready (гильдии и восстановление контрактов)")
+    report_startup()
 
 @bot.event
 async def on_disconnect():
+    connection_stats.on_disconnect()
     logger.warning("Бот отключен от Discord")
 
 @bot.event
 async def on_resumed():
-    logger.info("Соединение с Discord восстановлено")
+    # Сессия продолжена: пропущенные события дошлет Discord, состояние бота не сбрасывается
+    connection_stats.on_resumed()
+    elapsed = connection_stats.resume_seconds[-1] if connection_stats.resume_seconds else 0
+    logger.info(f"Соединение с Discord восстановлено (RESUME) за {elapsed:.1f} сек")
+
+def reattach_views():
+    """После bot.clear() хранилище View пустое: возвращаем кнопки открытых контрактов"""
+    for contract_id, view in contract_views.items():
+        record = active_contracts.get(contract_id)
+        if record is not None and record.message_id is not None and view.actor.is_open:
+            bot.add_view(view, message_id=record.message_id)
 
 # Обработка ошибок подключения
 @bot.event
 async def on_error(event, *args, **kwargs):
     logger.error(f"Произошла ошибка в событии {event}: {args}", exc_info=True)
 
+# Команды с ! проходят через те же корзины, что и взаимодействия
+@bot.check
+async def throttle_commands(ctx):
+    if throttle is None:
+        return True
+    scope = throttle.admit(ctx.author.id, ctx.channel.id, ctx.guild.id if ctx.guild else None)
+    if scope is None:
+        return True
+    raise CommandThrottled(scope)
+
 # Обработка ошибок команд
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
         return  # Игнорируем неизвестные команды
+    elif isinstance(error, CommandThrottled):
+        logger.debug("Команда %s отброшена ограничителем (%s)", ctx.command, error,
+                     extra=log_context(guild=ctx.guild.id if ctx.guild else None, user=ctx.author.id))
+        return  # Спам гасим молча: ответ тоже стоил бы запроса
     elif isinstance(error, commands.MissingPermissions):
-        await ctx.send("❌ У вас нет прав для выполнения этой команды", delete_after=10)
+        await send_transient(ctx, "❌ У вас нет прав для выполнения этой команды", ttl=10)
+    elif isinstance(error, commands.NotOwner):
+        return  # Служебные команды молча игнорируем для остальных
     elif isinstance(error, commands.BotMissingPermissions):
-        await ctx.send("❌ У бота нет необходимых прав", delete_after=10)
+        await send_transient(ctx, "❌ У бота нет необходимых прав", ttl=10)
     else:
         logger.error(f"Ошибка команды {ctx.command}: {error}", exc_info=True)
-        await ctx.send("❌ Произошла ошибка при выполнении команды", delete_after=10)
+        await send_transient(ctx, "❌ Произошла ошибка при выполнении команды", ttl=10)
 
 # Функция для безопасного завершения работы
 async def shutdown():
     logger.info("Начинаем завершение работы бота...")
     
-    # Отменяем все активные задачи
-    for contract_id, contract in active_contracts.items():
-        if "view" in contract and contract["view"]:
-            contract["view"].cancel_tasks()
+    # Останавливаем все таймеры разом
+    scheduler.stop()
+    rest_queue.stop()
+    expiry.stop()
+    notifier.stop()
+    diagnostics.stop()
     
     # Останавливаем периодические задачи
-    if clean_old_contracts.is_running():
-        clean_old_contracts.stop()
+    if log_cache_stats.is_running():
+        log_cache_stats.stop()
+    
+    # Сбрасываем несохраненные изменения на диск
+    await store.close()
+    if recorder is not None:
+        await recorder.stop()
+    await status_server.stop()
     
     # Закрываем соединение с Discord
     await bot.close()
     logger.info("Бот завершил работу")
 
-# Запуск с улучшенной обработкой ошибок
+# Запуск под супервизором подключения
 async def main():
-    max_retries = MAX_RETRIES
-    retry_count = 0
+    discord_token = os.getenv('DISCORD_TOKEN')
+    if not discord_token:
+        logger.error("DISCORD_TOKEN не найден в переменных окружения!")
+        logger.error("Создайте файл .env и добавьте: DISCORD_TOKEN=ваш_токен")
+        return
     
-    while retry_count < max_retries:
-        try:
-            logger.info(f"Попытка запуска бота... (попытка {retry_count + 1}/{max_retries})")
-            
-            # Используем aiohttp.ClientTimeout для более точного контроля таймаутов
-            connector = aiohttp.TCPConnector(
-                limit=100,
-                limit_per_host=30,
-                ttl_dns_cache=300,
-                use_dns_cache=True,
-                keepalive_timeout=60,
-                enable_cleanup_closed=True
-            )
-            
-            timeout = aiohttp.ClientTimeout(total=30, connect=10)
-            
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=timeout
-            ) as session:
-                # Получаем токен из переменных окружения
-                discord_token = os.getenv('DISCORD_TOKEN')
-                if not discord_token:
-                    logger.error("DISCORD_TOKEN не найден в переменных окружения!")
-                    logger.error("Создайте файл .env и добавьте: DISCORD_TOKEN=ваш_токен")
-                    return
-                
-                # Запускаем бота с токеном из переменных окружения
-                await bot.start(discord_token)
-                
-        except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
-            retry_count += 1
-            wait_time = min(2 ** retry_count, 60)  # Экспоненциальная задержка, максимум 60 сек
-            
-            logger.error(f"Ошибка подключения: {e}")
-            
-            if retry_count < max_retries:
-                logger.info(f"Попытка переподключения через {wait_time} секунд...")
-                await asyncio.sleep(wait_time)
-            else:
-                logger.error("Достигнуто максимальное количество попыток подключения")
-                break
-                
-        except discord.LoginFailure:
-            logger.error("Ошибка авторизации: неверный токен")
-            break
-            
-        except KeyboardInterrupt:
-            logger.info("Получен сигнал завершения работы")
-            await shutdown()
-            break
-            
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка: {e}", exc_info=True)
-            retry_count += 1
-            
-            if retry_count < max_retries:
-                await asyncio.sleep(10)
-            else:
-                logger.error("Критическая ошибка, завершение работы")
-                break
+    supervisor = ConnectionSupervisor(
+        bot, discord_token, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY,
+        stats=connection_stats, on_restart=reattach_views
+    )
+    supervisor.install_signal_handlers()
+    try:
+        await supervisor.run()
+    except discord.LoginFailure:
+        logger.error("Ошибка авторизации: неверный токен")
+    except discord.PrivilegedIntentsRequired:
+        logger.error("Включите нужные привилегированные intents в Developer Portal")
+    finally:
+        supervisor.stop()
+        await shutdown()
 
-if __name__ == "__main__":
+def run():
+    """Точка входа: python discord_bot.py или import discord_bot; discord_bot.run()"""
     try:
         # Настройка для Windows для корректной работы с asyncio
         if sys.platform == 'win32':
@@ -769,4 +1529,12 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Программа завершена пользователем")
     except Exception as e:
-        logger.error(f"Критическая ошибка при запуске: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Критическая ошибка при запуске: {e}", exc_info=True)
+    finally:
+        # Дописываем очередь логов до выхода процесса
+        log_pipeline.stop()
+
+mark_startup("импорт модулей и инициализация")
+
+if __name__ == "__main__":
+    run()
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Постоянный реестр временных сообщений бота: ответы с ошибками, уведомления,
+напоминания и завершенные контракты. Срок жизни каждого сообщения лежит в
+SQLite (индекс по expires_at), поэтому таймеры переживают перезапуск.
+
+Сборщик раз в interval берет наступившие сроки, группирует их по каналу и
+удаляет пачкой через bulk delete, где Discord это разрешает (2–100
+сообщений моложе 14 дней в канале сервера), остальные — по одному по ID,
+без предварительного fetch_message.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+import discord
+
+import metrics
+from rest_queue import message_route, PRIORITY_HOUSEKEEPING
+
+logger = logging.getLogger('discord.contract_bot.expiry')
+
+BULK_DELETE_MAX = 100
+# Bulk delete отклоняет сообщения старше 14 дней; берем с запасом на рассинхрон часов
+BULK_DELETE_MAX_AGE = 14 * 86400 - 3600
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60
+
+deleted = metrics.registry.counter(
+    "expired_messages_total", "Удаление истекших сообщений: bulk, single, gone, failed", "result"
+)
+
+
+def bulk_delete_route(channel_id):
+    return f"POST /channels/{channel_id}/messages/bulk-delete"
+
+
+class MessageExpiry:
+    def __init__(self, bot, store, rest_queue, shard_id=0, interval=5.0, batch=500):
+        self.bot = bot
+        self.store = store
+        self.rest_queue = rest_queue
+        self.shard_id = shard_id
+        self.interval = interval
+        self.batch = batch
+        self.task = None
+
+    # ===== РЕГИСТРАЦИЯ =====
+
+    def expire(self, channel_id, message_id, ttl, guild_id=None):
+        """Сообщение будет удалено через ttl секунд, даже если бот перезапустится"""
+        self.store.put("message_expiry", message_id, {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "guild_id": guild_id,
+            "shard_id": self.shard_id,
+            "expires_at": time.time() + ttl,
+            "attempts": 0,
+        })
+
+    def expire_message(self, message, ttl):
+        guild = getattr(message, "guild", None)
+        self.expire(message.channel.id, message.id, ttl, guild.id if guild else None)
+
+    def forget(self, message_id):
+        """Сообщение удалено другим путем — срок больше не нужен"""
+        self.store.delete("message_expiry", message_id)
+
+    # ===== СБОРЩИК =====
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                # Пока сборщик догоняет отставание, следующую пачку берем сразу
+                while await self.sweep() >= self.batch:
+                    pass
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Ошибка сборщика истекших сообщений: {e}", exc_info=True)
+
+    async def sweep(self):
+        rows = await self.store.due_messages(self.shard_id, time.time(), self.batch)
+        by_channel = defaultdict(list)
+        for row in rows:
+            by_channel[row["channel_id"]].append(row)
+        await asyncio.gather(*(self.delete_channel(rows) for rows in by_channel.values()))
+        return len(rows)
+
+    async def delete_channel(self, rows):
+        channel_id = rows[0]["channel_id"]
+        guild_id = rows[0]["guild_id"]
+        now = time.time()
+        bulk, single = [], []
+        for row in rows:
+            age = now - discord.utils.snowflake_time(row["message_id"]).timestamp()
+            # В ЛС bulk delete недоступен
+            (bulk if guild_id is not None and age < BULK_DELETE_MAX_AGE else single).append(row)
+        if len(bulk) < 2:
+            single.extend(bulk)
+            bulk = []
+
+        for start in range(0, len(bulk), BULK_DELETE_MAX):
+            chunk = bulk[start:start + BULK_DELETE_MAX]
+            if len(chunk) == 1:
+                single.extend(chunk)
+                continue
+            ids = [row["message_id"] for row in chunk]
+            try:
+                await self.rest_queue.submit(
+                    lambda: self.bot.http.delete_messages(channel_id, ids),
+                    route=bulk_delete_route(channel_id),
+                    priority=PRIORITY_HOUSEKEEPING, guild_id=guild_id
+                )
+                deleted.inc("bulk", len(chunk))
+                self.done(chunk)
+            except discord.HTTPException as e:
+                # Например, часть сообщений уже удалена вручную — добиваем по одному
+                logger.debug("Bulk delete в канале %s не прошел (%s), удаляем по одному", channel_id, e)
+                single.extend(chunk)
+
+        channel = self.bot.get_partial_messageable(channel_id, guild_id=guild_id)
+        for row in single:
+            try:
+                await self.rest_queue.submit(
+                    channel.get_partial_message(row["message_id"]).delete,
+                    route=message_route("DELETE", channel_id),
+                    priority=PRIORITY_HOUSEKEEPING, guild_id=guild_id
+                )
+                deleted.inc("single")
+                self.done((row,))
+            except (discord.NotFound, discord.Forbidden):
+                deleted.inc("gone")
+                self.done((row,))
+            except Exception as e:
+                self.retry(row, e)
+
+    def done(self, rows):
+        for row in rows:
+            self.store.delete("message_expiry", row["message_id"])
+
+    def retry(self, row, error):
+        attempts = row["attempts"] + 1
+        if attempts >= MAX_ATTEMPTS:
+            deleted.inc("failed")
+            logger.warning(f"Не удалось удалить сообщение {row['message_id']} в канале {row['channel_id']}: {error}")
+            self.done((row,))
+            return
+        self.store.put("message_expiry", row["message_id"], {
+            **row, "expires_at": time.time() + RETRY_DELAY * attempts, "attempts": attempts
+        })
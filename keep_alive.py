@@ -1,62 +1,140 @@
 """
-Модуль для поддержания бота в активном состоянии в Replit
-Создает простой веб-сервер для пингования
+Веб-сервер статуса бота для Replit и мониторинга.
+Работает на aiohttp в том же цикле событий, что и бот, поэтому /health
+отражает реальное состояние подключения к Discord.
 """
 
-from flask import Flask
-from threading import Thread
+import hmac
+import logging
 import time
-import os
-
-app = Flask('')
-
-@app.route('/')
-def home():
-    return """
-    <html>
-    <head>
-        <title>Discord Contract Bot 3.0 - Status</title>
-        <meta charset="utf-8">
-    </head>
-    <body style="font-family: Arial; background: #2c2f33; color: #ffffff; text-align: center; padding: 50px;">
-        <h1>🤖 Discord Contract Bot 3.0</h1>
-        <h2 style="color: #7289da;">✅ Бот активен и работает!</h2>
-        <p>Время работы: <span id="time"></span></p>
-        <p>Статус: <span style="color: #43b581;">🟢 Онлайн</span></p>
-        <hr style="border-color: #7289da;">
-        <p>Для поддержания активности используйте UptimeRobot</p>
-        <p>Пингуйте этот URL каждые 5 минут</p>
-        
-        <script>
-            function updateTime() {
-                const now = new Date();
-                document.getElementById('time').textContent = now.toLocaleString('ru-RU');
-            }
-            updateTime();
-            setInterval(updateTime, 1000);
-        </script>
-    </body>
-    </html>
-    """
-
-@app.route('/ping')
-def ping():
-    return {'status': 'alive', 'timestamp': time.time(), 'message': 'Bot is running!'}
-
-@app.route('/health')
-def health():
-    return {'status': 'healthy', 'uptime': time.time()}
-
-def run():
-    """Запуск веб-сервера в отдельном потоке"""
-    port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
-
-def keep_alive():
-    """Функция для поддержания активности бота"""
-    print("🌐 Запуск веб-сервера для поддержания активности...")
-    t = Thread(target=run)
-    t.daemon = True
-    t.start()
-    print(f"✅ Веб-сервер запущен! Пингуйте URL вашего Replit каждые 5 минут")
-    print("💡 Используйте UptimeRobot для автоматического пингования")
+
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger('discord.contract_bot.status')
+
+STATUS_PAGE = """
+<html>
+<head>
+    <title>Discord Contract Bot 3.0 - Status</title>
+    <meta charset="utf-8">
+</head>
+<body style="font-family: Arial; background: #2c2f33; color: #ffffff; text-align: center; padding: 50px;">
+    <h1>🤖 Discord Contract Bot 3.0</h1>
+    <h2 style="color: {color};">{headline}</h2>
+    <p>Время работы: {uptime}</p>
+    <p>Задержка шлюза: {latency}</p>
+    <hr style="border-color: #7289da;">
+    <p>Для поддержания активности используйте UptimeRobot</p>
+    <p>Пингуйте этот URL каждые 5 минут</p>
+</body>
+</html>
+"""
+
+
+def format_uptime(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин {seconds} сек"
+
+
+class StatusServer:
+    def __init__(self, bot, host='0.0.0.0', port=8080, event_timeout=120.0, diagnostics=None, connection=None,
+                 diagnostics_token=None):
+        self.bot = bot
+        self.diagnostics = diagnostics
+        # Стеки задач и снимок памяти отдаются только с этим токеном; без него /diagnostics нет
+        self.diagnostics_token = diagnostics_token
+        # Счетчики переподключений и время восстановления (connection.ConnectionStats)
+        self.connection = connection
+        self.host = host
+        self.port = port
+        # Без событий шлюза дольше этого срока бот считается зависшим
+        self.event_timeout = event_timeout
+        self.started_at = time.monotonic()
+        self.last_event_at = None
+        self.runner = None
+
+    def mark_event(self):
+        self.last_event_at = time.monotonic()
+
+    async def start(self):
+        if self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/', self.home)
+        app.router.add_get('/ping', self.ping)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics_page)
+        if self.diagnostics is not None and self.diagnostics_token:
+            app.router.add_get('/diagnostics', self.diagnostics_page)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить веб-сервер статуса на порту {self.port}: {e}")
+            await runner.cleanup()
+            return
+        self.runner = runner
+        logger.info(f"🌐 Веб-сервер статуса запущен на порту {self.port}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def latency(self):
+        latency = self.bot.latency
+        return latency if latency == latency and latency != float("inf") else None
+
+    def state(self):
+        now = time.monotonic()
+        since_event = now - self.last_event_at if self.last_event_at is not None else None
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        healthy = ready and since_event is not None and since_event < self.event_timeout
+        state = {
+            'status': 'healthy' if healthy else 'unhealthy',
+            'ready': ready,
+            'latency': self.latency(),
+            'seconds_since_event': since_event,
+            'uptime': now - self.started_at,
+            'guilds': len(self.bot.guilds),
+        }
+        if self.connection is not None:
+            state['connection'] = self.connection.snapshot()
+        return state
+
+    async def home(self, request):
+        state = self.state()
+        latency = state['latency']
+        page = STATUS_PAGE.format(
+            color="#43b581" if state['status'] == 'healthy' else "#f04747",
+            headline="✅ Бот активен и работает!" if state['status'] == 'healthy' else "⚠️ Бот не подключен к Discord",
+            uptime=format_uptime(state['uptime']),
+            latency=f"{latency * 1000:.0f} мс" if latency is not None else "—",
+        )
+        return web.Response(text=page, content_type='text/html')
+
+    async def ping(self, request):
+        return web.json_response({'status': 'alive', 'timestamp': time.time(), 'message': 'Bot is running!'})
+
+    async def health(self, request):
+        state = self.state()
+        return web.json_response(state, status=200 if state['status'] == 'healthy' else 503)
+
+    async def metrics_page(self, request):
+        return web.Response(text=metrics.registry.render(), content_type='text/plain')
+
+    def authorized(self, request):
+        token = request.headers.get('X-Diagnostics-Token') or request.query.get('token') or ''
+        return hmac.compare_digest(token.encode(), self.diagnostics_token.encode())
+
+    async def diagnostics_page(self, request):
+        # Чужой запрос не отличить от отсутствующего маршрута
+        if not self.authorized(request):
+            raise web.HTTPNotFound()
+        # Снимок tracemalloc тяжелый, поэтому только по явному ?memory=1
+        memory = request.query.get('memory') == '1'
+        return web.json_response(self.diagnostics.snapshot(memory=memory))
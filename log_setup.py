@@ -0,0 +1,132 @@
+"""
+Неблокирующее логирование: обработчики цикла событий только кладут записи
+в очередь, а форматирование, запись на диск, ротация и сжатие выполняются
+в фоновом потоке QueueListener.
+
+Контекст записи передается через extra: contract_id, guild, user —
+в JSON-режиме это отдельные поля, в текстовом — хвост строки.
+"""
+
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+
+CONTEXT_FIELDS = ("contract_id", "guild", "user")
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def log_context(contract_id=None, guild=None, user=None):
+    """extra для logger.*: logger.info("...", extra=log_context(contract_id=cid))"""
+    return {"contract_id": contract_id, "guild": guild, "user": user}
+
+
+class ContextTextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        context = [f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS
+                   if getattr(record, field, None) is not None]
+        return f"{text} [{' '.join(context)}]" if context else text
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ротация по размеру или по прошествии интервала — что наступит раньше; архивы сжимаются gzip"""
+
+    def __init__(self, filename, max_bytes, backup_count, interval=None, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self.compress
+
+    @staticmethod
+    def compress(source, destination):
+        with open(source, 'rb') as plain, gzip.open(destination, 'wb') as packed:
+            shutil.copyfileobj(plain, packed)
+        os.remove(source)
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    В потоке цикла событий только подставляет аргументы сообщения (они могут
+    измениться до записи); форматирование и traceback — в потоке записи.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class QueueLogging:
+    """Корневой логгер пишет в очередь; listener — единственный, кто трогает диск и stdout"""
+
+    def __init__(self, listener, queue_handler):
+        self.listener = listener
+        self.queue_handler = queue_handler
+
+    def stop(self):
+        """Дописывает очередь и останавливает фоновый поток (повторный вызов безопасен)"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def setup_logging(level='INFO', path='bot.log', max_bytes=5 * 1024 * 1024, backup_count=5,
+                  rotate_interval=86400, json_lines=False):
+    formatter = JsonLinesFormatter() if json_lines else ContextTextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if path:
+        handlers.append(SizeAndTimeRotatingFileHandler(path, max_bytes, backup_count, rotate_interval))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    state = QueueLogging(listener, queue_handler)
+    # Хвост очереди дописывается и при выходе без явной остановки
+    atexit.register(state.stop)
+    return state
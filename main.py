@@ -6,6 +6,7 @@
 
 import os
 import sys
+import importlib.util
 
 # Проверяем переменные окружения для Replit
 def check_environment():
@@ -33,14 +34,13 @@ def setup_replit():
                 f.write("LOG_LEVEL=INFO\n")
             print("✅ Файл .env создан из секретов Replit")
         
-        # Устанавливаем зависимости если нужно
-        try:
-            import discord
-            import dotenv
-            print("✅ Все зависимости установлены")
-        except ImportError as e:
-            print(f"⚠️ Нужна установка зависимостей: {e}")
+        # Проверяем зависимости без их импорта: бот импортирует их сам
+        missing = [name for name in ("discord", "dotenv", "aiohttp") if importlib.util.find_spec(name) is None]
+        if missing:
+            print(f"⚠️ Нужна установка зависимостей: {', '.join(missing)}")
             print("💡 Replit должен автоматически установить их")
+        else:
+            print("✅ Все зависимости установлены")
             
     except Exception as e:
         print(f"⚠️ Ошибка настройки Replit: {e}")
@@ -59,23 +59,17 @@ if __name__ == "__main__":
     try:
         print("📦 Импорт модулей...")
         
-        # Запускаем веб-сервер для поддержания активности в Replit
-        try:
-            from keep_alive import keep_alive
-            keep_alive()
-        except ImportError:
-            print("⚠️ Flask не установлен - веб-сервер недоступен")
-            print("💡 Для поддержания активности установите: pip install flask")
+        # Веб-сервер статуса запускает сам бот в своем цикле событий (см. keep_alive.py)
         
-        # Импортируем основной модуль бота
-        exec(open('discord_bot.py').read())
-        
-    except FileNotFoundError:
-        print("❌ Файл discord_bot.py не найден!")
-        print("📁 Убедитесь, что все файлы загружены в Replit")
-        sys.exit(1)
+        # Обычный импорт модуля: байткод кэшируется в __pycache__
+        import discord_bot
+        discord_bot.run()
         
     except ImportError as e:
+        if e.name == "discord_bot":
+            print("❌ Файл discord_bot.py не найден!")
+            print("📁 Убедитесь, что все файлы загружены в Replit")
+            sys.exit(1)
         print(f"❌ Ошибка импорта: {e}")
         print("📦 Установите зависимости в Replit:")
         print("   poetry add discord.py python-dotenv aiohttp")
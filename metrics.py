@@ -0,0 +1,151 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+Счетчики и гистограммы обновляются прямо в обработчиках — это пара операций
+со словарем; значения, которые и так хранит бот (контракты, таймеры, маршруты
+REST), читаются только в момент запроса /metrics.
+"""
+
+import functools
+import time
+from bisect import bisect_left
+
+NAMESPACE = "contract_bot"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(label, value, extra=""):
+    if label is None:
+        return "{" + extra + "}" if extra else ""
+    pair = f'{label}="{escape_label(value)}"'
+    return "{" + pair + ("," + extra if extra else "") + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = {}
+
+    def inc(self, key=None, amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        for key, value in list(self.values.items()):
+            yield f"{self.name}{format_labels(self.label, key)} {format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}  # ключ -> [счетчики по корзинам (не накопленные), сумма, количество]
+
+    def observe(self, key, value):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        for key, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label, key, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.label, key)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.label, key)} {count}"
+
+
+class Collected:
+    """Метрика, значение которой берется функцией в момент выдачи: число или {метка: число}"""
+
+    def __init__(self, name, documentation, collect, kind="gauge", label=None):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.kind = kind
+        self.label = label
+
+    def render(self):
+        value = self.collect()
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield f"{self.name}{format_labels(self.label, key)} {format_value(item)}"
+        else:
+            yield f"{self.name} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label=None):
+        return self.register(Counter(f"{NAMESPACE}_{name}", documentation, label))
+
+    def histogram(self, name, documentation, label=None, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(f"{NAMESPACE}_{name}", documentation, label, buckets))
+
+    def gauge(self, name, documentation, collect, label=None):
+        return self.register(Collected(f"{NAMESPACE}_{name}", documentation, collect, "gauge", label))
+
+    def collected_counter(self, name, documentation, collect, label=None):
+        return self.register(Collected(f"{NAMESPACE}_{name}", documentation, collect, "counter", label))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_calls = registry.counter("handler_calls_total", "Вызовы команд и кнопок", "handler")
+handler_errors = registry.counter("handler_errors_total", "Необработанные ошибки команд и кнопок", "handler")
+handler_seconds = registry.histogram("handler_seconds", "Время обработки команд и кнопок", "handler")
+
+
+def instrumented(name):
+    """Декоратор обработчика команды или кнопки: счетчик вызовов, ошибок и время"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                handler_calls.inc(name)
+                handler_seconds.observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
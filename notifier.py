@@ -0,0 +1,165 @@
+"""
+Рассылка личных сообщений участникам контрактов: ограниченный пул
+обработчиков разбирает общую очередь, отправка идет через очередь REST
+(темп по rate limit), временные сбои повторяются с нарастающей задержкой.
+Пользователи с закрытыми ЛС запоминаются в хранилище, и им больше не пишем
+до истечения срока перепроверки.
+
+Постановка в очередь не ждет отправки, поэтому завершение контракта и
+уведомление в канал от рассылки не зависят.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+import aiohttp
+import discord
+
+import metrics
+
+logger = logging.getLogger('discord.contract_bot.notifier')
+
+results = metrics.registry.counter(
+    "dm_notifications_total", "Личные уведомления: sent, retried, closed, skipped, dropped, failed", "result"
+)
+
+
+class DMJob:
+    __slots__ = ("user_id", "content", "guild_id", "with_cleanup", "attempt")
+
+    def __init__(self, user_id, content, guild_id, with_cleanup):
+        self.user_id = user_id
+        self.content = content
+        self.guild_id = guild_id
+        self.with_cleanup = with_cleanup
+        self.attempt = 0
+
+
+class DMNotifier:
+    def __init__(self, users, send_dm, store, scheduler, view_factory=None, workers=4,
+                 max_attempts=3, retry_delay=5.0, closed_recheck=7 * 86400, queue_size=10000):
+        self.users = users
+        # send_dm(user, content, guild_id=..., view=...) — отправка через очередь REST с журналом ЛС
+        self.send_dm = send_dm
+        self.store = store
+        self.scheduler = scheduler
+        self.view_factory = view_factory
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Закрытые ЛС перепроверяем не чаще этого срока: пользователь мог их открыть
+        self.closed_recheck = closed_recheck
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = {}  # user_id -> когда обнаружены закрытые ЛС
+        self.workers = []
+        self.retry_ids = itertools.count()
+
+    def load(self):
+        """Закрытые ЛС из хранилища (вызывать после store.open)"""
+        cutoff = time.time() - self.closed_recheck
+        for row in self.store.load("dm_closed"):
+            if row["noted_at"] >= cutoff:
+                self.closed[row["user_id"]] = row["noted_at"]
+            else:
+                self.store.delete("dm_closed", row["user_id"])
+
+    def start(self):
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self.work()))
+
+    def stop(self):
+        for task in self.workers:
+            task.cancel()
+        self.workers = []
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def dm_closed(self, user_id):
+        noted_at = self.closed.get(user_id)
+        if noted_at is None:
+            return False
+        if time.time() - noted_at >= self.closed_recheck:
+            del self.closed[user_id]
+            self.store.delete("dm_closed", user_id)
+            return False
+        return True
+
+    def notify(self, user_id, content, guild_id=None, with_cleanup=True):
+        """Ставит ЛС в очередь и сразу возвращается; False — не поставлено"""
+        if self.dm_closed(user_id):
+            results.inc("skipped")
+            return False
+        try:
+            self.queue.put_nowait(DMJob(user_id, content, guild_id, with_cleanup))
+        except asyncio.QueueFull:
+            results.inc("dropped")
+            logger.warning("Очередь личных уведомлений переполнена, уведомление %s отброшено", user_id)
+            return False
+        return True
+
+    def notify_many(self, user_ids, content, guild_id=None, with_cleanup=True):
+        return sum(self.notify(user_id, content, guild_id, with_cleanup) for user_id in user_ids)
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.deliver(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results.inc("failed")
+                logger.error(f"Ошибка отправки личного уведомления {job.user_id}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def deliver(self, job):
+        job.attempt += 1
+        try:
+            user = await self.users.resolve(job.user_id)
+            view = self.view_factory() if job.with_cleanup and self.view_factory else None
+            kwargs = {"view": view} if view is not None else {}
+            await self.send_dm(user, job.content, guild_id=job.guild_id, **kwargs)
+        except discord.Forbidden:
+            # Закрытые ЛС или бот заблокирован — повтор не поможет
+            self.closed[job.user_id] = time.time()
+            self.store.put("dm_closed", job.user_id, {"user_id": job.user_id, "noted_at": time.time()})
+            results.inc("closed")
+            return
+        except discord.NotFound:
+            results.inc("failed")
+            return
+        except discord.HTTPException as e:
+            if e.status != 429 and e.status < 500:
+                results.inc("failed")
+                logger.warning("Личное уведомление %s отклонено: %s", job.user_id, e)
+                return
+            self.retry(job, e)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.retry(job, e)
+            return
+        results.inc("sent")
+
+    def retry(self, job, error):
+        if job.attempt >= self.max_attempts:
+            results.inc("failed")
+            logger.warning("Личное уведомление %s не доставлено за %d попыток: %s",
+                           job.user_id, job.attempt, error)
+            return
+        results.inc("retried")
+        # Повтор ждет в планировщике, не занимая обработчик
+        self.scheduler.schedule(
+            ("dm_retry", next(self.retry_ids)), self.retry_delay * 2 ** (job.attempt - 1),
+            lambda: self.requeue(job)
+        )
+
+    async def requeue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            results.inc("dropped")
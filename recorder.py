@@ -0,0 +1,171 @@
+"""
+Запись входящего трафика для нагрузочных прогонов (benchmarks/replay.py).
+
+Включается явно (RECORD_TRAFFIC=путь). В файл дописываются строки JSON:
+типы событий шлюза и взаимодействия с командой, опциями и позицией нажатой
+кнопки. ID пользователей, каналов, серверов и сообщений заменяются ключевым
+хэшем (RECORD_SALT), время события сохраняется. Текст строковых опций не
+пишется — только его длина.
+
+Строки копятся в памяти и дописываются на диск пачкой в отдельном потоке,
+так что цикл событий файл не трогает.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger('discord.contract_bot.recorder')
+
+FORMAT_VERSION = 1
+
+# Опции, в которых лежат ID: USER, CHANNEL, ROLE, MENTIONABLE, ATTACHMENT
+ID_OPTION_TYPES = {6, 7, 8, 9, 11}
+STRING_OPTION = 3
+# Подкоманда и группа подкоманд: значения во вложенных options
+NESTED_OPTION_TYPES = {1, 2}
+
+recorded = metrics.registry.counter(
+    "traffic_recorded_total", "Запись трафика: interaction, event, dropped", "kind"
+)
+
+
+def compact(entry):
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class TrafficRecorder:
+    def __init__(self, path, salt=None, shard_id=None, flush_interval=1.0, max_buffer=50000):
+        self.path = path
+        # Без постоянной соли ID согласованы только в пределах одного запуска
+        self.salt = (salt or os.urandom(16).hex()).encode()
+        self.shard_id = shard_id
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.file = None
+        self.write_lock = threading.Lock()
+        self.task = None
+
+    def anonymize(self, snowflake):
+        if snowflake is None:
+            return None
+        digest = hmac.new(self.salt, str(snowflake).encode(), hashlib.sha256).digest()
+        # 48 бит: коротко в JSON и без заметных коллизий на наших объемах
+        return int.from_bytes(digest[:6], "big")
+
+    # ===== ЗАПИСЬ =====
+
+    def append(self, kind, entry):
+        if len(self.buffer) >= self.max_buffer:
+            recorded.inc("dropped")
+            return
+        self.buffer.append(compact(entry))
+        recorded.inc(kind)
+
+    def record_event(self, event_type):
+        # Взаимодействия пишутся целиком в record_interaction
+        if event_type == "INTERACTION_CREATE":
+            return
+        self.append("event", {"t": round(time.time(), 3), "k": "e", "e": event_type})
+
+    def record_interaction(self, interaction):
+        entry = {
+            "t": round(time.time(), 3),
+            "k": "i",
+            "id": self.anonymize(interaction.id),
+            "it": interaction.type.value,
+            "u": self.anonymize(interaction.user.id),
+            "c": self.anonymize(interaction.channel_id),
+            "g": self.anonymize(interaction.guild_id),
+        }
+        data = interaction.data or {}
+        if "custom_id" in data:
+            entry["d"] = self.component(interaction, data)
+        elif "name" in data:
+            entry["d"] = {"n": data["name"], "o": self.options(data.get("options") or ())}
+        self.append("interaction", entry)
+
+    def options(self, options):
+        result = []
+        for option in options:
+            kind = option.get("type")
+            item = {"n": option.get("name"), "ty": kind}
+            if kind in NESTED_OPTION_TYPES:
+                item["o"] = self.options(option.get("options") or ())
+            elif kind in ID_OPTION_TYPES:
+                item["v"] = self.anonymize(option.get("value"))
+            elif kind == STRING_OPTION:
+                item["len"] = len(option.get("value") or "")
+            else:
+                item["v"] = option.get("value")
+            result.append(item)
+        return result
+
+    def component(self, interaction, data):
+        """Кнопка описывается исходным взаимодействием и позицией: custom_id у View случайные"""
+        message = interaction.message
+        origin = None
+        position = None
+        if message is not None:
+            # interaction_metadata появился в discord.py 2.4; на 2.3 источник в message.interaction
+            if hasattr(message, "interaction_metadata"):
+                metadata = message.interaction_metadata
+            else:
+                metadata = message.interaction
+            origin = self.anonymize(metadata.id) if metadata is not None else None
+            for row_index, row in enumerate(message.components):
+                for index, child in enumerate(getattr(row, "children", ())):
+                    if getattr(child, "custom_id", None) == data["custom_id"]:
+                        position = [row_index, index]
+        return {"ct": data.get("component_type"), "o": origin, "p": position}
+
+    # ===== ДИСК =====
+
+    def start(self):
+        if self.task is None or self.task.done():
+            # Заголовок каждого запуска: файл может накапливать несколько сессий
+            self.buffer.append(compact({
+                "t": round(time.time(), 3), "k": "start", "v": FORMAT_VERSION, "shard": self.shard_id
+            }))
+            self.task = asyncio.create_task(self.flush_loop())
+            logger.info(f"Запись трафика включена: {self.path}")
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        await self.flush()
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    async def flush_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Ошибка записи трафика: {e}", exc_info=True)
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        await asyncio.to_thread(self.write, lines)
+
+    def write(self, lines):
+        with self.write_lock:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
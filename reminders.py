@@ -0,0 +1,195 @@
+"""
+Сводные напоминания: напоминания контрактов одного канала, наступившие в
+пределах короткого окна, уходят одним сообщением со списком контрактов.
+По мере закрытия контрактов сообщение правится на месте, а когда в нем не
+остается открытых контрактов — удаляется один раз.
+"""
+
+import itertools
+import logging
+import time
+
+import discord
+
+import metrics
+from rest_queue import message_route, send_route, PRIORITY_NOTIFY, PRIORITY_HOUSEKEEPING
+from roster import CONTENT_LIMIT, overflow_line
+
+logger = logging.getLogger('discord.contract_bot.reminders')
+
+HEADERS = {
+    5: "🚨 **СРОЧНО! Запись закрывается через 5 минут!**\n👉 @в организации\n",
+    2: "🔥 **ПОСЛЕДНИЕ 2 МИНУТЫ ЗАПИСИ!**\n👉 @в организации\n",
+}
+FOOTERS = {
+    5: "🔥 **Не упусти контракт!**",
+    2: "🚨 **УСПЕЙ ПРИСОЕДИНИТЬСЯ ПРЯМО СЕЙЧАС!**",
+}
+
+# Сводка без удаления после перезапуска уйдет сама через столько секунд после дедлайна
+EXPIRY_MARGIN = 60
+
+# Авторы в списке упоминаются, но не должны получать уведомление
+NO_PINGS = discord.AllowedMentions.none()
+
+actions = metrics.registry.counter(
+    "reminder_messages_total", "Запросы сводных напоминаний: send, edit, delete", "action"
+)
+
+
+class ReminderEntry:
+    __slots__ = ("creator", "deadline", "minutes_left")
+
+    def __init__(self, creator, deadline, minutes_left):
+        self.creator = creator
+        self.deadline = deadline
+        self.minutes_left = minutes_left
+
+
+class ReminderBoard:
+    """Одно сводное сообщение канала и контракты в нем"""
+
+    def __init__(self, board_id, channel_id, guild_id):
+        self.board_id = board_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.entries = {}  # contract_id -> ReminderEntry
+        self.opened_at = time.monotonic()
+        self.message_id = None
+        self.version = 0  # Растет при каждом изменении списка
+        self.rendered = 0  # Версия, которая сейчас в Discord
+        self.flushing = False
+
+    def text(self):
+        urgent = min(entry.minutes_left for entry in self.entries.values())
+        header = HEADERS.get(urgent, HEADERS[5])
+        footer = FOOTERS.get(urgent, FOOTERS[5])
+        # Относительное время Discord считает сам — правки ради обратного отсчета не нужны
+        lines = [
+            f"• Контракт от <@{entry.creator}> — закрытие <t:{int(entry.deadline)}:R>"
+            for entry in sorted(self.entries.values(), key=lambda entry: entry.deadline)
+        ]
+        budget = CONTENT_LIMIT - len(header) - len(footer) - 1
+        shown = []
+        used = 0
+        for index, line in enumerate(lines):
+            tail = len(overflow_line(len(lines) - index - 1)) + 1 if index < len(lines) - 1 else 0
+            if used + len(line) + 1 + tail > budget:
+                shown.append(overflow_line(len(lines) - index))
+                break
+            shown.append(line)
+            used += len(line) + 1
+        return header + "\n".join(shown) + "\n" + footer
+
+
+class ReminderAggregator:
+    def __init__(self, bot, scheduler, rest_queue, window=5.0, expiry=None):
+        self.bot = bot
+        # Реестр сроков жизни: страховка, если бот перезапустится, не успев удалить сводку
+        self.expiry = expiry
+        self.scheduler = scheduler
+        self.rest_queue = rest_queue
+        # Напоминания в пределах окна попадают в одно сообщение
+        self.window = window
+        self.open_boards = {}  # channel_id -> доска, принимающая новые напоминания
+        self.by_contract = {}  # contract_id -> доска, где сейчас контракт
+        self.ids = itertools.count(1)
+
+    def add(self, channel_id, guild_id, contract_id, creator, deadline, minutes_left):
+        """Напоминание контракта наступило: ставим его в сводку канала"""
+        board = self.open_boards.get(channel_id)
+        if board is None or time.monotonic() - board.opened_at > self.window:
+            board = ReminderBoard(next(self.ids), channel_id, guild_id)
+            self.open_boards[channel_id] = board
+        previous = self.by_contract.get(contract_id)
+        if previous is not None and previous is not board:
+            # Новое напоминание того же контракта переезжает в свежую сводку
+            self.detach(previous, contract_id)
+        board.entries[contract_id] = ReminderEntry(creator, deadline, minutes_left)
+        self.by_contract[contract_id] = board
+        self.touch(board)
+
+    def remove(self, contract_id):
+        """Контракт закрыт или отменен: убираем из сводки (без запроса, если она еще не ушла)"""
+        board = self.by_contract.get(contract_id)
+        if board is not None:
+            self.detach(board, contract_id)
+
+    def detach(self, board, contract_id):
+        board.entries.pop(contract_id, None)
+        if self.by_contract.get(contract_id) is board:
+            del self.by_contract[contract_id]
+        self.touch(board)
+
+    def touch(self, board):
+        board.version += 1
+        self.schedule_flush(board)
+
+    def schedule_flush(self, board):
+        key = ("reminders", board.board_id)
+        if board.flushing or self.scheduler.is_scheduled(key):
+            return
+        # Первую отправку ждем окно, чтобы собрать соседние контракты; правки — тоже пачкой
+        self.scheduler.schedule(key, self.window, lambda: self.flush(board))
+
+    def protect(self, board):
+        """Сводка точно не нужна после закрытия последнего контракта в ней"""
+        if self.expiry is None or not board.entries:
+            return
+        deadline = max(entry.deadline for entry in board.entries.values())
+        self.expiry.expire(board.channel_id, board.message_id, deadline - time.time() + EXPIRY_MARGIN, board.guild_id)
+
+    def retire(self, board):
+        if self.open_boards.get(board.channel_id) is board:
+            del self.open_boards[board.channel_id]
+
+    async def flush(self, board):
+        if board.version == board.rendered:
+            return
+        channel = self.bot.get_partial_messageable(board.channel_id, guild_id=board.guild_id)
+        version = board.version
+        board.flushing = True
+        try:
+            if not board.entries:
+                self.retire(board)
+                if board.message_id is not None:
+                    message_id, board.message_id = board.message_id, None
+                    if self.expiry is not None:
+                        self.expiry.forget(message_id)
+                    actions.inc("delete")
+                    await self.rest_queue.submit(
+                        channel.get_partial_message(message_id).delete,
+                        route=message_route("DELETE", board.channel_id),
+                        priority=PRIORITY_HOUSEKEEPING, guild_id=board.guild_id
+                    )
+            elif board.message_id is None:
+                content = board.text()
+                actions.inc("send")
+                message = await self.rest_queue.submit(
+                    lambda: channel.send(content, allowed_mentions=NO_PINGS),
+                    route=send_route(board.channel_id), priority=PRIORITY_NOTIFY,
+                    guild_id=board.guild_id
+                )
+                board.message_id = message.id
+                self.protect(board)
+            else:
+                content = board.text()
+                message = channel.get_partial_message(board.message_id)
+                actions.inc("edit")
+                await self.rest_queue.submit(
+                    lambda: message.edit(content=content, allowed_mentions=NO_PINGS),
+                    route=message_route("PATCH", board.channel_id),
+                    priority=PRIORITY_NOTIFY, guild_id=board.guild_id
+                )
+                self.protect(board)
+            board.rendered = version
+        except Exception as e:
+            # Повторять не будем: следующее изменение списка все равно перерисует сводку
+            board.rendered = version
+            if not isinstance(e, discord.NotFound):
+                logger.error("Ошибка сводного напоминания в канале %s: %s", board.channel_id, e)
+        finally:
+            board.flushing = False
+        # Изменения, пришедшие во время запроса, уходят следующей пачкой
+        if board.version != board.rendered:
+            self.schedule_flush(board)
@@ -0,0 +1,300 @@
+"""
+Центральная очередь исходящих REST-запросов к Discord.
+Запросы разбиты на классы приоритета, внутри класса гильдии обслуживаются
+по кругу, а темп для каждого маршрута берется из заголовков rate limit,
+которые мы видим через aiohttp TraceConfig клиента discord.py.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter, OrderedDict, deque
+
+import aiohttp
+
+logger = logging.getLogger('discord.contract_bot.rest')
+
+# Классы приоритета: меньше — важнее
+PRIORITY_INTERACTION = 0  # Ответы и follow-up на взаимодействия
+PRIORITY_ROSTER = 1       # Правки сообщений контрактов
+PRIORITY_NOTIFY = 2       # Напоминания, уведомления в канал и ЛС
+PRIORITY_HOUSEKEEPING = 3  # Удаления старых сообщений, очистка ЛС
+PRIORITIES = (PRIORITY_INTERACTION, PRIORITY_ROSTER, PRIORITY_NOTIFY, PRIORITY_HOUSEKEEPING)
+
+# Идентификаторы после этих сегментов пути определяют отдельный bucket Discord
+MAJOR_PARAMETERS = ("channels", "guilds", "webhooks")
+SNOWFLAKE = re.compile(r"^\d{15,21}$")
+# После этих сегментов идет токен взаимодействия: уникален для каждого нажатия
+TOKEN_PARENTS = ("webhooks", "interactions")
+
+# Простаивающие buckets (без запросов в полете и с прошедшим сбросом) удаляются раз в столько секунд
+BUCKET_PRUNE_INTERVAL = 60.0
+
+
+def normalize_route(method, path):
+    """'DELETE', '/api/v10/channels/1/messages/2' -> 'DELETE /channels/1/messages/{id}'"""
+    parts = [part for part in path.split("/") if part]
+    if len(parts) >= 2 and parts[0] == "api" and parts[1].startswith("v"):
+        parts = parts[2:]
+    normalized = []
+    for index, part in enumerate(parts):
+        if SNOWFLAKE.match(part) and (index == 0 or parts[index - 1] not in MAJOR_PARAMETERS):
+            part = "{id}"
+        normalized.append(part)
+    return f"{method} /" + "/".join(normalized)
+
+
+def route_template(route):
+    """Маршрут без ID и токенов для меток метрик: 'POST /channels/1/messages' -> 'POST /channels/{channel_id}/messages'"""
+    method, _, path = route.partition(" ")
+    parts = path.split("/")
+    for index in range(1, len(parts)):
+        previous = parts[index - 1]
+        if previous in MAJOR_PARAMETERS and SNOWFLAKE.match(parts[index]):
+            parts[index] = "{" + previous[:-1] + "_id}"
+        elif index >= 2 and parts[index - 2] in TOKEN_PARENTS and parts[index] != "messages":
+            parts[index] = "{token}"
+    return f"{method} " + "/".join(parts)
+
+
+def message_route(method, channel_id):
+    """Маршрут операции над конкретным сообщением канала (edit/delete)"""
+    return f"{method} /channels/{channel_id}/messages/{{id}}"
+
+
+def send_route(channel_id):
+    """Маршрут отправки сообщения в канал"""
+    return f"POST /channels/{channel_id}/messages"
+
+
+def followup_route(interaction):
+    """Маршрут follow-up сообщения взаимодействия (webhook с токеном)"""
+    return f"POST /webhooks/{interaction.application_id}/{interaction.token}"
+
+
+# Маршрут открытия ЛС: один на все ЛС бота
+CREATE_DM_ROUTE = "POST /users/@me/channels"
+
+
+class RouteBucket:
+    __slots__ = ("limit", "remaining", "reset_at", "inflight")
+
+    def __init__(self):
+        self.limit = None  # X-RateLimit-Limit: сколько запросов в окне
+        self.remaining = None  # None — лимит еще неизвестен
+        self.reset_at = 0.0
+        self.inflight = 0  # Отправленные задачи очереди, ответ на которые еще не пришел
+
+    def blocked_until(self, now):
+        """None — можно отправлять; math.inf — ждать ответа на запрос в полете"""
+        if self.remaining is not None and self.reset_at <= now:
+            # Окно сброшено: лимит прежний, запросы прошлого окна уже учтены сервером
+            self.remaining = self.limit
+        if self.remaining is None:
+            # Лимит неизвестен: один пробный запрос, остальные ждут его заголовков
+            return math.inf if self.inflight else None
+        if self.remaining <= 0:
+            return self.reset_at if self.reset_at > now else math.inf
+        return None
+
+
+class RestJob:
+    __slots__ = ("factory", "route", "future")
+
+    def __init__(self, factory, route, future):
+        self.factory = factory
+        self.route = route
+        self.future = future
+
+
+class RestQueue:
+    def __init__(self, concurrency=4):
+        self.concurrency = concurrency
+        self.active = 0
+        # приоритет -> OrderedDict(гильдия -> deque задач); порядок гильдий — очередь обхода
+        self.queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self.buckets = {}  # маршрут (с ID канала) -> RouteBucket
+        # Счетчики для метрик по шаблону маршрута: число меток не растет с числом каналов
+        self.requests = Counter()
+        self.limited = Counter()  # Ответов 429
+        self.next_prune = 0.0
+        self.global_reset_at = 0.0
+        self.wakeup = None
+        self.task = None
+        # Ссылки на выполняющиеся запросы: цикл событий держит задачи только слабо
+        self.executing = set()
+
+    def start(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def bucket(self, route):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            bucket = self.buckets[route] = RouteBucket()
+        return bucket
+
+    def prune(self, now):
+        """Удаляет buckets, которые больше ничего не ограничивают (каналы ЛС, токены взаимодействий)"""
+        idle = [
+            route for route, bucket in self.buckets.items()
+            if bucket.inflight == 0 and bucket.reset_at <= now
+        ]
+        for route in idle:
+            del self.buckets[route]
+
+    # ===== ПОСТАНОВКА В ОЧЕРЕДЬ =====
+
+    def submit_nowait(self, factory, *, route, priority, guild_id=None):
+        """
+        Ставит запрос в очередь и возвращает Future с результатом.
+        factory — функция без аргументов, возвращающая корутину запроса.
+        guild_id — ключ справедливости: для ЛС передавайте ключ пользователя.
+        """
+        future = asyncio.get_running_loop().create_future()
+        guild_queues = self.queues[priority]
+        if guild_id not in guild_queues:
+            guild_queues[guild_id] = deque()
+        guild_queues[guild_id].append(RestJob(factory, route, future))
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return future
+
+    def submit_background(self, factory, *, route, priority, guild_id=None):
+        """Запрос без ожидания результата: ошибки только логируются"""
+        future = self.submit_nowait(factory, route=route, priority=priority, guild_id=guild_id)
+        future.add_done_callback(self.log_background_failure)
+        return future
+
+    @staticmethod
+    def log_background_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Фоновый запрос завершился ошибкой: %s", future.exception())
+
+    async def submit(self, factory, *, route, priority, guild_id=None):
+        """Ставит запрос в очередь и ждет результат; исключения запроса пробрасываются"""
+        return await self.submit_nowait(factory, route=route, priority=priority, guild_id=guild_id)
+
+    def pending(self):
+        return sum(len(jobs) for queues in self.queues.values() for jobs in queues.values())
+
+    # ===== ДИСПЕТЧЕР =====
+
+    def next_job(self, now):
+        """Следующая готовая задача: строгий приоритет, внутри — круговой обход гильдий"""
+        earliest = None
+        for priority in PRIORITIES:
+            guild_queues = self.queues[priority]
+            for guild_id in list(guild_queues):
+                jobs = guild_queues[guild_id]
+                blocked = self.bucket(jobs[0].route).blocked_until(now)
+                if blocked is not None:
+                    earliest = blocked if earliest is None else min(earliest, blocked)
+                    continue
+                job = jobs.popleft()
+                # Гильдия уходит в конец круга, пустые очереди удаляем
+                del guild_queues[guild_id]
+                if jobs:
+                    guild_queues[guild_id] = jobs
+                return job, None
+        return None, earliest
+
+    async def run(self):
+        while True:
+            try:
+                await self.dispatch()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера REST: {e}", exc_info=True)
+
+    async def dispatch(self):
+        self.wakeup.clear()
+        now = time.monotonic()
+        if now >= self.next_prune:
+            self.prune(now)
+            self.next_prune = now + BUCKET_PRUNE_INTERVAL
+        wait = None
+        if now < self.global_reset_at:
+            wait = self.global_reset_at - now
+        elif self.active < self.concurrency:
+            job, earliest = self.next_job(now)
+            if job is not None:
+                bucket = self.bucket(job.route)
+                if bucket.remaining is not None:
+                    bucket.remaining -= 1  # Резервируем слот до прихода заголовков
+                bucket.inflight += 1
+                self.active += 1
+                task = asyncio.create_task(self.execute(job, bucket))
+                self.executing.add(task)
+                task.add_done_callback(self.executing.discard)
+                return
+            # Маршруты, ждущие ответа в полете, разбудит execute()
+            if earliest is not None and earliest != math.inf:
+                wait = earliest - now
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+
+    async def execute(self, job, bucket):
+        try:
+            if not job.future.cancelled():
+                result = await job.factory()
+                if not job.future.done():
+                    job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            bucket.inflight -= 1
+            self.active -= 1
+            self.wakeup.set()
+
+    # ===== ЗАГОЛОВКИ RATE LIMIT =====
+
+    def trace_config(self):
+        """TraceConfig для http_trace бота: учитывает заголовки каждого ответа Discord"""
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self.on_request_end)
+        return trace
+
+    async def on_request_end(self, session, context, params):
+        route = normalize_route(params.method, params.url.path)
+        bucket = self.bucket(route)
+        template = route_template(route)
+        self.requests[template] += 1
+        headers = params.response.headers
+        now = time.monotonic()
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is not None and reset_after is not None:
+            limit = headers.get("X-RateLimit-Limit")
+            if limit is not None:
+                bucket.limit = int(limit)
+            # Заголовок не знает о других наших запросах в полете: их слоты уже заняты
+            others = max(0, bucket.inflight - 1)
+            bucket.remaining = int(remaining) - others
+            bucket.reset_at = now + float(reset_after)
+
+        if params.response.status == 429:
+            self.limited[template] += 1
+            retry_after = float(headers.get("Retry-After", reset_after or 1))
+            if headers.get("X-RateLimit-Global"):
+                self.global_reset_at = now + retry_after
+            else:
+                bucket.remaining = 0
+                bucket.reset_at = now + retry_after
+            logger.warning("429 на маршруте %s, повтор через %.2f сек", route, retry_after)
+
+        if self.wakeup is not None:
+            self.wakeup.set()
@@ -0,0 +1,108 @@
+"""
+Отрисовка состава контракта с учетом лимитов Discord.
+Упоминания складываются в готовые чанки по мере записи, поэтому клик не
+пересобирает весь список, а embed раскладывается на несколько полей.
+"""
+
+from itertools import islice
+
+FIELD_VALUE_LIMIT = 1024  # Символов в значении поля embed
+EMBED_FIELD_LIMIT = 25    # Полей в одном embed
+EMBED_TOTAL_LIMIT = 6000  # Суммарно символов в embed
+CONTENT_LIMIT = 2000      # Символов в тексте сообщения
+
+BLANK_NAME = "\u200b"  # Пустое имя для полей-продолжений
+
+
+def overflow_line(hidden):
+    return f"…и ещё {hidden}"
+
+
+class RosterRenderer:
+    def __init__(self, max_fields=EMBED_FIELD_LIMIT):
+        self.max_fields = max(1, min(max_fields, EMBED_FIELD_LIMIT))
+        # [список упоминаний, длина текста чанка, готовый текст заполненного чанка или None]
+        self.chunks = []
+        self.count = 0
+        self.version = 0
+        self.cached_key = None
+        self.cached_embed = None
+
+    def add(self, user_id):
+        mention = f"<@{user_id}>"
+        if self.chunks and self.chunks[-1][1] + 1 + len(mention) <= FIELD_VALUE_LIMIT:
+            chunk = self.chunks[-1]
+            chunk[0].append(mention)
+            chunk[1] += 1 + len(mention)
+        else:
+            if self.chunks:
+                # Заполненный чанк больше не меняется: текст склеивается один раз
+                full = self.chunks[-1]
+                full[2] = "\n".join(full[0])
+            self.chunks.append([[mention], len(mention), None])
+        self.count += 1
+        self.version += 1
+
+    def sync(self, participants):
+        """Дописывает новых участников; состав только растет, поэтому хватает хвоста"""
+        if len(participants) > self.count:
+            for user_id in islice(participants, self.count, None):
+                self.add(user_id)
+
+    def fields(self, budget=EMBED_TOTAL_LIMIT, max_fields=None):
+        """Поля (имя, значение) с составом в пределах лимитов; хвост — «…и ещё N»"""
+        max_fields = min(max_fields or self.max_fields, self.max_fields)
+        title = f"✅ Записалось ({self.count}):"
+        fields = []
+        shown = 0
+        used = 0
+        for index, (mentions, length, joined) in enumerate(self.chunks):
+            name = title if index == 0 else BLANK_NAME
+            remaining = self.count - shown - len(mentions)
+            # Для последнего видимого поля оставляем место под строку переполнения
+            reserve = len(overflow_line(remaining)) + len(BLANK_NAME) if remaining else 0
+            if len(fields) + (2 if remaining else 1) > max_fields or used + len(name) + length + reserve > budget:
+                break
+            fields.append((name, joined if joined is not None else "\n".join(mentions)))
+            shown += len(mentions)
+            used += len(name) + length
+        hidden = self.count - shown
+        if hidden:
+            fields.append((title if not fields else BLANK_NAME, overflow_line(hidden)))
+        return fields
+
+    def text(self, limit):
+        """Список упоминаний столбиком не длиннее limit символов"""
+        lines = []
+        used = 0
+        shown = 0
+        for mentions, _, _ in self.chunks:
+            for mention in mentions:
+                hidden = self.count - shown - 1
+                reserve = len(overflow_line(hidden)) + 1 if hidden else 0
+                if used + len(mention) + 1 + reserve > limit:
+                    lines.append(overflow_line(self.count - shown))
+                    return "\n".join(lines)
+                lines.append(mention)
+                used += len(mention) + 1
+                shown += 1
+        return "\n".join(lines)
+
+    def embed(self, countdown, build):
+        """
+        Embed с составом из кэша, пока не изменились состав или отсчет.
+        build() создает embed без полей состава, поля добавляются в остаток лимитов.
+        """
+        key = (self.version, countdown)
+        if key != self.cached_key:
+            embed = build()
+            budget = EMBED_TOTAL_LIMIT - len(embed)
+            max_fields = EMBED_FIELD_LIMIT - len(embed.fields)
+            if self.count:
+                for name, value in self.fields(budget, max_fields):
+                    embed.add_field(name=name, value=value, inline=False)
+            else:
+                embed.add_field(name="✅ Участники:", value="Пока никто не записался", inline=False)
+            self.cached_key = key
+            self.cached_embed = embed
+        return self.cached_embed
@@ -0,0 +1,152 @@
+"""
+Единый планировщик отложенных действий бота (напоминания, дедлайны,
+отложенные уведомления и удаления). Все таймеры живут в одной куче,
+которую обслуживает одна фоновая задача вместо тысяч спящих корутин.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger('discord.contract_bot.scheduler')
+
+
+class TimerEntry:
+    __slots__ = ("when", "seq", "key", "callback", "cancelled")
+
+    def __init__(self, when, seq, key, callback):
+        self.when = when
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class Scheduler:
+    """
+    Таймеры адресуются ключом (владелец, вид), например (contract_id, "deadline").
+    Повторное планирование по тому же ключу заменяет прежний таймер.
+    Отмена помечает запись и убирает ее из индекса; из кучи отмененные
+    записи выталкиваются лениво, поэтому отмена и перенос стоят O(log n).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # ключ -> TimerEntry
+        self.counter = itertools.count()
+        self.cancelled_count = 0
+        self.wakeup = None
+        self.task = None
+        self.fired = 0
+        # Ссылки на срабатывающие таймеры: цикл событий держит задачи только слабо
+        self.firing = set()
+
+    def start(self):
+        """Запускает цикл планировщика; вызывать из работающего event loop"""
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def loop_time(self):
+        return asyncio.get_running_loop().time()
+
+    # ===== УПРАВЛЕНИЕ ТАЙМЕРАМИ =====
+
+    def schedule(self, key, delay, callback):
+        """Планирует callback (корутинную функцию без аргументов) через delay секунд"""
+        self.cancel(key)
+        entry = TimerEntry(self.loop_time() + max(0, delay), next(self.counter), key, callback)
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        # Будим цикл, только если новый таймер стал ближайшим
+        if self.heap[0] is entry and self.wakeup is not None:
+            self.wakeup.set()
+        return entry
+
+    def reschedule(self, key, delay):
+        """Переносит существующий таймер; возвращает False, если таймера нет"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        self.schedule(key, delay, entry.callback)
+        return True
+
+    def cancel(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        entry.cancelled = True
+        self.cancelled_count += 1
+        # Если отмененных записей больше половины, перестраиваем кучу
+        if self.cancelled_count > len(self.heap) // 2 and self.cancelled_count > 64:
+            self.heap = [e for e in self.heap if not e.cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled_count = 0
+        return True
+
+    def cancel_many(self, owner, kinds):
+        for kind in kinds:
+            self.cancel((owner, kind))
+
+    def is_scheduled(self, key):
+        return key in self.entries
+
+    def pending(self):
+        """Список ожидающих таймеров: (ключ, секунд до срабатывания), ближайшие первыми"""
+        now = self.loop_time()
+        return [
+            (entry.key, max(0.0, entry.when - now))
+            for entry in sorted(self.entries.values())
+        ]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ===== ЦИКЛ =====
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Ошибка цикла планировщика: {e}", exc_info=True)
+
+    async def run_due(self):
+        now = self.loop_time()
+        while self.heap and (self.heap[0].cancelled or self.heap[0].when <= now):
+            entry = heapq.heappop(self.heap)
+            if entry.cancelled:
+                self.cancelled_count -= 1
+                continue
+            del self.entries[entry.key]
+            self.fired += 1
+            # Каждое действие в своей короткой задаче, чтобы медленный REST не задерживал остальные
+            task = asyncio.create_task(self.fire(entry))
+            self.firing.add(task)
+            task.add_done_callback(self.firing.discard)
+
+        self.wakeup.clear()
+        timeout = self.heap[0].when - now if self.heap else None
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def fire(self, entry):
+        try:
+            await entry.callback()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка выполнения таймера %s: %s", entry.key, e, exc_info=True)
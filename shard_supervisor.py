@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Супервизор шардов: запускает несколько процессов бота, каждый со своим
+подмножеством гильдий (SHARD_ID/SHARD_COUNT), следит за ними и
+перезапускает упавшие с экспоненциальной задержкой.
+
+Процессы делят одно хранилище SQLite (WAL), через него закрепляется
+«один активный контракт на пользователя» во всех шардах. Каждый шард
+поднимает свой веб-сервер статуса на порту PORT + SHARD_ID.
+
+Запуск:
+    python shard_supervisor.py --shards 4
+    python shard_supervisor.py --shards auto   # число шардов рекомендует Discord
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+logger = logging.getLogger('discord.contract_bot.supervisor')
+
+BOT_ENTRY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "discord_bot.py")
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+async def recommended_shards(token):
+    """Число шардов и задержка между IDENTIFY по данным Discord"""
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers=headers) as response:
+            response.raise_for_status()
+            data = await response.json()
+    # За 5 секунд можно подключить max_concurrency шардов
+    max_concurrency = data.get("session_start_limit", {}).get("max_concurrency", 1)
+    return data["shards"], 5.0 / max_concurrency
+
+
+class ShardProcess:
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+
+
+class ShardSupervisor:
+    def __init__(self, shard_count, base_port=8080, identify_delay=5.0,
+                 backoff_max=60.0, stable_after=300.0):
+        self.shard_count = shard_count
+        self.base_port = base_port
+        # Discord принимает IDENTIFY не чаще раза в 5 секунд на группу шардов
+        self.identify_delay = identify_delay
+        self.backoff_max = backoff_max
+        # Проработавший столько шард при падении начинает задержки заново
+        self.stable_after = stable_after
+        self.shards = [ShardProcess(shard_id) for shard_id in range(shard_count)]
+        self.stopping = asyncio.Event()
+
+    def shard_env(self, shard):
+        env = dict(os.environ)
+        env["SHARD_ID"] = str(shard.shard_id)
+        env["SHARD_COUNT"] = str(self.shard_count)
+        env["PORT"] = str(self.base_port + shard.shard_id)
+        log_file = env.get("LOG_FILE")
+        if log_file:
+            # LOG_FILE из .env общий для всех, а ротация одного файла из нескольких процессов ломается
+            stem, ext = os.path.splitext(log_file)
+            env["LOG_FILE"] = f"{stem}-shard{shard.shard_id}{ext}"
+        return env
+
+    async def spawn(self, shard):
+        shard.process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_ENTRY, env=self.shard_env(shard)
+        )
+        shard.started_at = time.monotonic()
+        logger.info(f"Шард {shard.shard_id}/{self.shard_count} запущен, PID {shard.process.pid}")
+
+    async def run_shard(self, shard):
+        """Держит один шард запущенным, пока супервизор не остановят"""
+        await self.wait_or_stop(shard.shard_id * self.identify_delay)
+        backoff = self.identify_delay
+        while not self.stopping.is_set():
+            await self.spawn(shard)
+            code = await shard.process.wait()
+            if self.stopping.is_set():
+                return
+            uptime = time.monotonic() - shard.started_at
+            if uptime >= self.stable_after:
+                backoff = self.identify_delay
+            shard.restarts += 1
+            logger.warning(
+                f"Шард {shard.shard_id} завершился с кодом {code} через {uptime:.0f} сек, "
+                f"перезапуск #{shard.restarts} через {backoff:.0f} сек"
+            )
+            await self.wait_or_stop(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+
+    async def wait_or_stop(self, delay):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def terminate(self, timeout=15.0):
+        running = [shard.process for shard in self.shards
+                   if shard.process is not None and shard.process.returncode is None]
+        for process in running:
+            process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stopping.set)
+            except NotImplementedError:
+                pass  # Windows: остановка через KeyboardInterrupt
+        logger.info(f"Запуск {self.shard_count} шардов, порты {self.base_port}-{self.base_port + self.shard_count - 1}")
+        tasks = [asyncio.create_task(self.run_shard(shard)) for shard in self.shards]
+        try:
+            await self.stopping.wait()
+        finally:
+            self.stopping.set()
+            logger.info("Остановка шардов...")
+            await self.terminate()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info("Все шарды остановлены")
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Запуск бота несколькими шардами")
+    parser.add_argument("--shards", default=os.getenv('SHARD_COUNT', 'auto'),
+                        help="число шардов или auto (рекомендация Discord)")
+    parser.add_argument("--base-port", type=int, default=int(os.getenv('PORT', '8080')),
+                        help="порт веб-сервера шарда 0, шард N слушает base-port + N")
+    args = parser.parse_args()
+
+    identify_delay = 5.0
+    if args.shards == "auto":
+        token = os.getenv('DISCORD_TOKEN')
+        if not token:
+            logger.error("DISCORD_TOKEN не найден: укажите --shards явно или задайте токен")
+            return
+        shard_count, identify_delay = await recommended_shards(token)
+        logger.info(f"Discord рекомендует шардов: {shard_count}")
+    else:
+        shard_count = int(args.shards)
+
+    await ShardSupervisor(shard_count, args.base_port, identify_delay).run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import contract_actor
+from contract_actor import ContractActor
+
+
+def test_messages_run_in_fifo_order():
+    async def scenario():
+        actor = ContractActor("c1")
+        gate = asyncio.Event()
+        order = []
+
+        async def handler(name):
+            if name == "first":
+                await gate.wait()
+            order.append(name)
+
+        tasks = [asyncio.create_task(actor.call(handler, "first"))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(actor.call(handler, name)) for name in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        assert len(actor) == 3
+        gate.set()
+        await asyncio.gather(*tasks)
+        return actor, order
+
+    actor, order = asyncio.run(scenario())
+    assert order == ["first", "a", "b", "c"]
+    assert not actor.busy
+    assert contract_actor.queued == 0
+
+
+def test_cancelled_waiter_leaves_mailbox():
+    async def scenario():
+        actor = ContractActor("c1")
+        gate = asyncio.Event()
+        order = []
+
+        async def handler(name):
+            if name == "first":
+                await gate.wait()
+            order.append(name)
+
+        first = asyncio.create_task(actor.call(handler, "first"))
+        await asyncio.sleep(0)
+        skipped = asyncio.create_task(actor.call(handler, "skipped"))
+        last = asyncio.create_task(actor.call(handler, "last"))
+        await asyncio.sleep(0)
+        skipped.cancel()
+        await asyncio.sleep(0)
+        assert len(actor) == 1
+        gate.set()
+        await asyncio.gather(first, last)
+        return actor, order, skipped
+
+    actor, order, skipped = asyncio.run(scenario())
+    assert order == ["first", "last"]
+    assert skipped.cancelled()
+    assert not actor.busy
+
+
+def test_waiter_cancelled_after_hand_off_passes_turn_on():
+    async def scenario():
+        actor = ContractActor("c1")
+        order = []
+
+        async def handler(name):
+            order.append(name)
+
+        async def enqueue():
+            waiting = [asyncio.create_task(actor.call(handler, name)) for name in ("handed", "next")]
+            await asyncio.sleep(0)
+            return waiting
+
+        # Возврат из call() уже передал очередь первому ждущему, но тот еще не проснулся
+        handed, following = await actor.call(enqueue)
+        assert actor.busy
+        handed.cancel()
+        await asyncio.wait_for(following, 1)
+        with pytest.raises(asyncio.CancelledError):
+            await handed
+        return actor, order
+
+    actor, order = asyncio.run(scenario())
+    assert order == ["next"]
+    assert not actor.busy
+    assert len(actor) == 0
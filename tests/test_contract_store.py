@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from contract_record import ContractRecord
+from contract_store import OUTCOME_STARTED, ContractStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContractStore(str(tmp_path / "contracts.db"))
+    store.open()
+    yield store
+    store.conn.close()
+
+
+def rows(store, sql, params=()):
+    return [dict(row) for row in store.conn.execute(sql, params)]
+
+
+def test_repeated_close_is_counted_once(store):
+    contract = ContractRecord("c1", creator=1, channel_id=10, guild_id=100,
+                              participants=[1, 2, 3], start_time=1700000000.0)
+    for _ in range(2):
+        store.record_history(contract, OUTCOME_STARTED, closed_at=1700000600.0)
+        store.write_batch({}, store.history_pending)
+        store.history_pending = []
+
+    assert len(rows(store, "SELECT * FROM contract_history")) == 1
+    assert len(rows(store, "SELECT * FROM contract_participation")) == 3
+    totals = rows(store, "SELECT * FROM guild_stats WHERE guild_id = 100")[0]
+    assert (totals["contracts"], totals["started"], totals["joins"]) == (1, 1, 2)
+    daily = rows(store, "SELECT * FROM daily_stats WHERE guild_id = 100")
+    assert [row["contracts"] for row in daily] == [1]
+    users = {row["user_id"]: row for row in rows(store, "SELECT * FROM user_stats")}
+    assert (users[1]["created"], users[1]["recruited"]) == (1, 2)
+    assert users[2]["joined"] == 1
+    assert users[3]["joined"] == 1
+
+
+def test_history_flushed_twice_is_counted_once(store):
+    contract = ContractRecord("c1", creator=1, channel_id=10, guild_id=100, participants=[1, 2])
+
+    async def scenario():
+        # Повтор той же истории, например после сбоя сброса, который вернул пачку в очередь
+        store.record_history(contract, OUTCOME_STARTED, closed_at=1700000600.0)
+        await store.flush()
+        store.record_history(contract, OUTCOME_STARTED, closed_at=1700000600.0)
+        await store.flush()
+
+    asyncio.run(scenario())
+    totals = rows(store, "SELECT * FROM guild_stats WHERE guild_id = 100")[0]
+    assert (totals["contracts"], totals["joins"]) == (1, 1)
+    assert rows(store, "SELECT joined FROM user_stats WHERE user_id = 2") == [{"joined": 1}]
+
+
+def test_reads_flush_only_their_tables(store):
+    async def scenario():
+        store.record_dm(1, 10, 111)
+        store.put("meta", "key", {"key": "key", "value": "value"})
+        store.put("message_expiry", 222, {
+            "message_id": 222, "channel_id": 10, "guild_id": None, "shard_id": 0, "expires_at": 0, "attempts": 0,
+        })
+        ledger = await store.dm_messages(1)
+        # Сборщик сроков читает без сброса и видит строку после обычного сброса
+        due_before = await store.due_messages(0, 1, 10)
+        pending = set(store.pending)
+        await store.flush()
+        due_after = await store.due_messages(0, 1, 10)
+        return ledger, due_before, pending, due_after
+
+    ledger, due_before, pending, due_after = asyncio.run(scenario())
+    assert ledger == [{"message_id": 111, "channel_id": 10}]
+    assert due_before == []
+    assert pending == {("meta", "key"), ("message_expiry", 222)}
+    assert [row["message_id"] for row in due_after] == [222]
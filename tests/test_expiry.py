@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from contract_store import ContractStore
+from expiry import MAX_ATTEMPTS, MessageExpiry
+
+GUILD_ID = 500000000000000005
+CHANNEL_ID = 600000000000000006
+
+
+def snowflake(days_ago):
+    moment = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_ago)
+    return discord.utils.time_snowflake(moment)
+
+
+def http_error(kind, status):
+    return kind(SimpleNamespace(status=status, reason="test"), "test")
+
+
+class FakeRestQueue:
+    async def submit(self, factory, *, route, priority, guild_id=None):
+        return await factory()
+
+
+class FakeBot:
+    def __init__(self, bulk_error=None, single_errors=None):
+        self.bulk = []
+        self.single = []
+        self.bulk_error = bulk_error
+        self.single_errors = single_errors or {}
+        self.http = SimpleNamespace(delete_messages=self.delete_messages)
+
+    async def delete_messages(self, channel_id, ids):
+        if self.bulk_error is not None:
+            raise self.bulk_error
+        self.bulk.append(list(ids))
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        return SimpleNamespace(get_partial_message=lambda message_id: SimpleNamespace(
+            delete=lambda: self.delete_message(message_id)
+        ))
+
+    async def delete_message(self, message_id):
+        error = self.single_errors.get(message_id)
+        if error is not None:
+            raise error
+        self.single.append(message_id)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContractStore(str(tmp_path / "contracts.db"))
+    store.open()
+    yield store
+    store.conn.close()
+
+
+def sweep(store, bot, messages, guild_id=GUILD_ID):
+    async def scenario():
+        expiry = MessageExpiry(bot, store, FakeRestQueue())
+        for message_id in messages:
+            expiry.expire(CHANNEL_ID, message_id, -1, guild_id)
+        await store.flush()
+        swept = await expiry.sweep()
+        await store.flush()
+        return swept
+
+    return asyncio.run(scenario())
+
+
+def remaining(store):
+    return {row["message_id"]: row for row in store.load("message_expiry")}
+
+
+def test_recent_guild_messages_are_bulk_deleted(store):
+    recent = [snowflake(0) + index for index in range(3)]
+    old = snowflake(20)
+    bot = FakeBot()
+    assert sweep(store, bot, recent + [old]) == 4
+    assert [sorted(ids) for ids in bot.bulk] == [sorted(recent)]
+    assert bot.single == [old]
+    assert remaining(store) == {}
+
+
+def test_single_recent_message_is_deleted_by_id(store):
+    message = snowflake(0)
+    bot = FakeBot()
+    sweep(store, bot, [message])
+    assert bot.bulk == []
+    assert bot.single == [message]
+
+
+def test_direct_messages_never_use_bulk_delete(store):
+    messages = [snowflake(0) + index for index in range(3)]
+    bot = FakeBot()
+    sweep(store, bot, messages, guild_id=None)
+    assert bot.bulk == []
+    assert sorted(bot.single) == sorted(messages)
+
+
+def test_failed_bulk_delete_falls_back_to_single(store):
+    messages = [snowflake(0) + index for index in range(3)]
+    bot = FakeBot(bulk_error=http_error(discord.HTTPException, 400))
+    sweep(store, bot, messages)
+    assert sorted(bot.single) == sorted(messages)
+    assert remaining(store) == {}
+
+
+def test_gone_messages_are_forgotten_and_errors_retried(store):
+    gone, failing = snowflake(20), snowflake(21)
+    bot = FakeBot(single_errors={
+        gone: http_error(discord.NotFound, 404),
+        failing: http_error(discord.HTTPException, 500),
+    })
+    sweep(store, bot, [gone, failing])
+    rows = remaining(store)
+    assert list(rows) == [failing]
+    assert rows[failing]["attempts"] == 1
+
+
+def test_retries_stop_after_max_attempts(store):
+    failing = snowflake(20)
+    bot = FakeBot(single_errors={failing: http_error(discord.HTTPException, 500)})
+
+    async def scenario():
+        expiry = MessageExpiry(bot, store, FakeRestQueue())
+        expiry.retry({
+            "message_id": failing, "channel_id": CHANNEL_ID, "guild_id": GUILD_ID,
+            "shard_id": 0, "expires_at": 0, "attempts": MAX_ATTEMPTS - 1,
+        }, RuntimeError("test"))
+        await store.flush()
+
+    asyncio.run(scenario())
+    assert remaining(store) == {}
@@ -0,0 +1,54 @@
+import asyncio
+
+import aiohttp
+
+from keep_alive import StatusServer
+
+
+class FakeBot:
+    latency = 0.05
+    guilds = []
+
+    def is_ready(self):
+        return True
+
+    def is_closed(self):
+        return False
+
+
+class FakeDiagnostics:
+    def snapshot(self, memory=False):
+        return {"memory": memory}
+
+
+def get_statuses(token, requests):
+    async def scenario():
+        server = StatusServer(FakeBot(), host='127.0.0.1', port=0, diagnostics=FakeDiagnostics(),
+                              diagnostics_token=token)
+        await server.start()
+        port = server.runner.addresses[0][1]
+        statuses = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for path, headers in requests:
+                    async with session.get(f"http://127.0.0.1:{port}{path}", headers=headers) as response:
+                        statuses.append(response.status)
+        finally:
+            await server.stop()
+        return statuses
+
+    return asyncio.run(scenario())
+
+
+def test_diagnostics_hidden_without_token():
+    assert get_statuses("", [("/diagnostics", {}), ("/ping", {})]) == [404, 200]
+
+
+def test_diagnostics_requires_token():
+    statuses = get_statuses("secret", [
+        ("/diagnostics", {}),
+        ("/diagnostics?token=wrong", {}),
+        ("/diagnostics?token=secret", {}),
+        ("/diagnostics?memory=1", {"X-Diagnostics-Token": "secret"}),
+    ])
+    assert statuses == [404, 404, 200, 200]
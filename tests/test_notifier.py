@@ -0,0 +1,124 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+
+from notifier import DMNotifier
+from scheduler import Scheduler
+
+
+def http_error(kind, status):
+    return kind(SimpleNamespace(status=status, reason="test"), "test")
+
+
+class FakeUsers:
+    async def resolve(self, user_id):
+        return SimpleNamespace(id=user_id)
+
+
+class FakeStore:
+    def __init__(self, rows=()):
+        self.rows = {row["user_id"]: row for row in rows}
+
+    def load(self, table):
+        return list(self.rows.values())
+
+    def put(self, table, key, row):
+        self.rows[key] = row
+
+    def delete(self, table, key):
+        self.rows.pop(key, None)
+
+
+class Mailbox:
+    """send_dm с заранее заданными ошибками по попыткам: {user_id: [ошибка или None, ...]}"""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+        self.attempts = {}
+
+    async def send_dm(self, user, content, guild_id=None, view=None):
+        attempt = self.attempts.get(user.id, 0)
+        self.attempts[user.id] = attempt + 1
+        errors = self.failures.get(user.id, ())
+        if attempt < len(errors) and errors[attempt] is not None:
+            raise errors[attempt]
+        self.sent.append((user.id, content, view))
+
+
+def run(mailbox, steps, store=None, **options):
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.start()
+        notifier = DMNotifier(FakeUsers(), mailbox.send_dm, store or FakeStore(), scheduler,
+                              retry_delay=0.01, **options)
+        notifier.start()
+        try:
+            result = steps(notifier)
+            await asyncio.sleep(0.1)
+            await notifier.queue.join()
+            return notifier, result
+        finally:
+            notifier.stop()
+            scheduler.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_messages_are_sent_with_cleanup_view():
+    mailbox = Mailbox()
+    _, queued = run(mailbox, lambda notifier: (
+        notifier.notify_many([1, 2], "старт", guild_id=9) + notifier.notify(3, "тихо", with_cleanup=False)
+    ), view_factory=lambda: "view")
+    assert queued == 3
+    assert sorted(mailbox.sent) == [(1, "старт", "view"), (2, "старт", "view"), (3, "тихо", None)]
+
+
+def test_closed_dms_are_remembered_and_skipped():
+    mailbox = Mailbox({1: [http_error(discord.Forbidden, 403)]})
+    store = FakeStore()
+    notifier, _ = run(mailbox, lambda notifier: notifier.notify(1, "старт"), store=store)
+    assert mailbox.sent == []
+    assert 1 in store.rows
+    assert notifier.notify(1, "еще раз") is False
+    assert notifier.pending() == 0
+
+
+def test_closed_dms_are_rechecked_after_expiry():
+    store = FakeStore([{"user_id": 1, "noted_at": time.time() - 100}, {"user_id": 2, "noted_at": time.time()}])
+    notifier = DMNotifier(FakeUsers(), Mailbox().send_dm, store, Scheduler(), closed_recheck=50)
+    notifier.load()
+    assert set(notifier.closed) == {2}
+    assert set(store.rows) == {2}
+    assert not notifier.dm_closed(1)
+    assert notifier.dm_closed(2)
+
+
+def test_server_errors_are_retried_with_backoff():
+    mailbox = Mailbox({1: [http_error(discord.HTTPException, 500), http_error(discord.HTTPException, 429)]})
+    run(mailbox, lambda notifier: notifier.notify(1, "старт"))
+    assert mailbox.attempts == {1: 3}
+    assert mailbox.sent == [(1, "старт", None)]
+
+
+def test_retries_stop_after_max_attempts():
+    mailbox = Mailbox({1: [http_error(discord.HTTPException, 503)] * 5})
+    run(mailbox, lambda notifier: notifier.notify(1, "старт"), max_attempts=2)
+    assert mailbox.attempts == {1: 2}
+    assert mailbox.sent == []
+
+
+def test_client_errors_are_not_retried():
+    mailbox = Mailbox({1: [http_error(discord.HTTPException, 400)]})
+    run(mailbox, lambda notifier: notifier.notify(1, "старт"))
+    assert mailbox.attempts == {1: 1}
+
+
+def test_full_queue_drops_notifications():
+    async def scenario():
+        notifier = DMNotifier(FakeUsers(), Mailbox().send_dm, FakeStore(), Scheduler(), queue_size=2)
+        return [notifier.notify(user_id, "старт") for user_id in range(3)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
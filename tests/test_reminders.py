@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from reminders import ReminderAggregator, ReminderBoard, ReminderEntry
+from roster import CONTENT_LIMIT
+from scheduler import Scheduler
+
+WINDOW = 0.02
+GUILD_ID = 500000000000000005
+
+
+class FakeRestQueue:
+    async def submit(self, factory, *, route, priority, guild_id=None):
+        return await factory()
+
+
+class FakeBot:
+    def __init__(self):
+        self.log = []
+        self.ids = itertools.count(1)
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        bot = self
+
+        class Channel:
+            async def send(self, content, **kwargs):
+                message_id = next(bot.ids)
+                bot.log.append(("send", channel_id, message_id, content))
+                return SimpleNamespace(id=message_id)
+
+            def get_partial_message(self, message_id):
+                async def edit(content, **kwargs):
+                    bot.log.append(("edit", channel_id, message_id, content))
+
+                async def delete():
+                    bot.log.append(("delete", channel_id, message_id, None))
+
+                return SimpleNamespace(edit=edit, delete=delete)
+
+        return Channel()
+
+
+def run(steps):
+    """steps(aggregator, settle) — сценарий; возвращает журнал запросов"""
+    bot = FakeBot()
+
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.start()
+        aggregator = ReminderAggregator(bot, scheduler, FakeRestQueue(), window=WINDOW)
+
+        async def settle():
+            await asyncio.sleep(WINDOW * 4)
+
+        try:
+            await steps(aggregator, settle)
+        finally:
+            scheduler.stop()
+
+    asyncio.run(scenario())
+    return [entry[:3] for entry in bot.log], bot.log
+
+
+def add(aggregator, channel_id, contract_id, creator, minutes_left=5):
+    aggregator.add(channel_id, GUILD_ID, contract_id, creator, time.time() + minutes_left * 60, minutes_left)
+
+
+def test_reminders_in_window_share_one_message():
+    async def steps(aggregator, settle):
+        add(aggregator, 10, "c1", 111)
+        add(aggregator, 10, "c2", 222)
+        await settle()
+        aggregator.remove("c1")
+        await settle()
+        aggregator.remove("c2")
+        await settle()
+
+    actions, log = run(steps)
+    assert actions == [("send", 10, 1), ("edit", 10, 1), ("delete", 10, 1)]
+    assert "<@111>" in log[0][3] and "<@222>" in log[0][3]
+    assert "<@111>" not in log[1][3]
+
+
+def test_removed_before_send_makes_no_request():
+    async def steps(aggregator, settle):
+        add(aggregator, 10, "c1", 111)
+        aggregator.remove("c1")
+        await settle()
+
+    assert run(steps)[0] == []
+
+
+def test_channels_get_separate_messages():
+    async def steps(aggregator, settle):
+        add(aggregator, 10, "c1", 111)
+        add(aggregator, 20, "c2", 222)
+        await settle()
+
+    actions, _ = run(steps)
+    assert sorted(action[:2] for action in actions) == [("send", 10), ("send", 20)]
+
+
+def test_later_reminder_moves_contract_to_new_message():
+    async def steps(aggregator, settle):
+        add(aggregator, 10, "c1", 111)
+        add(aggregator, 10, "c2", 222)
+        await settle()
+        # Окно первой сводки прошло: напоминание за 2 минуты уходит новым сообщением
+        add(aggregator, 10, "c1", 111, minutes_left=2)
+        await settle()
+
+    actions, log = run(steps)
+    assert actions[0] == ("send", 10, 1)
+    assert sorted(actions[1:]) == [("edit", 10, 1), ("send", 10, 2)]
+    edit = next(entry for entry in log if entry[0] == "edit")
+    assert "<@111>" not in edit[3]
+    fresh = next(entry for entry in log if entry[:3] == ("send", 10, 2))
+    assert fresh[3].startswith("🔥 **ПОСЛЕДНИЕ 2 МИНУТЫ")
+
+
+def test_board_text_fits_content_limit():
+    board = ReminderBoard(1, 10, GUILD_ID)
+    for index in range(200):
+        board.entries[f"c{index}"] = ReminderEntry(100000000000000000 + index, time.time() + 300 + index, 5)
+    text = board.text()
+    assert len(text) <= CONTENT_LIMIT
+    assert "…и ещё" in text
+    assert text.endswith("🔥 **Не упусти контракт!**")
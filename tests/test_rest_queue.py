@@ -0,0 +1,195 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rest_queue import (
+    PRIORITY_INTERACTION, PRIORITY_NOTIFY, RestQueue, normalize_route, route_template, send_route
+)
+
+CHANNEL_ID = 100000000000000001
+ROUTE = send_route(CHANNEL_ID)
+PATH = f"/api/v10/channels/{CHANNEL_ID}/messages"
+
+
+def request_end(path=PATH, method="POST", status=200, **headers):
+    """Параметры on_request_end из aiohttp TraceConfig"""
+    return SimpleNamespace(
+        method=method, url=SimpleNamespace(path=path),
+        response=SimpleNamespace(status=status, headers=headers),
+    )
+
+
+def rate_headers(remaining, reset_after, limit=5):
+    return {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset-After": str(reset_after),
+    }
+
+
+def run(scenario):
+    async def wrapper():
+        queue = RestQueue(concurrency=4)
+        try:
+            return await scenario(queue)
+        finally:
+            queue.stop()
+
+    return asyncio.run(wrapper())
+
+
+def test_routes():
+    assert normalize_route("DELETE", f"/api/v10/channels/{CHANNEL_ID}/messages/200000000000000002") == \
+        f"DELETE /channels/{CHANNEL_ID}/messages/{{id}}"
+    assert normalize_route("POST", PATH) == ROUTE
+    assert route_template(ROUTE) == "POST /channels/{channel_id}/messages"
+    assert route_template("POST /webhooks/300000000000000003/aW50ZXJhY3Rpb24") == \
+        "POST /webhooks/{webhook_id}/{token}"
+    assert route_template("PATCH /webhooks/300000000000000003/aW50ZXJhY3Rpb24/messages/@original") == \
+        "PATCH /webhooks/{webhook_id}/{token}/messages/@original"
+    assert route_template("POST /interactions/{id}/aW50ZXJhY3Rpb24/callback") == \
+        "POST /interactions/{id}/{token}/callback"
+
+
+def test_priority_then_round_robin_between_guilds():
+    async def scenario(queue):
+        queue.concurrency = 1
+        order = []
+
+        async def request(name):
+            order.append(name)
+
+        futures = [
+            queue.submit_nowait(lambda name=name: request(name), route=f"POST /route/{name}",
+                                priority=priority, guild_id=guild_id)
+            for name, priority, guild_id in (
+                ("a1", PRIORITY_NOTIFY, 1), ("a2", PRIORITY_NOTIFY, 1), ("a3", PRIORITY_NOTIFY, 1),
+                ("b1", PRIORITY_NOTIFY, 2), ("reply", PRIORITY_INTERACTION, 1),
+            )
+        ]
+        queue.start()
+        await asyncio.wait_for(asyncio.gather(*futures), 1)
+        return order
+
+    assert run(scenario) == ["reply", "a1", "b1", "a2", "a3"]
+
+
+def test_unknown_limit_sends_one_probe():
+    async def scenario(queue):
+        queue.start()
+        started = []
+        gate = asyncio.Event()
+
+        async def request(index):
+            started.append(index)
+            await gate.wait()
+            await queue.on_request_end(None, None, request_end(**rate_headers(5, 10)))
+            return index
+
+        futures = [queue.submit_nowait(lambda index=index: request(index), route=ROUTE,
+                                       priority=PRIORITY_NOTIFY) for index in range(3)]
+        await asyncio.sleep(0.05)
+        probe = list(started)
+        gate.set()
+        return probe, await asyncio.wait_for(asyncio.gather(*futures), 1)
+
+    probe, results = run(scenario)
+    assert probe == [0]
+    assert results == [0, 1, 2]
+
+
+def test_exhausted_bucket_waits_for_reset():
+    async def scenario(queue):
+        queue.start()
+        started = []
+
+        async def request():
+            started.append(time.monotonic())
+            await queue.on_request_end(None, None, request_end(**rate_headers(0, 0.2)))
+
+        await asyncio.wait_for(asyncio.gather(*[
+            queue.submit_nowait(request, route=ROUTE, priority=PRIORITY_NOTIFY) for _ in range(2)
+        ]), 2)
+        return started
+
+    first, second = run(scenario)
+    assert second - first >= 0.18
+
+
+def test_headers_account_for_requests_in_flight():
+    async def scenario(queue):
+        bucket = queue.bucket(ROUTE)
+        bucket.limit = bucket.remaining = 3
+        bucket.reset_at = time.monotonic() + 10
+        queue.start()
+        gate = asyncio.Event()
+        started = []
+
+        async def request():
+            started.append(True)
+            await gate.wait()
+
+        futures = [queue.submit_nowait(request, route=ROUTE, priority=PRIORITY_NOTIFY) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        in_flight = (len(started), bucket.inflight, bucket.remaining)
+        # Сервер увидел только первый из трех запросов в полете
+        await queue.on_request_end(None, None, request_end(**rate_headers(2, 10, limit=3)))
+        after_headers = bucket.remaining
+        for future in futures[3:]:
+            future.cancel()
+        gate.set()
+        await asyncio.sleep(0.05)
+        return in_flight, after_headers
+
+    in_flight, after_headers = run(scenario)
+    assert in_flight == (3, 3, 0)
+    assert after_headers == 0
+
+
+def test_global_rate_limit_pauses_every_route():
+    async def scenario(queue):
+        queue.start()
+        started = []
+
+        async def limited():
+            started.append(time.monotonic())
+            await queue.on_request_end(None, None, request_end(
+                status=429, **{"Retry-After": "0.2", "X-RateLimit-Global": "true"}
+            ))
+
+        async def other():
+            started.append(time.monotonic())
+
+        await queue.submit(limited, route=ROUTE, priority=PRIORITY_NOTIFY)
+        await asyncio.wait_for(queue.submit(other, route="POST /other", priority=PRIORITY_INTERACTION), 2)
+        return started, queue.limited
+
+    (first, second), limited = run(scenario)
+    assert second - first >= 0.18
+    assert limited == {"POST /channels/{channel_id}/messages": 1}
+
+
+def test_failure_is_raised_to_submitter():
+    async def scenario(queue):
+        queue.start()
+
+        async def request():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await queue.submit(request, route=ROUTE, priority=PRIORITY_NOTIFY)
+        return queue.active
+
+    assert run(scenario) == 0
+
+
+def test_prune_drops_only_idle_buckets():
+    queue = RestQueue()
+    now = time.monotonic()
+    queue.bucket("POST /idle").reset_at = now - 1
+    queue.bucket("POST /waiting").reset_at = now + 10
+    queue.bucket("POST /busy").inflight = 1
+    queue.prune(now)
+    assert set(queue.buckets) == {"POST /waiting", "POST /busy"}
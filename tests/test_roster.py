@@ -0,0 +1,78 @@
+import discord
+
+from roster import (
+    BLANK_NAME, EMBED_FIELD_LIMIT, EMBED_TOTAL_LIMIT, FIELD_VALUE_LIMIT, RosterRenderer, overflow_line
+)
+
+BASE_ID = 100000000000000000
+
+
+def renderer(count):
+    roster = RosterRenderer()
+    roster.sync([BASE_ID + index for index in range(count)])
+    return roster
+
+
+def shown_mentions(fields):
+    return sum(value.count("<@") for _, value in fields)
+
+
+def test_fields_fit_value_limit():
+    roster = renderer(200)
+    fields = roster.fields()
+    assert all(len(value) <= FIELD_VALUE_LIMIT for _, value in fields)
+    assert fields[0][0] == "✅ Записалось (200):"
+    assert all(name == BLANK_NAME for name, _ in fields[1:])
+    assert shown_mentions(fields) == 200
+
+
+def test_fields_overflow_line_accounts_for_everyone():
+    roster = renderer(10000)
+    fields = roster.fields()
+    assert len(fields) <= EMBED_FIELD_LIMIT
+    assert sum(len(name) + len(value) for name, value in fields) <= EMBED_TOTAL_LIMIT
+    hidden = 10000 - shown_mentions(fields)
+    assert fields[-1][1] == overflow_line(hidden)
+
+
+def test_fields_respect_max_fields():
+    fields = renderer(500).fields(max_fields=2)
+    assert len(fields) == 2
+    assert fields[-1][1] == overflow_line(500 - shown_mentions(fields))
+
+
+def test_sync_appends_only_new_participants():
+    roster = renderer(3)
+    roster.sync([BASE_ID + index for index in range(5)])
+    assert roster.count == 5
+    assert roster.text(FIELD_VALUE_LIMIT).count("<@") == 5
+
+
+def test_embed_fits_limits_and_is_cached():
+    roster = renderer(5000)
+
+    def build():
+        return discord.Embed(title="📋 Контракт", description="Осталось: 9:59")
+
+    embed = roster.embed("9:59", build)
+    assert len(embed) <= EMBED_TOTAL_LIMIT
+    assert len(embed.fields) <= EMBED_FIELD_LIMIT
+    assert all(len(field.value) <= FIELD_VALUE_LIMIT for field in embed.fields)
+    assert roster.embed("9:59", build) is embed
+    assert roster.embed("9:58", build) is not embed
+    roster.sync([BASE_ID + index for index in range(5001)])
+    assert roster.embed("9:58", build).fields[0].name == "✅ Записалось (5001):"
+
+
+def test_empty_embed_has_placeholder():
+    embed = RosterRenderer().embed("10:00", lambda: discord.Embed(title="📋 Контракт"))
+    assert [field.name for field in embed.fields] == ["✅ Участники:"]
+
+
+def test_text_fits_content_limit():
+    roster = renderer(1000)
+    text = roster.text(500)
+    assert len(text) <= 500
+    lines = text.split("\n")
+    assert lines[-1] == overflow_line(1000 - (len(lines) - 1))
+    assert renderer(3).text(500).count("\n") == 2
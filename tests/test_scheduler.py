@@ -0,0 +1,64 @@
+import asyncio
+
+from scheduler import Scheduler
+
+
+def recorder(fired, name):
+    async def callback():
+        fired.append(name)
+    return callback
+
+
+def test_schedule_same_key_replaces_timer():
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.start()
+        fired = []
+        scheduler.schedule(("c1", "deadline"), 0.01, recorder(fired, "old"))
+        scheduler.schedule(("c1", "deadline"), 0.02, recorder(fired, "new"))
+        assert len(scheduler) == 1
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        return fired
+
+    assert asyncio.run(scenario()) == ["new"]
+
+
+def test_cancel_and_reschedule():
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.start()
+        fired = []
+        scheduler.schedule(("c1", "reminder"), 0.01, recorder(fired, "cancelled"))
+        scheduler.schedule(("c2", "reminder"), 0.05, recorder(fired, "moved"))
+        scheduler.schedule(("c3", "reminder"), 0.03, recorder(fired, "kept"))
+        assert scheduler.cancel(("c1", "reminder"))
+        assert not scheduler.cancel(("c1", "reminder"))
+        # Перенос вперед: сработает раньше c3
+        assert scheduler.reschedule(("c2", "reminder"), 0.01)
+        assert not scheduler.reschedule(("missing", "reminder"), 0.01)
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        return fired, scheduler
+
+    fired, scheduler = asyncio.run(scenario())
+    assert fired == ["moved", "kept"]
+    assert len(scheduler) == 0
+    assert scheduler.fired == 2
+
+
+def test_cancel_rebuilds_heap():
+    async def scenario():
+        scheduler = Scheduler()
+        for index in range(200):
+            scheduler.schedule((index, "deadline"), 60, recorder([], index))
+        for index in range(130):
+            scheduler.cancel((index, "deadline"))
+        return scheduler, [key for key, _ in scheduler.pending()]
+
+    scheduler, pending = asyncio.run(scenario())
+    # После 101-й отмены куча перестроена, дальше отмененные снова копятся лениво
+    assert len(scheduler.heap) == 99
+    assert scheduler.cancelled_count == 29
+    assert len(scheduler.heap) == len(scheduler) + scheduler.cancelled_count
+    assert pending == [(index, "deadline") for index in range(130, 200)]
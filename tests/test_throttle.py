@@ -0,0 +1,86 @@
+import pytest
+
+import throttle
+from throttle import Throttle, parse_limit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_parse_limit():
+    assert parse_limit("5/10") == (5.0, 10.0)
+    assert parse_limit("3") == (3.0, 1.0)
+    assert parse_limit("") is None
+    assert parse_limit("0/10") is None
+
+
+def test_refill_is_capped_by_capacity():
+    limiter = Throttle({"user": (2, 10)})
+    bucket = limiter.refill("user", 1, now=0.0)
+    assert bucket.tokens == 2
+    bucket.tokens = 0
+    assert limiter.refill("user", 1, now=5.0).tokens == pytest.approx(1.0)
+    assert limiter.refill("user", 1, now=100.0).tokens == 2
+
+
+def test_admit_refills_over_time(clock):
+    limiter = Throttle({"user": (2, 10)})
+    assert limiter.admit(user_id=1) is None
+    assert limiter.admit(user_id=1) is None
+    assert limiter.admit(user_id=1) == "user"
+    # Другой пользователь считается отдельно
+    assert limiter.admit(user_id=2) is None
+    clock[0] += 5
+    assert limiter.admit(user_id=1) is None
+    assert limiter.admit(user_id=1) == "user"
+
+
+def test_denied_scope_does_not_spend_other_tokens(clock):
+    limiter = Throttle({"user": (2, 10), "guild": (1, 10)})
+    assert limiter.admit(user_id=1, guild_id=7) is None
+    assert limiter.admit(user_id=1, guild_id=7) == "guild"
+    assert limiter.buckets["user"][1].tokens == pytest.approx(1.0)
+    assert limiter.admit(user_id=1, guild_id=8) is None
+
+
+def test_prune_forgets_full_buckets():
+    limiter = Throttle({"user": (2, 10)}, max_keys=10)
+    for key in range(10):
+        bucket = limiter.refill("user", key, now=0.0)
+        if key < 5:
+            bucket.tokens -= 1
+    limiter.refill("user", 10, now=1.0)
+    assert set(limiter.buckets["user"]) == {0, 1, 2, 3, 4, 10}
+
+
+def test_prune_evicts_oldest_when_all_busy():
+    limiter = Throttle({"user": (2, 10)}, max_keys=10)
+    for key in range(10):
+        limiter.refill("user", key, now=0.0).tokens = 0
+    limiter.refill("user", 10, now=1.0)
+    buckets = limiter.buckets["user"]
+    assert len(buckets) == 10
+    assert 0 not in buckets
+    assert 10 in buckets
+
+
+def test_notice_is_shown_once_per_interval(clock):
+    limiter = Throttle({"user": (1, 10)}, notice_interval=10)
+    assert limiter.notice_due(1)
+    assert not limiter.notice_due(1)
+    assert limiter.notice_due(2)
+    clock[0] += 10
+    assert limiter.notice_due(1)
+
+
+def test_notices_are_pruned_at_max_keys(clock):
+    limiter = Throttle({"user": (1, 10)}, max_keys=3, notice_interval=10)
+    for user_id in range(3):
+        limiter.notice_due(user_id)
+    clock[0] += 10
+    limiter.notice_due(3)
+    assert set(limiter.noticed) == {3}
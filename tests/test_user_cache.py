@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import user_cache
+from user_cache import UserResolver
+
+
+class FakeBot:
+    def __init__(self, gateway=(), missing=(), delay=0.01):
+        self.gateway = {user_id: SimpleNamespace(id=user_id) for user_id in gateway}
+        self.missing = set(missing)
+        self.delay = delay
+        self.fetched = []
+        self.active = 0
+        self.peak = 0
+
+    def get_user(self, user_id):
+        return self.gateway.get(user_id)
+
+    async def fetch_user(self, user_id):
+        self.fetched.append(user_id)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if user_id in self.missing:
+                raise LookupError(user_id)
+            return SimpleNamespace(id=user_id)
+        finally:
+            self.active -= 1
+
+
+def test_gateway_then_cache_then_api():
+    bot = FakeBot(gateway=[1])
+
+    async def scenario():
+        resolver = UserResolver(bot)
+        await resolver.resolve(1)
+        await resolver.resolve(2)
+        await resolver.resolve(2)
+        return resolver
+
+    resolver = asyncio.run(scenario())
+    assert bot.fetched == [2]
+    assert resolver.stats == {"gateway_hits": 1, "cache_hits": 1, "misses": 1, "errors": 0}
+
+
+def test_concurrent_lookups_share_one_request():
+    bot = FakeBot()
+
+    async def scenario():
+        resolver = UserResolver(bot)
+        users = await asyncio.gather(*(resolver.resolve(7) for _ in range(5)))
+        return resolver, users
+
+    resolver, users = asyncio.run(scenario())
+    assert bot.fetched == [7]
+    assert all(user is users[0] for user in users)
+    assert resolver.inflight == {}
+
+
+def test_resolve_many_limits_concurrency_and_skips_failures():
+    bot = FakeBot(missing=[3])
+
+    async def scenario():
+        resolver = UserResolver(bot, concurrency=2)
+        return resolver, await resolver.resolve_many([1, 2, 3, 4, 5, 1])
+
+    resolver, resolved = asyncio.run(scenario())
+    assert list(resolved) == [1, 2, 3, 4, 5]
+    assert resolved[3] is None
+    assert all(resolved[user_id].id == user_id for user_id in (1, 2, 4, 5))
+    assert bot.peak == 2
+    assert resolver.stats["errors"] == 1
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now[0])
+    resolver = UserResolver(FakeBot(), max_size=2, ttl=10)
+    for user_id in (1, 2):
+        resolver.remember(SimpleNamespace(id=user_id))
+    assert resolver.cached(1) is not None  # 1 становится самым свежим
+    resolver.remember(SimpleNamespace(id=3))
+    assert list(resolver.cache) == [1, 3]
+    now[0] += 11
+    assert resolver.cached(1) is None
+    assert 1 not in resolver.cache
@@ -0,0 +1,117 @@
+"""
+Контроль допуска перед командами и кнопками: корзины токенов на
+пользователя, канал и гильдию. Действие сверх лимита не доходит до
+обработчика: вместо него бот отвечает одним дешевым подтверждением, а
+каждое решение считается в метрике throttle_decisions_total.
+"""
+
+import itertools
+import time
+
+import metrics
+
+SCOPES = ("user", "channel", "guild")
+
+decisions = metrics.registry.counter(
+    "throttle_decisions_total", "Решения ограничителя: allowed или область, по которой отказано", "decision"
+)
+
+
+def parse_limit(value):
+    """'5/10' -> 5 действий за 10 секунд; пусто или 0 — без ограничения"""
+    if not value:
+        return None
+    burst, _, seconds = value.partition("/")
+    burst = float(burst)
+    if burst <= 0:
+        return None
+    return burst, float(seconds or 1)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+
+class Throttle:
+    def __init__(self, limits, max_keys=10000, notice_interval=10):
+        """limits: {область: (burst, seconds) или None}"""
+        # область -> (емкость, токенов в секунду)
+        self.limits = {
+            scope: (limit[0], limit[0] / limit[1])
+            for scope, limit in limits.items() if limit is not None
+        }
+        self.buckets = {scope: {} for scope in self.limits}
+        # Выше этого числа корзин в области полные корзины выбрасываются
+        self.max_keys = max_keys
+        # Пользователь -> время последнего предупреждения "слишком часто"
+        self.noticed = {}
+        self.notice_interval = notice_interval
+
+    def refill(self, scope, key, now):
+        capacity, rate = self.limits[scope]
+        bucket = self.buckets[scope].get(key)
+        if bucket is None:
+            if len(self.buckets[scope]) >= self.max_keys:
+                self.prune(scope, now)
+            bucket = self.buckets[scope][key] = TokenBucket(capacity, now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    def prune(self, scope, now):
+        """Полная корзина ничем не отличается от новой — их можно забыть"""
+        capacity, rate = self.limits[scope]
+        buckets = self.buckets[scope]
+        for key in [key for key, bucket in buckets.items()
+                    if bucket.tokens + (now - bucket.updated) * rate >= capacity]:
+            del buckets[key]
+        # Наплыв новых ключей (рейд): вытесняем самые старые с запасом,
+        # чтобы следующий проход по словарю был нескоро
+        target = int(self.max_keys * 0.9)
+        if len(buckets) > target:
+            for key in list(itertools.islice(buckets, len(buckets) - target)):
+                del buckets[key]
+
+    def admit(self, user_id=None, channel_id=None, guild_id=None):
+        """
+        Возвращает None, если действие допущено, иначе область отказа.
+        Токен списывается со всех корзин только при допуске, чтобы отказ по
+        гильдии не съедал лимит пользователя.
+        """
+        now = time.monotonic()
+        keys = {"user": user_id, "channel": channel_id, "guild": guild_id}
+        buckets = []
+        for scope in SCOPES:
+            if scope not in self.limits or keys[scope] is None:
+                continue
+            bucket = self.refill(scope, keys[scope], now)
+            if bucket.tokens < 1:
+                decisions.inc(scope)
+                return scope
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.tokens -= 1
+        decisions.inc("allowed")
+        return None
+
+    def admit_interaction(self, interaction):
+        return self.admit(interaction.user.id, interaction.channel_id, interaction.guild_id)
+
+    def notice_due(self, user_id):
+        """True, если пользователю пора снова показать предупреждение об ограничении"""
+        now = time.monotonic()
+        last = self.noticed.get(user_id)
+        if last is not None and now - last < self.notice_interval:
+            return False
+        if len(self.noticed) >= self.max_keys:
+            self.noticed = {
+                key: moment for key, moment in self.noticed.items()
+                if now - moment < self.notice_interval
+            }
+        self.noticed[user_id] = now
+        return True
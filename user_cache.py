@@ -0,0 +1,101 @@
+"""
+Общий слой получения пользователей Discord: кэш шлюза (get_user),
+затем ограниченный LRU-кэш с TTL и только после этого запрос к API.
+Промахи разрешаются параллельно с ограничением одновременных запросов.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('discord.contract_bot.users')
+
+
+class UserResolver:
+    def __init__(self, bot, max_size=1024, ttl=600.0, concurrency=5):
+        self.bot = bot
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = OrderedDict()  # user_id -> (истекает, пользователь)
+        self.inflight = {}  # user_id -> Future, чтобы не запрашивать одного пользователя дважды
+        self.stats = {"gateway_hits": 0, "cache_hits": 0, "misses": 0, "errors": 0}
+
+    def cached(self, user_id):
+        """Пользователь из кэша шлюза или LRU без запроса к API (None, если нет)"""
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.stats["gateway_hits"] += 1
+            return user
+        entry = self.cache.get(user_id)
+        if entry is not None:
+            expires, user = entry
+            if expires > time.monotonic():
+                self.cache.move_to_end(user_id)
+                self.stats["cache_hits"] += 1
+                return user
+            del self.cache[user_id]
+        return None
+
+    def remember(self, user):
+        self.cache[user.id] = (time.monotonic() + self.ttl, user)
+        self.cache.move_to_end(user.id)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    async def resolve(self, user_id):
+        """Аналог bot.fetch_user с кэшированием; ошибки API пробрасываются"""
+        user = self.cached(user_id)
+        if user is not None:
+            return user
+
+        future = self.inflight.get(user_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[user_id] = future
+        try:
+            async with self.semaphore:
+                user = await self.bot.fetch_user(user_id)
+            self.remember(user)
+            future.set_result(user)
+            return user
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # Исключение уже передано вызывающему, ожидающих может не быть
+            future.exception()
+            raise
+        finally:
+            del self.inflight[user_id]
+
+    async def resolve_many(self, user_ids):
+        """Разрешает пользователей параллельно; {user_id: пользователь или None}"""
+        unique_ids = list(dict.fromkeys(user_ids))
+        results = await asyncio.gather(
+            *(self.resolve(user_id) for user_id in unique_ids),
+            return_exceptions=True
+        )
+        resolved = {}
+        for user_id, result in zip(unique_ids, results):
+            if isinstance(result, Exception):
+                logger.warning("Не удалось получить пользователя %s: %s", user_id, result)
+                result = None
+            resolved[user_id] = result
+        return resolved
+
+    def hit_rate(self):
+        hits = self.stats["gateway_hits"] + self.stats["cache_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def report(self):
+        return (
+            f"кэш пользователей: попаданий {self.hit_rate():.0%} "
+            f"(шлюз {self.stats['gateway_hits']}, LRU {self.stats['cache_hits']}, "
+            f"запросов к API {self.stats['misses']}, ошибок {self.stats['errors']}, "
+            f"в кэше {len(self.cache)})"
+        )